@@ -36,6 +36,9 @@ Our helpful functions
 # TODO: restructure this file with a class and help-function to save a lot of lines of code!
 # TODO: fix index should be same as floorplan folder
 
+floorplan_collections = dict()  # data path -> collection instanced by floorplans
+materials = dict()  # color -> material
+
 
 def read_from_file(file_path):
     """
@@ -125,10 +128,53 @@ def create_custom_mesh(objname, verts, faces, mat=None, cen=None):
     return myobject
 
 
+def create_walls_from_graph(graph):
+    """
+    Create walls from graph
+    Build one box per edge of the wall centerline graph, extended half the
+    thickness past both nodes so walls overlap in junctions and corners
+    @Param graph, nodes, edges, thickness, height and ground of walls
+    @Return verts, faces of all walls
+    """
+    nodes = np.array(graph["nodes"], dtype=float).reshape(-1, 2)
+    verts = []
+    faces = []
+    for (a, b), thickness in zip(graph["edges"], graph["thickness"]):
+        along = nodes[b] - nodes[a]
+        half = along / np.linalg.norm(along) * thickness / 2
+        normal = np.array([-half[1], half[0]])
+        start = nodes[a] - half
+        end = nodes[b] + half
+        corners = [start + normal, end + normal, end - normal, start - normal]
+
+        first = len(verts)
+        for z in (graph["ground"], graph["height"]):
+            verts.extend([[x, y, z] for x, y in corners])
+        for i in range(4):
+            j = (i + 1) % 4
+            faces.append([first + i, first + 4 + i, first + 4 + j, first + j])
+        faces.append([first + 4, first + 5, first + 6, first + 7])
+        faces.append([first, first + 1, first + 2, first + 3])
+    return verts, faces
+
+
 def create_mat(rgb_color):
-    mat = bpy.data.materials.new(name="MaterialName")  # set new material to variable
-    mat.diffuse_color = rgb_color  # change to random color
-    return mat
+    # reuse material of same color, many meshes share the few wall colors
+    key = tuple(float(c) for c in rgb_color)
+    if key not in materials:
+        mat = bpy.data.materials.new(name="MaterialName")
+        mat.diffuse_color = rgb_color
+        materials[key] = mat
+    return materials[key]
+
+
+def move_to_collection(obj, collection):
+    # Move object and all its children to collection
+    for other in list(obj.users_collection):
+        other.objects.unlink(obj)
+    collection.objects.link(obj)
+    for child in obj.children:
+        move_to_collection(child, collection)
 
 
 """
@@ -173,8 +219,6 @@ def create_floorplan(base_path, program_path, name=None):
     if name is None:
         name = 0
 
-    parent, _ = init_object("Floorplan" + str(name))
-
     """
     Get transform data
     """
@@ -194,6 +238,51 @@ def create_floorplan(base_path, program_path, name=None):
     # Where data is stored, if shared between floorplans
     path_to_data = transform["origin_path"]
 
+    """
+    Create instance
+    Floorplans sharing data are instances of the same collection,
+    so geometry and materials of repeated floorplans are only created once.
+    """
+    if path_to_data not in floorplan_collections:
+        floorplan_collections[path_to_data] = create_floorplan_collection(
+            program_path, path_to_data, cen, name
+        )
+
+    parent = bpy.data.objects.new("Floorplan" + str(name), None)
+    parent.instance_type = "COLLECTION"
+    parent.instance_collection = floorplan_collections[path_to_data]
+    bpy.context.collection.objects.link(parent)
+
+    # Perform Floorplan final position, rotation and scale
+    if rot is not None:
+        # compensate for mirrored image
+        parent.rotation_euler = [
+            math.radians(rot[0]) + math.pi,
+            math.radians(rot[1]),
+            math.radians(rot[2]),
+        ]
+
+    if pos is not None:
+        parent.location.x += pos[0]
+        parent.location.y += pos[1]
+        parent.location.z += pos[2]
+
+    if scale is not None:
+        parent.scale.x = scale[0]
+        parent.scale.y = scale[1]
+        parent.scale.z = scale[2]
+
+
+def create_floorplan_collection(program_path, path_to_data, cen, name):
+    """
+    Create floorplan collection
+    Create all meshes of floorplan data in a new collection, used as instance
+    @Param path_to_data, folder of data files
+    @Param cen, shape of floorplan
+    @Return collection
+    """
+    parent, _ = init_object("FloorplanData" + str(name))
+
     # Set Cursor start
     bpy.context.scene.cursor.location = (0, 0, 0)
 
@@ -245,10 +334,42 @@ def create_floorplan(base_path, program_path, name=None):
         program_path + "\\" + path_to_data + "window_horizontal_verts"
     )
 
+    """
+    Create indexed meshes
+    Data generated in indexed mode has one welded mesh per feature,
+    then the separate verts and faces files below don't exist.
+    """
+    indexed_meshes = [
+        ("Walls", "wall_mesh", (0.5, 0.5, 0.5, 1)),
+        ("Windows", "window_mesh", (0.5, 0.5, 0.5, 1)),
+        ("Doors", "door_mesh", (0.5, 0.5, 0.5, 1)),
+        ("Floor", "floor_mesh", (40, 1, 1, 1)),
+        ("Rooms", "room_mesh", None),
+    ]
+    for objname, filename, color in indexed_meshes:
+        path_to_mesh_file = program_path + "/" + path_to_data + filename
+        if os.path.isfile(path_to_mesh_file + ".txt"):
+            mesh = read_from_file(path_to_mesh_file)
+            mat = None if color is None else create_mat(color)
+            obj = create_custom_mesh(
+                objname, mesh["verts"], mesh["faces"], mat=mat, cen=cen
+            )
+            obj.parent = parent
+
     """
     Create Walls
     """
 
+    path_to_wall_graph_file = program_path + "/" + path_to_data + "wall_graph"
+    if os.path.isfile(path_to_wall_graph_file + ".txt"):
+        # walls generated from centerline graph, no wall verts files
+        verts, faces = create_walls_from_graph(read_from_file(path_to_wall_graph_file))
+        if verts:
+            obj = create_custom_mesh(
+                "Walls", verts, faces, cen=cen, mat=create_mat((0.5, 0.5, 0.5, 1))
+            )
+            obj.parent = parent
+
     if (
         os.path.isfile(path_to_wall_vertical_verts_file + ".txt")
         and os.path.isfile(path_to_wall_vertical_faces_file + ".txt")
@@ -456,24 +577,12 @@ def create_floorplan(base_path, program_path, name=None):
 
         room_parent.parent = parent
 
-    # Perform Floorplan final position, rotation and scale
-    if rot is not None:
-        # compensate for mirrored image
-        parent.rotation_euler = [
-            math.radians(rot[0]) + math.pi,
-            math.radians(rot[1]),
-            math.radians(rot[2]),
-        ]
-
-    if pos is not None:
-        parent.location.x += pos[0]
-        parent.location.y += pos[1]
-        parent.location.z += pos[2]
-
-    if scale is not None:
-        parent.scale.x = scale[0]
-        parent.scale.y = scale[1]
-        parent.scale.z = scale[2]
+    collection = bpy.data.collections.new("FloorplanData" + str(name))
+    bpy.context.scene.collection.children.link(collection)
+    move_to_collection(parent, collection)
+    # data collection is only visible through its instances
+    bpy.context.view_layer.layer_collection.children[collection.name].exclude = True
+    return collection
 
 
 if __name__ == "__main__":
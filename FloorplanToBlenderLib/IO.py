@@ -1,4 +1,7 @@
+import base64
+import glob
 import json
+import math
 import os
 from shutil import which
 import shutil
@@ -9,7 +12,10 @@ import numpy as np
 
 from . import const
 from . import image
+from . import metrics
 from . import config
+from . import retention
+from . import transform
 
 """
 IO
@@ -20,11 +26,12 @@ Copyright (C) 2022 Daniel Westberg
 """
 
 
-def find_reuseable_data(image_path, path):
+def find_reuseable_data(image_path, path, lod=const.DEFAULT_LOD):
     """
     Checks if floorplan data already exists and can be reused
     Then return the path to data
     @Param path, path to image
+    @Param lod, level of detail data must be generated with
     @Return path to image data, else return None
     """
     for _, dirs, _ in os.walk(path):
@@ -33,37 +40,96 @@ def find_reuseable_data(image_path, path):
                 with open(path + dir + const.TRANSFORM_PATH) as f:
                     data = f.read()
                 js = json.loads(data)
-                if image_path == js[const.STR_IMAGE_PATH]:
-                    return js[const.STR_ORIGIN_PATH], js[const.STR_SHAPE]
+                if image_path == js[const.STR_IMAGE_PATH] and lod == js.get(
+                    const.STR_LOD, const.DEFAULT_LOD
+                ):
+                    origin_path = js[const.STR_ORIGIN_PATH]
+                    if not os.path.isdir(origin_path):
+                        continue  # origin removed by retention
+                    retention.touch(path + dir)
+                    retention.touch(origin_path)
+                    return origin_path, js[const.STR_SHAPE]
             except IOError:
                 continue
     return None, None
 
 
-def find_files(filename, search_path):
+def find_files(filename, search_path, max_depth=None):
     """
     Find filename in root search path
+    @Param max_depth, folder levels below search path to look in, None is unlimited
     """
-    for root, _, files in os.walk(search_path):
+    search_path = os.path.expanduser(search_path)
+    base_depth = search_path.rstrip(os.sep).count(os.sep)
+    for root, dirs, files in os.walk(search_path):
         if filename in files:
             return os.path.join(root, filename)
+        if max_depth is not None and root.count(os.sep) - base_depth >= max_depth:
+            dirs[:] = []  # don't walk deeper
     return None
 
 
-def blender_installed():
+# Blender installation found earlier in this process
+blender_path = None
+# Folder search found no blender earlier in this process, don't walk again
+blender_search_missed = False
+
+
+def is_executable(path):
+    return bool(path) and os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+def find_known_blender(platform_name):
+    """
+    Find blender in common install locations, newest version first
+    @Return path to blender or None
+    """
+    for pattern in const.BLENDER_KNOWN_PATHS.get(platform_name, []):
+        for path in sorted(glob.glob(pattern), reverse=True):
+            if is_executable(path):
+                return path
+    return None
+
+
+def blender_installed(search=True):
     """
     Find path to blender installation
-    Might be error prune, tested on ubuntu and windows
+    Checked in order: environment variable, earlier result, system config,
+    PATH and known install locations. Only then a few folders are searched.
+    A found path is saved in system config, so later calls are fast.
+    A search without result is remembered for the process, a blender
+    installed later is still found by the checks before the search.
+    @Param search, allow the bounded folder search
+    @Return path to blender or None
     """
-    if pf == "linux" or pf == "linux2":
-        # linux
-        return find_files("blender", "/")
-    elif pf == "darwin":
-        # OS X
-        return find_files("blender", "/")  # TODO: this need to be tested!
-    elif pf == "win32":
-        # Windows
-        return find_files("blender.exe", "C:\\")
+    global blender_path, blender_search_missed
+    path = os.environ.get(const.BLENDER_PATH_ENV)
+    if is_executable(path):
+        return path
+    if is_executable(blender_path):
+        return blender_path
+    path = config.get_default_blender_installation_path()
+    if is_executable(path):
+        blender_path = path
+        return path
+
+    platform_name = "linux" if pf.startswith("linux") else pf
+    filename = {"win32": "blender.exe", "darwin": "Blender"}.get(
+        platform_name, "blender"
+    )
+    path = which("blender") or find_known_blender(platform_name)
+    if path is None and search and not blender_search_missed:
+        for folder in const.BLENDER_SEARCH_PATHS.get(platform_name, []):
+            path = find_files(filename, folder, const.BLENDER_SEARCH_DEPTH)
+            if is_executable(path):
+                break
+            path = None
+        blender_search_missed = path is None
+
+    if path is not None:
+        blender_path = path
+        config.set_default_blender_installation_path(path)
+    return path
 
 
 def get_blender_os_path():
@@ -80,12 +146,36 @@ def get_blender_os_path():
         return const.WIN_DEFAULT_BLENDER_INSTALL_PATH
 
 
+def decode_flag(reduction, color):
+    """
+    Get cv2.imread flag
+    @Param reduction, decode at 1/reduction of full size, 1 or one of const.DECODE_REDUCTIONS
+    @Param color, decode color channels, else straight to grayscale
+    """
+    if reduction == 1:
+        return cv2.IMREAD_COLOR if color else cv2.IMREAD_GRAYSCALE
+    mode = "COLOR_" if color else "GRAYSCALE_"
+    return getattr(cv2, "IMREAD_REDUCED_" + mode + str(reduction))
+
+
+def decode_reduction(scale_factor):
+    """
+    Largest reduced decoding which is still at least as large as the rescaled image
+    @Return reduction, 1 if image can't be decoded reduced
+    """
+    for reduction in const.DECODE_REDUCTIONS:
+        if scale_factor * reduction <= 1:
+            return reduction
+    return 1
+
+
 def read_image(path, floorplan=None):
     """
     Read image, resize/rescale and return with grayscale
     """
     # Read floorplan image
-    img = cv2.imread(path)
+    with metrics.timer(stage="image_read"):
+        img = cv2.imread(path)
     if img is None:
         print(f"ERROR: Image {path} could not be read by OpenCV library.")
         raise IOError
@@ -93,20 +183,21 @@ def read_image(path, floorplan=None):
     scale_factor = 1
     if floorplan is not None:
         if floorplan.remove_noise:
-            img = image.denoising(img)
+            with metrics.timer(stage="denoise"):
+                img = image.denoising(img)
         if floorplan.rescale_image:
-
-            calibrations = config.read_calibration(floorplan)
-            floorplan.wall_size_calibration = calibrations  # Store for debug
-            scale_factor = image.detect_wall_rescale(float(calibrations), img)
-            if scale_factor is None:
-                print(
-                    "WARNING: Auto rescale failed due to non good walls found in image."
-                    + "If rescale still is needed, please rescale manually."
-                )
-                scale_factor = 1
-            else:
-                img = image.cv2_rescale_image(img, scale_factor)
+            with metrics.timer(stage="rescale"):
+                calibrations = config.read_calibration(floorplan)
+                floorplan.wall_size_calibration = calibrations  # Store for debug
+                scale_factor = image.detect_wall_rescale(float(calibrations), img)
+                if scale_factor is None:
+                    print(
+                        "WARNING: Auto rescale failed due to non good walls found in image."
+                        + "If rescale still is needed, please rescale manually."
+                    )
+                    scale_factor = 1
+                else:
+                    img = image.cv2_rescale_image(img, scale_factor)
 
     return img, cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), scale_factor
 
@@ -144,6 +235,210 @@ def save_to_file(file_path, data, show=True):
         print("Created file : " + file_path + const.SAVE_DATA_FORMAT)
 
 
+def save_to_obj(file_path, meshes, show=True):
+    """
+    Save to obj
+    Export indexed meshes directly as Wavefront obj file, without blender.
+    @Param file_path, path to outputfile
+    @Param meshes, dict of name -> (verts, faces), faces as lists of 0 based indices
+    """
+    offset = 1  # obj indices start at 1 and are global over all objects
+    with open(file_path, "w") as f:
+        for name, (verts, faces) in meshes.items():
+            f.write("o " + name + "\n")
+            f.writelines("v %r %r %r\n" % tuple(vert) for vert in verts.tolist())
+            f.writelines(
+                "f " + " ".join(str(index + offset) for index in face) + "\n"
+                for face in faces
+            )
+            offset += len(verts)
+
+    if show:
+        print("Created file : " + file_path)
+
+
+def save_to_gltf(file_path, meshes, nodes, show=True):
+    """
+    Save to gltf
+    Export indexed meshes directly as glTF file, without blender.
+    Each mesh is stored once, every node using it is an instance.
+    @Param file_path, path to outputfile
+    @Param meshes, list of dicts of name -> (verts, faces), faces as lists of 0 based indices
+    @Param nodes, list of (name, mesh index, translation, rotation, scale),
+    rotation as quaternion x, y, z, w
+    """
+    data = bytearray()
+    buffer_views = []
+    accessors = []
+
+    def add_accessor(array, target, accessor):
+        buffer_views.append(
+            {
+                "buffer": 0,
+                "byteOffset": len(data),
+                "byteLength": array.nbytes,
+                "target": target,
+            }
+        )
+        data.extend(array.tobytes())
+        accessor.update(bufferView=len(buffer_views) - 1, count=len(array))
+        accessors.append(accessor)
+        return len(accessors) - 1
+
+    gltf_meshes = []
+    mesh_indices = []
+    for parts in meshes:
+        primitives = []
+        for verts, faces in parts.values():
+            verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+            indices = np.array(
+                [
+                    index
+                    for face in faces
+                    for triangle in transform.triangulate(verts, face)
+                    for index in triangle
+                ],
+                dtype=np.uint32,
+            )
+            if len(indices) == 0:
+                continue
+            position = add_accessor(
+                verts,
+                34962,  # ARRAY_BUFFER
+                {
+                    "componentType": 5126,  # FLOAT
+                    "type": "VEC3",
+                    "min": verts.min(axis=0).tolist(),
+                    "max": verts.max(axis=0).tolist(),
+                },
+            )
+            indices_accessor = add_accessor(
+                indices,
+                34963,  # ELEMENT_ARRAY_BUFFER
+                {"componentType": 5125, "type": "SCALAR"},  # UNSIGNED_INT
+            )
+            primitives.append(
+                {"attributes": {"POSITION": position}, "indices": indices_accessor}
+            )
+
+        # glTF meshes need primitives, nodes of empty meshes have none
+        if primitives:
+            mesh_indices.append(len(gltf_meshes))
+            gltf_meshes.append({"primitives": primitives})
+        else:
+            mesh_indices.append(None)
+
+    gltf_nodes = [
+        # data is z up, glTF is y up
+        {
+            "name": "Floorplans",
+            "rotation": [-math.sqrt(0.5), 0.0, 0.0, math.sqrt(0.5)],
+            "children": list(range(1, len(nodes) + 1)),
+        }
+    ]
+    for name, mesh, translation, rotation, scale in nodes:
+        node = {
+            "name": name,
+            "translation": [float(v) for v in translation],
+            "rotation": [float(v) for v in rotation],
+            "scale": [float(v) for v in scale],
+        }
+        if mesh_indices[mesh] is not None:
+            node["mesh"] = mesh_indices[mesh]
+        gltf_nodes.append(node)
+
+    gltf = {
+        "asset": {"version": "2.0", "generator": "FloorplanToBlender3d"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": gltf_nodes,
+        "meshes": gltf_meshes,
+        "accessors": accessors,
+        "bufferViews": buffer_views,
+        "buffers": [
+            {
+                "byteLength": len(data),
+                "uri": "data:application/octet-stream;base64,"
+                + base64.b64encode(bytes(data)).decode("ascii"),
+            }
+        ],
+    }
+    # empty lists aren't valid glTF
+    gltf = {key: value for key, value in gltf.items() if value != []}
+    with open(file_path, "w") as f:
+        json.dump(gltf, f)
+
+    if show:
+        print("Created file : " + file_path)
+
+
+def is_indexed_data(data_path):
+    """
+    Check if floorplan data was generated in indexed mode
+    @Param data_path, data folder with transform file
+    @Return True if data, or data it shares, has indexed meshes
+    """
+    origin_path = read_from_file(data_path + "transform")[const.STR_ORIGIN_PATH]
+    return any(
+        os.path.isfile(origin_path + name + const.SAVE_DATA_FORMAT)
+        for name in const.INDEXED_MESHES
+    )
+
+
+def exports_directly(data_paths, outformat):
+    """
+    Check if objects are created without blender, see export_gltf
+    @Return True if outformat is DIRECT_FORMAT and all data is indexed
+    """
+    return outformat == const.DIRECT_FORMAT and all(
+        is_indexed_data(path) for path in data_paths
+    )
+
+
+def export_gltf(file_path, data_paths, show=True):
+    """
+    Export gltf
+    Export floorplans generated in indexed mode as one glTF file, without blender.
+    Floorplans with the same origin_path share one mesh, like the collection
+    instances created in blender.
+    @Param file_path, path to outputfile
+    @Param data_paths, list of data folders
+    """
+    meshes = []
+    origins = dict()  # origin path -> mesh index
+    nodes = []
+    for index, data_path in enumerate(data_paths):
+        transform_data = read_from_file(data_path + "transform")
+        origin_path = transform_data[const.STR_ORIGIN_PATH]
+
+        if origin_path not in origins:
+            # center on shape, as create_custom_mesh in blender
+            shape = transform_data[const.STR_SHAPE]
+            center = np.array([int(shape[0] / 2), int(shape[1] / 2), int(shape[2])])
+            parts = dict()
+            for name in const.INDEXED_MESHES:
+                if os.path.isfile(origin_path + name + const.SAVE_DATA_FORMAT):
+                    mesh = read_from_file(origin_path + name)
+                    verts = np.asarray(mesh["verts"], dtype=float).reshape(-1, 3)
+                    parts[name] = (verts - center, mesh["faces"])
+            origins[origin_path] = len(meshes)
+            meshes.append(parts)
+
+        rotation = np.radians(transform_data[const.STR_ROTATION])
+        rotation[0] += math.pi  # compensate for mirrored image
+        nodes.append(
+            (
+                "Floorplan" + str(index),
+                origins[origin_path],
+                transform_data[const.STR_POSITION],
+                transform.euler_to_quaternion(rotation),
+                transform_data["scale"],
+            )
+        )
+
+    save_to_gltf(file_path, meshes, nodes, show)
+
+
 def read_from_file(file_path):
     """
     Read from file
@@ -170,6 +465,17 @@ def clean_data_folder(folder):
             shutil.rmtree(os.path.join(root, d))
 
 
+def move_data(source, target):
+    """
+    Move all data files of folder source into folder target
+    @Param source, path to data folder
+    @Param target, path to data folder
+    """
+    os.makedirs(target, exist_ok=True)
+    for name in os.listdir(source):
+        shutil.move(os.path.join(source, name), os.path.join(target, name))
+
+
 def create_new_floorplan_path(path):
     """
     Creates next free name to floorplan data
@@ -14,6 +14,12 @@ IO...
 transform...
 dialog...
 execution...
+metrics...
+batch...
+daemon...
+cache...
+sweep...
+retention...
 
 """
 
@@ -32,4 +38,25 @@ __all__ = [
     "config",
     "stacking",
     "floorplan",
+    "metrics",
+    "geometry",
+    "batch",
+    "daemon",
+    "cache",
+    "sweep",
+    "retention",
 ]
+
+# Submodules are imported on first use, so importing only detection code
+# doesn't load plotting, dialog or execution dependencies
+import importlib
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
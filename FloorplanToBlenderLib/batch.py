@@ -0,0 +1,305 @@
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from subprocess import check_output
+
+from . import IO
+from . import const
+from . import floorplan
+from . import generate
+from . import retention
+
+"""
+Batch
+This file contains functions for converting many floorplans without interaction.
+Detection runs in a process pool, the blender stage in a separate smaller pool.
+Progress of each image is written to a manifest, so an interrupted batch can be resumed.
+
+FloorplanToBlender3d
+Copyright (C) 2022 Daniel Westberg
+"""
+
+# Manifest status of an image
+PENDING = "pending"
+DETECTED = "detected"
+DONE = "done"
+FAILED = "failed"
+
+
+def find_images(inputs):
+    """
+    Find images
+    @Param inputs, list of image paths, folders or glob patterns
+    @Return sorted list of unique image paths
+    """
+    res = set()
+    for entry in inputs:
+        if os.path.isdir(entry):
+            paths = [os.path.join(entry, name) for name in os.listdir(entry)]
+        else:
+            paths = glob.glob(entry)
+        for path in paths:
+            if os.path.isfile(path) and path.lower().endswith(const.IMAGE_EXTENSIONS):
+                res.add(os.path.normpath(path))
+    return sorted(res)
+
+
+def image_name(image_path):
+    """
+    Unique file friendly name of image, used for its data folder and target
+    """
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    digest = hashlib.sha1(
+        bytes(os.path.abspath(image_path), encoding="utf-8")
+    ).hexdigest()
+    return stem + "_" + digest[:8]
+
+
+class Manifest:
+    """
+    Status, paths and stage timings of each image in a batch, stored as json
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = dict()  # image path -> entry
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+
+    def entry(self, image_path):
+        if image_path not in self.entries:
+            self.entries[image_path] = {
+                "status": PENDING,
+                "data_path": None,
+                "object": None,
+                "error": None,
+                "timings": {},
+            }
+        return self.entries[image_path]
+
+    def update(self, image_path, **values):
+        """Update entry of image and save manifest"""
+        self.entry(image_path).update(values)
+        self.save()
+
+    def status(self, image_path):
+        return self.entry(image_path)["status"]
+
+    def save(self):
+        """Save atomically, a crash never leaves a half written manifest"""
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def summary(self):
+        """
+        @Return dict of status -> amount of images
+        """
+        res = dict()
+        for entry in self.entries.values():
+            res[entry["status"]] = res.get(entry["status"], 0) + 1
+        return res
+
+
+def detect_image(image_path, config_path, base_path):
+    """
+    Generate data of one image, run in worker process
+    @Param base_path, data folder only used by this image
+    @Return path to data, seconds spent
+    """
+    start = time.perf_counter()
+    # remove data of an interrupted earlier attempt
+    IO.clean_data_folder(base_path)
+    f = floorplan.new_floorplan(config_path)
+    f.image_path = image_path
+    path, _ = generate.generate_all_files(f, False, base_path=base_path)
+    return path, time.perf_counter() - start
+
+
+def create_blender_project(
+    blender_install_path,
+    program_path,
+    data_paths,
+    target_base,
+    outformat=const.BASE_FORMAT,
+    blender_script_path=const.BLENDER_SCRIPT_PATH,
+):
+    """
+    Create blender project of data and convert it to outformat
+    @Param program_path, folder data and target paths are relative to
+    @Param data_paths, list of paths to floorplan data
+    @Param target_base, target path without format, such as /Target/floorplan
+    @Return path to created object, relative to program_path
+    Indexed data is exported as glTF without blender, see IO.exports_directly.
+    """
+    if IO.exports_directly(data_paths, outformat):
+        IO.export_gltf("." + target_base + outformat, data_paths, False)
+        return target_base + outformat
+
+    target_path = target_base + const.BASE_FORMAT
+    check_output(
+        [
+            blender_install_path,
+            "-noaudio",  # this is a dockerfile ubuntu hax fix
+            "--background",
+            "--python",
+            blender_script_path,
+            program_path,  # Send this as parameter to script
+            target_path,
+        ]
+        + data_paths
+    )
+
+    # Transform .blend project to another format!
+    if outformat != const.BASE_FORMAT:
+        check_output(
+            [
+                blender_install_path,
+                "-noaudio",  # this is a dockerfile ubuntu hax fix
+                "--background",
+                "--python",
+                "./Blender/blender_export_any.py",
+                "." + target_path,
+                outformat,
+                target_base + outformat,
+            ]
+        )
+    return target_base + outformat
+
+
+def run(
+    images,
+    config_path=None,
+    manifest_path=const.BATCH_MANIFEST,
+    workers=None,
+    blender_workers=1,
+    blender_install_path=None,
+    program_path=None,
+    outformat=const.BASE_FORMAT,
+    base_path=const.BATCH_DATA_PATH,
+    target_folder=const.TARGET_PATH,
+):
+    """
+    Convert images in batch
+    Images already done in manifest are skipped, detected images only run blender.
+    @Param images, list of image paths, see find_images
+    @Param config_path, floorplan config used for all images
+    @Param workers, detection processes, defaults to one per cpu
+    @Param blender_workers, blender processes running at once
+    @Param blender_install_path, skip blender stage if None,
+    unless objects are exported directly, see IO.exports_directly
+    @Return manifest
+    """
+    if config_path is None:
+        config_path = const.IMAGE_DEFAULT_CONFIG_FILE_NAME
+    if program_path is None:
+        program_path = os.getcwd()
+
+    manifest = Manifest(manifest_path)
+    for image_path in images:
+        manifest.entry(image_path)
+    manifest.save()
+
+    def render(image_path, data_path):
+        start = time.perf_counter()
+        target_base = target_folder + image_name(image_path)
+        created = create_blender_project(
+            blender_install_path, program_path, [data_path], target_base, outformat
+        )
+        return created, time.perf_counter() - start
+
+    def data_folder(image_path):
+        return base_path + image_name(image_path) + "/"
+
+    # data of earlier images is bounded, images not done yet keep theirs
+    held = set(path for path in images if manifest.status(path) != DONE)
+    retention.hold(*(data_folder(path) for path in held))
+
+    def done(image_path):
+        held.discard(image_path)
+        retention.release(data_folder(image_path))
+
+    os.makedirs("." + target_folder, exist_ok=True)
+    keep = retention.Retention([base_path]).start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as detection, ThreadPoolExecutor(
+            max_workers=blender_workers
+        ) as blender:
+            running = dict()  # future -> (stage, image path)
+
+            def submit_blender(image_path):
+                data_path = manifest.entry(image_path)["data_path"]
+                if blender_install_path is None and not IO.exports_directly(
+                    [data_path], outformat
+                ):
+                    manifest.update(image_path, status=DONE)
+                    done(image_path)
+                    return
+                running[blender.submit(render, image_path, data_path)] = (
+                    "blender",
+                    image_path,
+                )
+
+            for image_path in images:
+                status = manifest.status(image_path)
+                if status == DONE:
+                    continue
+                if status == DETECTED and os.path.isdir(
+                    manifest.entry(image_path)["data_path"]
+                ):
+                    submit_blender(image_path)
+                    continue
+                base = data_folder(image_path)
+                future = detection.submit(detect_image, image_path, config_path, base)
+                running[future] = ("detect", image_path)
+
+            while running:
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, image_path = running.pop(future)
+                    timings = dict(manifest.entry(image_path)["timings"])
+                    try:
+                        path, seconds = future.result()
+                    except Exception as e:
+                        manifest.update(
+                            image_path, status=FAILED, error=stage + ": " + repr(e)
+                        )
+                        done(image_path)
+                        continue
+
+                    timings[stage] = seconds
+                    if stage == "detect":
+                        manifest.update(
+                            image_path,
+                            status=DETECTED,
+                            data_path=path,
+                            error=None,
+                            timings=timings,
+                        )
+                        submit_blender(image_path)
+                    else:
+                        manifest.update(
+                            image_path,
+                            status=DONE,
+                            object=path,
+                            error=None,
+                            timings=timings,
+                        )
+                        done(image_path)
+    finally:
+        keep.stop()
+        retention.release(*(data_folder(path) for path in held))
+    return manifest
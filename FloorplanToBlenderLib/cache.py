@@ -0,0 +1,200 @@
+import hashlib
+import os
+import pickle
+import threading
+
+import numpy as np
+
+from . import const
+from . import metrics
+
+"""
+Cache
+This file contains an on disk cache of intermediate stage results, such as
+the decoded image, wall mask, boxes, outer contour, rooms and doors and windows.
+An entry is keyed by the content of the stage input and the const values the stage
+depends on, so changing one threshold only reruns the stages using it.
+Least recently used entries are removed when the cache grows above its size.
+
+FloorplanToBlender3d
+Copyright (C) 2022 Daniel Westberg
+"""
+
+# const name prefixes each stage depends on, inputs are keyed by content
+STAGE_PARAMS = {
+    "read": ("IMAGE_", "DECODE_", "WALL_FILTER_", "PRECISE_BOXES_"),
+    "wall_mask": ("WALL_FILTER_",),
+    "wall_boxes": ("PRECISE_BOXES_",),
+    "wall_graph": ("WALL_GRAPH_",),
+    "outer_contour": ("OUTER_CONTOURS_", "PRECISE_BOXES_"),
+    "rooms": ("FIND_ROOMS_", "PRECISE_"),
+    "doors": ("DETAILS_", "FIND_ROOMS_", "PRECISE_", "WALL_FILTER_", "WINDOWS_"),
+    "windows": ("DETAILS_", "FIND_ROOMS_", "PRECISE_", "WALL_FILTER_", "WINDOWS_"),
+}
+
+file_hashes = dict()  # (path, size, mtime) -> hash of file content
+
+
+def update_digest(digest, value):
+    """Add value to hashlib digest, arrays by content"""
+    if isinstance(value, np.ndarray):
+        digest.update(bytes(str(value.dtype) + str(value.shape), encoding="utf-8"))
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(bytes(type(value).__name__ + str(len(value)), encoding="utf-8"))
+        for item in value:
+            update_digest(digest, item)
+    elif isinstance(value, dict):
+        update_digest(digest, sorted(value.items(), key=lambda item: str(item[0])))
+    else:
+        digest.update(bytes(repr(value), encoding="utf-8"))
+
+
+def hash_values(*values):
+    digest = hashlib.sha256()
+    for value in values:
+        update_digest(digest, value)
+    return digest.hexdigest()
+
+
+def file_hash(path):
+    """
+    Hash of file content, remembered while file is unchanged
+    @Return hex string, None if file doesn't exist
+    """
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in file_hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        file_hashes[key] = digest.hexdigest()
+    return file_hashes[key]
+
+
+def stage_params(stage):
+    """
+    Const values stage depends on
+    @Return sorted list of (name, value)
+    """
+    prefixes = STAGE_PARAMS.get(stage, ())
+    return sorted(
+        (name, getattr(const, name))
+        for name in dir(const)
+        if name.startswith(prefixes) and not name.startswith("__")
+    )
+
+
+class StageCache:
+    def __init__(self, path, max_bytes=const.STAGE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key + ".pkl")
+
+    def get(self, key):
+        """
+        @Return (True, value) on hit, (False, None) on miss
+        """
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)  # mark as recently used
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+        return True, value
+
+    def put(self, key, value):
+        """Store value atomically, then evict if cache is too large"""
+        path = self.entry_path(key)
+        tmp = path + "." + str(os.getpid()) + "." + str(threading.get_ident())
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def entries(self):
+        """
+        @Return list of (last used, size, path), least recently used first
+        """
+        res = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # removed by another process
+            res.append((stat.st_mtime, stat.st_size, path))
+        return sorted(res)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until cache fits in max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+def configure(floorplan):
+    """
+    Stage cache from stage_cache setting of floorplan
+    Passed to the stages of one generation, so concurrent generations don't share it.
+    @Return cache or None if disabled
+    """
+    # Older config files don't have these settings
+    if not getattr(floorplan, const.STR_STAGE_CACHE, const.DEFAULT_STAGE_CACHE):
+        return None
+    return StageCache(const.STAGE_CACHE_PATH)
+
+
+def call(cache, stage, func, *args, key=None):
+    """
+    Call func(*args) through stage cache
+    Input is hashed before calling, as some stages modify their input.
+    @Param cache, StageCache or None to always call func, see configure
+    @Param stage, name of stage, see STAGE_PARAMS
+    @Param key, values identifying input instead of args, such as hash of image file
+    @Return result of func
+    """
+    if cache is None:
+        return func(*args)
+
+    entry = hash_values(
+        const.STAGE_CACHE_VERSION,
+        stage,
+        stage_params(stage),
+        args if key is None else key,
+    )
+    hit, value = cache.get(entry)
+    metrics.increment(
+        const.METRICS_STAGE_CACHE, stage=stage, result="hit" if hit else "miss"
+    )
+    if hit:
+        return value
+    value = func(*args)
+    cache.put(entry, value)
+    return value
+
+
+metrics.describe(const.METRICS_STAGE_CACHE, "Stage cache lookups per stage and result.")
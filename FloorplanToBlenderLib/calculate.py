@@ -47,10 +47,13 @@ def wall_width_average(img):
     Returns the average as float value. See CALIBRATION in config file.
     """
     # grayscale image
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if img.ndim == 2:
+        gray = img
+    else:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
     # Resulting image
-    height, width, channels = img.shape
+    height, width = img.shape[:2]
     blank_image = np.zeros(
         (height, width, 3), np.uint8
     )  # output image same size as original
@@ -2,6 +2,7 @@ import configparser
 import os
 import cv2
 import json
+import threading
 
 from . import IO
 from . import const
@@ -20,6 +21,10 @@ Copyright (C) 2022 Daniel Westberg
 # TODO: add blender path addition to system.ini
 
 
+# Calibrations already calculated in this process
+calibrations = dict()  # calibration image path -> wall width
+
+
 def read_calibration(floorplan):
     """
     Read all calibrations
@@ -34,8 +39,11 @@ def create_image_scale_calibration(floorplan, got_settings=False):
     Create and save image size calibrations
     """
 
-    calibration_img = cv2.imread(floorplan.calibration_image_path)
-    return calculate.wall_width_average(calibration_img)
+    path = floorplan.calibration_image_path
+    if path not in calibrations:
+        calibration_img = cv2.imread(path)
+        calibrations[path] = calculate.wall_width_average(calibration_img)
+    return calibrations[path]
 
 
 def generate_file():
@@ -79,6 +87,13 @@ def generate_file():
     conf[const.SETTINGS] = {
         const.STR_REMOVE_NOISE: json.dumps(const.DEFAULT_REMOVE_NOISE),
         const.STR_RESCALE_IMAGE: json.dumps(const.DEFAULT_RESCALE_IMAGE),
+        const.STR_INDEXED_MESH: json.dumps(const.DEFAULT_INDEXED_MESH),
+        const.STR_LOD: json.dumps(const.DEFAULT_LOD),
+        const.STR_LOD_TOLERANCES: json.dumps(const.LOD_TOLERANCES),
+        const.STR_WALL_GRAPH: json.dumps(const.DEFAULT_WALL_GRAPH),
+        const.STR_MAX_THREADS: json.dumps(const.DEFAULT_MAX_THREADS),
+        const.STR_REDUCED_DECODE: json.dumps(const.DEFAULT_REDUCED_DECODE),
+        const.STR_STAGE_CACHE: json.dumps(const.DEFAULT_STAGE_CACHE),
     }
 
     conf[const.WALL_CALIBRATION] = {
@@ -156,3 +171,19 @@ def get_default_image_path():
 
 def get_default_blender_installation_path():
     return get(const.SYSTEM_CONFIG_FILE_NAME, "SYSTEM", const.STR_BLENDER_INSTALL_PATH)
+
+
+def set_default_blender_installation_path(path):
+    """
+    Save blender installation path in system config
+    Written atomically, several processes may find blender at once
+    """
+    conf = get(const.SYSTEM_CONFIG_FILE_NAME)
+    conf["SYSTEM"][const.STR_BLENDER_INSTALL_PATH] = path
+    # threads of one process may write at once too
+    tmp = "{}.{}.{}".format(
+        const.SYSTEM_CONFIG_FILE_NAME, os.getpid(), threading.get_ident()
+    )
+    with open(tmp, "w") as configfile:
+        conf.write(configfile)
+    os.replace(tmp, const.SYSTEM_CONFIG_FILE_NAME)
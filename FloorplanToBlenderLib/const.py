@@ -29,6 +29,8 @@ SUPPORTED_BLENDER_FORMATS = (
     ".3ds",
 )
 BASE_FORMAT = ".blend"
+# Format exported without blender from data generated in indexed mode
+DIRECT_FORMAT = ".gltf"
 
 
 class MODE(Enum):
@@ -42,6 +44,38 @@ TARGET_PATH = "/Target/"
 TARGET_NAME = "floorplan"
 BLENDER_SCRIPT_PATH = "Blender/floorplan_to_3dObject_in_blender.py"
 
+# Blender discovery, see IO.blender_installed
+BLENDER_PATH_ENV = "BLENDER_PATH"  # environment variable overriding all other paths
+BLENDER_KNOWN_PATHS = {  # platform -> glob patterns of common installations
+    "linux": [
+        "/usr/local/blender/blender",
+        "/usr/local/blender*/blender",
+        "/opt/blender*/blender",
+        "/snap/bin/blender",
+        "/usr/bin/blender",
+        "/usr/local/bin/blender",
+    ],
+    "darwin": ["/Applications/Blender*.app/Contents/MacOS/Blender"],
+    "win32": ["C:\\Program Files\\Blender Foundation\\Blender*\\blender.exe"],
+}
+BLENDER_SEARCH_PATHS = {  # platform -> folders searched when nothing else is found
+    "linux": ["/opt", "/usr/local", "~"],
+    "darwin": ["/Applications", "~"],
+    "win32": ["C:\\Program Files", "C:\\Program Files (x86)"],
+}
+BLENDER_SEARCH_DEPTH = 4  # folder levels below each search path
+
+# Batch
+BATCH_DATA_PATH = BASE_PATH + "batch/"  # one data folder per image below this
+BATCH_MANIFEST = "./Target/batch_manifest.json"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+DAEMON_CLAIMED = ".claimed"  # folder in inbox holding images being processed
+DAEMON_DATA = "data"  # data folder in each outbox result
+DAEMON_RESULT = "result"  # status file in each outbox result
+DAEMON_POLL_INTERVAL = 1.0  # seconds between inbox checks when idle
+DAEMON_CLAIM_TIMEOUT = 3600  # seconds after which claims of any worker are requeued
+DAEMON_OUTBOX = "./Target/outbox/"
+
 # Generators
 WALL_GROUND = 0
 WALL_HEIGHT = 1
@@ -62,6 +96,8 @@ WINDOW_MIN_MAX_GAP = [0.25, 0.75]  # change window gap size
 # Box detection
 PRECISE_BOXES_ACCURACY = 0.001
 REMOVE_PRECISE_BOXES_ACCURACY = 0.001
+# shortest wall of wall graph in pixels, above wall thickness
+WALL_GRAPH_MIN_LENGTH = 25
 OUTER_CONTOURS_TRESHOLD = [230, 255]
 PRECISE_HARRIS_KERNEL_SIZE = (1, 1)
 PRECISE_HARRIS_BLOCK_SIZE = 2
@@ -107,6 +143,8 @@ IMAGE_H = 10
 IMAGE_HCOLOR = 10
 IMAGE_TEMPLATE_SIZE = 7
 IMAGE_SEARCH_SIZE = 21
+# reduced decodings of cv2.IMREAD_REDUCED_* used, larger ones change detected doors
+DECODE_REDUCTIONS = (2,)
 
 # DEBUG modes # TODO: implement these!
 DEBUG_DOOR = False
@@ -147,6 +185,13 @@ STR_WINDOWS = "windows"
 
 STR_REMOVE_NOISE = "remove_noise"
 STR_RESCALE_IMAGE = "rescale_image"
+STR_INDEXED_MESH = "indexed_mesh"
+STR_LOD = "lod"
+STR_WALL_GRAPH = "wall_graph"
+STR_LOD_TOLERANCES = "lod_tolerances"
+STR_MAX_THREADS = "max_threads"
+STR_REDUCED_DECODE = "reduced_decode"
+STR_STAGE_CACHE = "stage_cache"
 
 # CONFIG category names
 SETTINGS = "EXTRA_SETTINGS"
@@ -169,6 +214,12 @@ DEFAULT_MODE = "HVSTACK"
 DEFAULT_FEATURES = True
 DEFAULT_REMOVE_NOISE = True
 DEFAULT_RESCALE_IMAGE = True
+DEFAULT_INDEXED_MESH = False
+DEFAULT_LOD = 0
+DEFAULT_WALL_GRAPH = False
+DEFAULT_REDUCED_DECODE = False
+DEFAULT_STAGE_CACHE = False
+DEFAULT_MAX_THREADS = 0  # threads running generators of one floorplan, 0 is one per cpu
 DEFAULT_WALL_SIZE_CALIBRATION = 0
 
 # DATA save files names
@@ -180,6 +231,7 @@ WALL_VERTICAL_VERTS = "wall_vertical_verts"
 WALL_VERTICAL_FACES = "wall_vertical_faces"
 WALL_HORIZONTAL_VERTS = "wall_horizontal_verts"
 WALL_HORIZONTAL_FACES = "wall_horizontal_faces"
+WALL_GRAPH = "wall_graph"
 WINDOW_VERTICAL_VERTS = "window_vertical_verts"
 WINDOW_VERTICAL_FACES = "window_vertical_faces"
 WINDOW_HORIZONTAL_VERTS = "window_horizontal_verts"
@@ -188,4 +240,44 @@ DOOR_VERTICAL_VERTS = "door_vertical_verts"
 DOOR_VERTICAL_FACES = "door_vertical_faces"
 DOOR_HORIZONTAL_VERTS = "door_horizontal_verts"
 DOOR_HORIZONTAL_FACES = "door_horizontal_faces"
+# Indexed mesh mode, one welded mesh per feature
+FLOOR_MESH = "floor_mesh"
+ROOM_MESH = "room_mesh"
+WALL_MESH = "wall_mesh"
+WINDOW_MESH = "window_mesh"
+DOOR_MESH = "door_mesh"
+INDEXED_MESHES = (WALL_MESH, WINDOW_MESH, DOOR_MESH, FLOOR_MESH, ROOM_MESH)
+INDEXED_MESH_OBJ = "floorplan.obj"
 SAVE_DATA_FORMAT = ".txt"
+
+# Metrics
+METRICS_STAGE = "floorplan_stage_seconds"
+# Upper bounds in seconds of latency histogram buckets
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Stage cache
+METRICS_STAGE_CACHE = "floorplan_stage_cache_total"
+STAGE_CACHE_PATH = "Cache/stages/"
+STAGE_CACHE_MAX_BYTES = (
+    512 * 1024 * 1024
+)  # least recently used entries removed above this
+STAGE_CACHE_VERSION = 3  # increase when stage code changes, invalidates all entries
+
+# Parameter sweep
+SWEEP_CACHE_PATH = "Cache/sweep/"  # stage cache shared by variants of sweeps
+
+# Retention of generated data and objects
+RETENTION_MAX_BYTES = 2 * 1024 * 1024 * 1024  # least recently used removed above this
+RETENTION_MAX_AGE = 30 * 24 * 60 * 60  # seconds unused before removal, None keeps
+RETENTION_INTERVAL = 60  # seconds between background evictions
+
+# Geometry
+GEOMETRY_BUFFER_CAPACITY = 1024  # preallocated vertices per generator
+WELD_TOLERANCE = 0.001  # verts closer than this are welded in indexed meshes
+
+# Simplification
+# Tolerance in pixels per level of detail, level 0 keeps detected boxes as they are.
+# Points closer than tolerance to the line of their neighbours are merged away.
+LOD_TOLERANCES = [0, 2, 6]
+SIMPLIFY_MIN_AREA = 1  # simplified boxes with smaller area in pixels are dropped
+STACKING_LOD = 1  # level of detail used for floorplans added by stacking files
@@ -0,0 +1,267 @@
+import copy
+import json
+import os
+import re
+import shutil
+import socket
+import time
+
+from . import IO
+from . import batch
+from . import config
+from . import const
+from . import detect
+from . import floorplan
+from . import generate
+
+"""
+Daemon
+This file contains a long running worker converting floorplans dropped in an inbox folder.
+Library, config, door model and calibration are loaded once when the worker starts,
+so each image only costs its processing time.
+Images are claimed by an atomic rename, several workers can share one inbox.
+Claims of crashed workers are requeued when a worker starts.
+Results are written to an outbox folder per image, which appears when complete.
+
+FloorplanToBlender3d
+Copyright (C) 2022 Daniel Westberg
+"""
+
+
+def worker_id():
+    """Name of this worker, unique among workers sharing an inbox"""
+    return socket.gethostname() + "-" + str(os.getpid())
+
+
+def queued_images(inbox):
+    """
+    Images waiting in inbox
+    @Return list of image names, oldest first
+    """
+    names = []
+    for name in os.listdir(inbox):
+        path = os.path.join(inbox, name)
+        if os.path.isfile(path) and name.lower().endswith(const.IMAGE_EXTENSIONS):
+            names.append((os.path.getmtime(path), name))
+    return [name for _, name in sorted(names)]
+
+
+def claim(inbox, name, worker=None):
+    """
+    Claim image in inbox by moving it to the claimed folder
+    os.rename is atomic, when several workers try only one succeeds.
+    @Param name, image name in inbox
+    @Return path of claimed image, None if another worker claimed it first
+    """
+    if worker is None:
+        worker = worker_id()
+    claimed = os.path.join(inbox, const.DAEMON_CLAIMED)
+    os.makedirs(claimed, exist_ok=True)
+    target = os.path.join(claimed, worker + "_" + name)
+    try:
+        os.rename(os.path.join(inbox, name), target)
+    except FileNotFoundError:
+        return None
+    os.utime(target)  # claim time, rename keeps time of upload
+    return target
+
+
+def pid_alive(pid):
+    """
+    Check if process of pid runs on this host
+    @Return False if it doesn't, None if that can't be checked
+    """
+    if os.name != "posix":
+        return None  # os.kill terminates the process on windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # runs as another user
+    return True
+
+
+def requeue_stale(inbox, timeout=const.DAEMON_CLAIM_TIMEOUT):
+    """
+    Move claims of crashed workers back to inbox
+    A claim is stale when its worker on this host is gone,
+    or when it is older than timeout, which also covers other hosts.
+    @Param timeout, seconds since claim
+    @Return list of requeued image names
+    """
+    claimed = os.path.join(inbox, const.DAEMON_CLAIMED)
+    if not os.path.isdir(claimed):
+        return []
+    requeued = []
+    for claim_name in os.listdir(claimed):
+        # claim names are host-pid_name, see worker_id
+        match = re.match(r"(.*?)-(\d+)_(.+)$", claim_name)
+        if match is None:
+            continue
+        host, pid, name = match.groups()
+        path = os.path.join(claimed, claim_name)
+        stale = time.time() - os.path.getmtime(path) > timeout
+        if not stale and host == socket.gethostname():
+            stale = pid_alive(int(pid)) is False
+        if stale and not os.path.exists(os.path.join(inbox, name)):
+            try:
+                os.rename(path, os.path.join(inbox, name))
+            except FileNotFoundError:
+                continue  # another starting worker requeued it
+            requeued.append(name)
+    return requeued
+
+
+def claim_next(inbox, worker=None):
+    """
+    Claim oldest unclaimed image in inbox
+    @Return (image name, path of claimed image) or None if inbox is empty
+    """
+    for name in queued_images(inbox):
+        path = claim(inbox, name, worker)
+        if path is not None:
+            return name, path
+    return None
+
+
+class Daemon:
+    """
+    Warm worker, holds everything that is the same for each image
+    Paths are relative to program_path, which is the working directory by default.
+    """
+
+    def __init__(
+        self,
+        inbox,
+        outbox,
+        config_path=None,
+        blender_install_path=None,
+        program_path=None,
+        outformat=const.BASE_FORMAT,
+        poll_interval=const.DAEMON_POLL_INTERVAL,
+        claim_timeout=const.DAEMON_CLAIM_TIMEOUT,
+    ):
+        if config_path is None:
+            config_path = const.IMAGE_DEFAULT_CONFIG_FILE_NAME
+        if program_path is None:
+            program_path = os.getcwd()
+        self.inbox = inbox
+        self.outbox = outbox
+        self.blender_install_path = blender_install_path
+        self.program_path = program_path
+        self.outformat = outformat
+        self.poll_interval = poll_interval
+        self.worker = worker_id()
+        self.processed = 0
+
+        os.makedirs(inbox, exist_ok=True)
+        os.makedirs(outbox, exist_ok=True)
+        requeue_stale(inbox, claim_timeout)
+
+        # Preload, floorplans of each image are copied from this one
+        self.floorplan = floorplan.new_floorplan(config_path)
+        config.read_calibration(self.floorplan)
+        detect.load_model(const.DOOR_MODEL)
+
+    def process(self, name, image_path):
+        """
+        Convert claimed image and publish the result in outbox
+        @Param name, image name in inbox
+        @Param image_path, path of claimed image
+        @Return path of result folder in outbox
+        """
+        start = time.perf_counter()
+        result_name = os.path.splitext(name)[0]
+        # build in a hidden folder, the rename makes the result visible at once
+        work = os.path.join(self.outbox, "." + self.worker + "_" + result_name) + "/"
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work)
+
+        result = {"image": name, "worker": self.worker, "error": None, "timings": {}}
+        try:
+            f = copy.deepcopy(self.floorplan)
+            f.image_path = image_path
+            # blender reads data relative to program path
+            base_path = os.path.relpath(work + const.DAEMON_DATA, self.program_path)
+            stages = dict()
+            data_path, shape = generate.generate_all_files(
+                f, False, base_path=base_path + "/", timings=stages
+            )
+            result["timings"]["stages"] = stages
+            result["shape"] = [float(value) for value in shape]
+            result["timings"]["detect"] = time.perf_counter() - start
+
+            if self.blender_install_path is not None:
+                blender_start = time.perf_counter()
+                result["object"] = batch.create_blender_project(
+                    self.blender_install_path,
+                    self.program_path,
+                    [data_path],
+                    "/" + os.path.relpath(work + result_name, self.program_path),
+                    self.outformat,
+                )
+                result["timings"]["blender"] = time.perf_counter() - blender_start
+            result["status"] = batch.DONE
+        except Exception as e:
+            result["status"] = batch.FAILED
+            result["error"] = repr(e)
+
+        shutil.move(image_path, work + name)
+        result["timings"]["total"] = time.perf_counter() - start
+        IO.save_to_file(work + const.DAEMON_RESULT, result, False)
+        return publish(work, os.path.join(self.outbox, result_name))
+
+    def run_once(self):
+        """
+        Process all images currently in inbox
+        @Return amount of processed images
+        """
+        amount = 0
+        while True:
+            claimed = claim_next(self.inbox, self.worker)
+            if claimed is None:
+                return amount
+            self.process(*claimed)
+            amount += 1
+            self.processed += 1
+
+    def run(self, once=False):
+        """
+        Watch inbox until interrupted
+        @Param once, stop when inbox is empty
+        """
+        while True:
+            amount = self.run_once()
+            if once:
+                return
+            if amount == 0:
+                time.sleep(self.poll_interval)
+
+
+def publish(work, target):
+    """
+    Move finished work folder to target, the next free name if target exists
+    @Return path of published folder
+    """
+    path = target
+    index = 1
+    while True:
+        try:
+            # renaming to an existing non empty folder fails
+            os.rename(work, path)
+            return path
+        except OSError:
+            if not os.path.exists(path):
+                raise
+            path = target + "_" + str(index)
+            index += 1
+
+
+def read_result(path):
+    """
+    Read result of published folder
+    @Return dict with status, shape, error and timings
+    """
+    with open(os.path.join(path, const.DAEMON_RESULT + const.SAVE_DATA_FORMAT)) as f:
+        return json.load(f)
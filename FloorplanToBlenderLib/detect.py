@@ -5,6 +5,7 @@ from . import const
 from . import image
 from . import calculate
 from . import transform
+from . import IO
 import math
 
 # Calculate (actual) size of apartment
@@ -87,6 +88,99 @@ def precise_boxes(detect_img, output_img=None, color=[100, 100, 0], thickness=4)
     return res, output_img
 
 
+def __wall_runs(wall_img, min_length, horizontal):
+    """
+    Find straight wall runs along one axis
+    Help function for wall graph
+    @Param wall_img binary image of walls
+    @Param min_length shortest run in pixels
+    @Param horizontal, direction of runs
+    @Return (N,4) array of runs as centerline position, start, end, thickness
+    """
+    kernel = np.ones((1, min_length) if horizontal else (min_length, 1), np.uint8)
+    runs = cv2.morphologyEx(wall_img, cv2.MORPH_OPEN, kernel)
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(runs)
+    x, y, w, h, area = stats[1:].T  # first component is background
+
+    if horizontal:
+        return np.stack([centroids[1:, 1], x, x + w - 1, area / w], axis=1)
+    return np.stack([centroids[1:, 0], y, y + h - 1, area / h], axis=1)
+
+
+def wall_graph(wall_img, min_length=None):
+    """
+    Detect wall graph
+    Convert wall image into a graph of wall centerlines, with run length analysis.
+    Horizontal and vertical runs become straight segments with a thickness,
+    segments meeting each other are split and joined in junction nodes.
+    @Param wall_img binary image of walls, such as from wall_filter @mandatory
+    @Param min_length shortest wall in pixels, should be above wall thickness,
+    defaults to const.WALL_GRAPH_MIN_LENGTH at time of call
+    @Return nodes - (K,2) array of points, edges - (E,2) array of node indices,
+    thickness - (E,) array of wall thickness in pixels
+    """
+    if min_length is None:
+        min_length = const.WALL_GRAPH_MIN_LENGTH
+    h_runs = __wall_runs(wall_img, min_length, True)
+    v_runs = __wall_runs(wall_img, min_length, False)
+
+    # runs touch when each one reaches the centerline of the other
+    tolerance = np.maximum(h_runs[:, 3, None], v_runs[None, :, 3])
+    touching = (
+        (v_runs[None, :, 0] >= h_runs[:, 1, None] - tolerance)
+        & (v_runs[None, :, 0] <= h_runs[:, 2, None] + tolerance)
+        & (h_runs[:, 0, None] >= v_runs[None, :, 1] - tolerance)
+        & (h_runs[:, 0, None] <= v_runs[None, :, 2] + tolerance)
+    )
+
+    nodes = dict()  # rounded point -> node index
+    edges = []
+    thickness = []
+
+    def add_node(point):
+        key = (round(float(point[0]), 3), round(float(point[1]), 3))
+        return nodes.setdefault(key, len(nodes))
+
+    for runs, junctions, horizontal in (
+        (h_runs, touching, True),
+        (v_runs, touching.T, False),
+    ):
+        others = v_runs if horizontal else h_runs
+        for run, touches in zip(runs, junctions):
+            center, start, end, width = run
+            # free ends of centerline lie half a wall thickness inside the run
+            start, end = start + width / 2, end - width / 2
+            if start > end:
+                start = end = (start + end) / 2
+
+            positions = others[touches, 0]
+            if len(positions):
+                # snap ends to junctions close to them
+                tolerance = np.maximum(width, others[touches, 3])
+                if (positions - tolerance <= start).any():
+                    start = positions[positions - tolerance <= start].min()
+                if (positions + tolerance >= end).any():
+                    end = positions[positions + tolerance >= end].max()
+            positions = positions[(positions > start) & (positions < end)]
+            positions = np.unique(np.concatenate([[start], positions, [end]]))
+
+            if len(positions) < 2:
+                continue
+            if horizontal:
+                points = [(position, center) for position in positions]
+            else:
+                points = [(center, position) for position in positions]
+            indices = [add_node(point) for point in points]
+            edges.extend(zip(indices[:-1], indices[1:]))
+            thickness.extend([width] * (len(indices) - 1))
+
+    return (
+        np.array(list(nodes), dtype=np.float64).reshape(-1, 2),
+        np.array(edges, dtype=np.int64).reshape(-1, 2),
+        np.array(thickness, dtype=np.float64),
+    )
+
+
 def __corners_and_draw_lines(img, corners_threshold, room_closing_max_length):
     """
     Finds corners and draw lines from them
@@ -128,12 +222,78 @@ def __corners_and_draw_lines(img, corners_threshold, room_closing_max_length):
     return img
 
 
+class Components:
+    """
+    Connected components of an image in compact form
+    One label image and per component statistics instead of one full size
+    boolean mask per component, masks are created on demand.
+    """
+
+    def __init__(self, labels, boxes, areas, centroids):
+        # int32 image, component i has label i + 1 and 0 is no component
+        self.labels = labels
+        # (N,4) array of x, y, width, height of bounding box
+        self.boxes = boxes
+        # (N,) array of amount of pixels
+        self.areas = areas
+        # (N,2) array of x, y
+        self.centroids = centroids
+
+    def __len__(self):
+        return len(self.areas)
+
+    def mask(self, index):
+        """
+        @Return full size boolean mask of component index
+        """
+        return self.labels == index + 1
+
+    def crop(self, index):
+        """
+        @Return boolean mask of component index cropped to its bounding box, (x, y) of crop
+        """
+        x, y, w, h = self.boxes[index]
+        return self.labels[y : y + h, x : x + w] == index + 1, (x, y)
+
+
+def __components(img, min_area, max_area=None):
+    """
+    Find connected components
+    Help function for finding rooms and details
+    @Param img binary image, components are the white areas
+    @Param min_area, max_area amount of pixels of kept components
+    @Return Components of kept components, image where each has a random color
+    """
+    _, labels, stats, centroids = cv2.connectedComponentsWithStats(img)
+    areas = stats[:, cv2.CC_STAT_AREA]
+    kept = areas >= min_area
+    if max_area is not None:
+        kept &= areas <= max_area
+    kept[0] = False  # black background
+    kept = np.flatnonzero(kept)
+
+    colors = np.zeros((len(stats), 3), np.uint8)
+    for label in kept:
+        colors[label] = np.random.randint(0, 255, size=3)
+    relabel = np.zeros(len(stats), np.int32)
+    relabel[kept] = np.arange(1, len(kept) + 1)
+
+    components = Components(
+        relabel[labels],
+        stats[kept, : cv2.CC_STAT_AREA],
+        areas[kept],
+        centroids[kept],
+    )
+    return components, colors[labels]
+
+
 def find_rooms(
     img,
-    noise_removal_threshold=const.FIND_ROOMS_NOISE_REMOVAL_THRESHOLD,
-    corners_threshold=const.FIND_ROOMS_CORNERS_THRESHOLD,
-    room_closing_max_length=const.FIND_ROOMS_CLOSING_MAX_LENGTH,
-    gap_in_wall_min_threshold=const.FIND_ROOMS_GAP_IN_WALL_MIN_THRESHOLD,
+    noise_removal_threshold=None,
+    corners_threshold=None,
+    room_closing_max_length=None,
+    gap_in_wall_min_threshold=None,
+    labeled=False,
 ):
     """
     src: https://stackoverflow.com/questions/54274610/crop-each-of-them-using-opencv-python
@@ -143,9 +303,19 @@ def find_rooms(
     @param corners_threshold: Threshold to allow corners. Higher removes more of the house.
     @param room_closing_max_length: Maximum line length to add to close off open doors.
     @param gap_in_wall_threshold: Minimum number of pixels to identify component as room instead of hole in the wall.
+    @param labeled: Return rooms as Components instead of a list of masks, uses far less memory.
     @return: rooms: list of numpy arrays containing boolean masks for each detected room
              colored_house: A colored version of the input image, where each room has a random color.
+    Thresholds left as None are read from const when called, so they can be swept.
     """
+    if noise_removal_threshold is None:
+        noise_removal_threshold = const.FIND_ROOMS_NOISE_REMOVAL_THRESHOLD
+    if corners_threshold is None:
+        corners_threshold = const.FIND_ROOMS_CORNERS_THRESHOLD
+    if room_closing_max_length is None:
+        room_closing_max_length = const.FIND_ROOMS_CLOSING_MAX_LENGTH
+    if gap_in_wall_min_threshold is None:
+        gap_in_wall_min_threshold = const.FIND_ROOMS_GAP_IN_WALL_MIN_THRESHOLD
     assert 0 <= corners_threshold <= 1
     # Remove noise left from door removal
 
@@ -157,22 +327,10 @@ def find_rooms(
     img, mask = image.mark_outside_black(img, mask)
 
     # Find the connected components in the house
-    ret, labels = cv2.connectedComponents(img)
-    img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
-    unique = np.unique(labels)
-    rooms = []
-    for label in unique:
-        component = labels == label
-        if (
-            img[component].sum() == 0
-            or np.count_nonzero(component) < gap_in_wall_min_threshold
-        ):
-            color = 0
-        else:
-            rooms.append(component)
-            color = np.random.randint(0, 255, size=3)
-        img[component] = color
-    return rooms, img
+    rooms, img = __components(img, gap_in_wall_min_threshold)
+    if labeled:
+        return rooms, img
+    return [rooms.mask(i) for i in range(len(rooms))], img
 
 
 def and_remove_precise_boxes(detect_img, output_img=None, color=[255, 255, 255]):
@@ -235,24 +393,52 @@ def outer_contours(detect_img, output_img=None, color=[255, 255, 255], thickness
     return approx, output_img
 
 
-def doors(image_path, scale_factor):
-    model = cv2.imread(const.DOOR_MODEL, 0)
-    img = cv2.imread(
-        image_path, 0
-    )  # TODO: it is not very effective to read image again here!
+# Loaded models, read once per process
+models = dict()  # path -> grayscale image
+
+
+def load_model(path):
+    """
+    Load grayscale model image, cached so long running processes only read it once
+    @Param path, such as const.DOOR_MODEL
+    @Return model image
+    """
+    if path not in models:
+        models[path] = cv2.imread(path, 0)
+    return models[path]
+
+
+def detail_image(image_path, scale_factor, reduced=False):
+    """
+    Read grayscale image doors and windows are matched in
+    Read it once and share it between doors and windows
+    @Param scale_factor, rescale of image, see IO.read_image
+    @Param reduced, decode only as many pixels as the rescaled image needs
+    @Return rescaled grayscale image
+    """
+    reduction = IO.decode_reduction(scale_factor) if reduced else 1
+    img = cv2.imread(image_path, IO.decode_flag(reduction, False))
+    return image.cv2_rescale_image(img, scale_factor * reduction)
+
 
-    img = image.cv2_rescale_image(img, scale_factor)
+def doors(image_path, scale_factor, img=None):
+    """
+    @Param img, image from detail_image, read from image_path if None
+    """
+    model = load_model(const.DOOR_MODEL)
+    if img is None:
+        img = detail_image(image_path, scale_factor)
     _, doors = feature_match(img, model)
     return doors
 
 
-def windows(image_path, scale_factor):
-    model = cv2.imread(const.DOOR_MODEL, 0)
-    img = cv2.imread(
-        image_path, 0
-    )  # TODO: it is not very effective to read image again here!
-
-    img = image.cv2_rescale_image(img, scale_factor)
+def windows(image_path, scale_factor, img=None):
+    """
+    @Param img, image from detail_image, read from image_path if None
+    """
+    model = load_model(const.DOOR_MODEL)
+    if img is None:
+        img = detail_image(image_path, scale_factor)
     windows, _ = feature_match(img, model)
     return windows
 
@@ -477,8 +663,8 @@ def feature_match(img1, img2):
 
     gray = wall_filter(img1)
     gray = ~gray  # TODO: is it necessary to convert to grayscale again?
-    rooms, colored_rooms = find_rooms(gray.copy())
-    doors, colored_doors = find_details(gray.copy())
+    rooms, colored_rooms = find_rooms(gray.copy(), labeled=True)
+    doors, colored_doors = find_details(gray.copy(), labeled=True)
     gray_rooms = cv2.cvtColor(colored_doors, cv2.COLOR_BGR2GRAY)
 
     # get box positions for rooms
@@ -525,11 +711,12 @@ def feature_match(img1, img2):
 
 def find_details(
     img,
-    noise_removal_threshold=const.DETAILS_NOISE_REMOVAL_THRESHOLD,
-    corners_threshold=const.DETAILS_CORNERS_THRESHOLD,
-    room_closing_max_length=const.DETAILS_CLOSING_MAX_LENGTH,
-    gap_in_wall_max_threshold=const.DETAILS_GAP_IN_WALL_THRESHOLD[1],
-    gap_in_wall_min_threshold=const.DETAILS_GAP_IN_WALL_THRESHOLD[0],
+    noise_removal_threshold=None,
+    corners_threshold=None,
+    room_closing_max_length=None,
+    gap_in_wall_max_threshold=None,
+    gap_in_wall_min_threshold=None,
+    labeled=False,
 ):
 
     """
@@ -541,9 +728,21 @@ def find_details(
     @Param corners_threshold: Threshold to allow corners. Higher removes more of the house.
     @Param room_closing_max_length: Maximum line length to add to close off open doors.
     @Param gap_in_wall_threshold: Minimum number of pixels to identify component as room instead of hole in the wall.
+    @Param labeled: Return details as Components instead of a list of masks, uses far less memory.
     @Return: rooms: list of numpy arrays containing boolean masks for each detected room
              colored_house: A colored version of the input image, where each room has a random color.
+    Thresholds left as None are read from const when called, so they can be swept.
     """
+    if noise_removal_threshold is None:
+        noise_removal_threshold = const.DETAILS_NOISE_REMOVAL_THRESHOLD
+    if corners_threshold is None:
+        corners_threshold = const.DETAILS_CORNERS_THRESHOLD
+    if room_closing_max_length is None:
+        room_closing_max_length = const.DETAILS_CLOSING_MAX_LENGTH
+    if gap_in_wall_max_threshold is None:
+        gap_in_wall_max_threshold = const.DETAILS_GAP_IN_WALL_THRESHOLD[1]
+    if gap_in_wall_min_threshold is None:
+        gap_in_wall_min_threshold = const.DETAILS_GAP_IN_WALL_THRESHOLD[0]
     assert 0 <= corners_threshold <= 1
     # Remove noise left from door removal
 
@@ -555,22 +754,9 @@ def find_details(
     img, mask = image.mark_outside_black(img, mask)
 
     # Find the connected components in the house
-    ret, labels = cv2.connectedComponents(img)
-    img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
-    unique = np.unique(labels)
-    details = []
-    for label in unique:
-        component = labels == label
-        if (
-            img[component].sum() == 0
-            or np.count_nonzero(component) < gap_in_wall_min_threshold
-            or np.count_nonzero(component) > gap_in_wall_max_threshold
-        ):
-            color = 0
-        else:
-            details.append(component)
-            color = np.random.randint(0, 255, size=3)
-
-        img[component] = color
-
-    return details, img
+    details, img = __components(
+        img, gap_in_wall_min_threshold, gap_in_wall_max_threshold
+    )
+    if labeled:
+        return details, img
+    return [details.mask(i) for i in range(len(details))], img
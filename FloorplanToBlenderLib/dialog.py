@@ -1,5 +1,3 @@
-from pyfiglet import Figlet
-
 """
 Dialog
 This file contains code for handling dialog and can be seen as a gui solution.
@@ -10,6 +8,8 @@ Copyright (C) 2022 Daniel Westberg
 
 
 def figlet(text="Floorplan to Blender3d", font="slant"):
+    from pyfiglet import Figlet  # only needed in interactive mode
+
     f = Figlet(font=font)
     print(f.renderText(text))
 
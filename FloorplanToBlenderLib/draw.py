@@ -1,6 +1,5 @@
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 
 """
 DRAW
@@ -104,6 +103,8 @@ def histogram(img, title="Histogram", wait=0):
     """
     Draw histogram of image data
     """
+    import matplotlib.pyplot as plt  # heavy, only loaded when plotting
+
     hist = np.histogram(img, bins=np.arange(0, 256))
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(8, 3))
     ax1.imshow(img, cmap=plt.cm.gray, interpolation="nearest")
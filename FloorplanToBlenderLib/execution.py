@@ -1,6 +1,5 @@
 from . import generate
 import numpy as np
-from scipy.spatial.transform import Rotation as R
 from math import atan2, degrees
 
 """
@@ -12,13 +11,14 @@ Copyright (C) 2022 Daniel Westberg
 """
 
 
-def simple_single(floorplan, show=True):
+def simple_single(floorplan, show=True, base_path=None):
     """
     Generate one simple floorplan
     @Param image_path path to image
+    @Param base_path, folder to store data in, defaults to const.BASE_PATH
     @Return path to generated files
     """
-    filepath, _ = generate.generate_all_files(floorplan, show)
+    filepath, _ = generate.generate_all_files(floorplan, show, base_path=base_path)
     return filepath
 
 
@@ -30,6 +30,8 @@ def multiple_axis(
     worldpositionoffset=np.array([0, 0, 0]),
     worldrotationoffset=np.array([0, 0, 0]),
     worldscale=np.array([1, 1, 1]),
+    lod=None,
+    prepared=None,
 ):
     """
     Generates several new apartments along axis "x","y","z"
@@ -37,6 +39,8 @@ def multiple_axis(
     @Param dir - determines +/- direction along axis
     @Param floorplans - list of path to images
     @Param horizontal - if apartments should stack horizontal or vertical
+    @Param lod - level of detail, defaults to lod setting of each floorplan
+    @Param prepared - data generated ahead, see generate.generate_all_files
     @Return paths to image data
     """
     # Generate data files
@@ -61,6 +65,8 @@ def multiple_axis(
                     + worldpositionoffset
                     + margin,
                     world_rotation=worldrotationoffset,
+                    lod=lod,
+                    prepared=prepared,
                 )
             elif axis == "x":
                 filepath, fshape = generate.generate_all_files(
@@ -72,6 +78,8 @@ def multiple_axis(
                     + margin,
                     world_rotation=worldrotationoffset,
                     world_direction=dir,
+                    lod=lod,
+                    prepared=prepared,
                 )
             elif axis == "z":
                 filepath, fshape = generate.generate_all_files(
@@ -83,6 +91,8 @@ def multiple_axis(
                     + margin,
                     world_rotation=worldrotationoffset,
                     world_direction=dir,
+                    lod=lod,
+                    prepared=prepared,
                 )
         else:
             filepath, fshape = generate.generate_all_files(
@@ -92,6 +102,8 @@ def multiple_axis(
                 world_scale=worldscale,
                 world_position=worldpositionoffset + margin,
                 world_rotation=worldrotationoffset,
+                lod=lod,
+                prepared=prepared,
             )
 
         # add path to send to blender
@@ -100,6 +112,8 @@ def multiple_axis(
 
 
 def rotate_around_axis(axis, vec, degrees):
+    from scipy.spatial.transform import Rotation as R  # heavy, only used here
+
     rotation_radians = np.radians(degrees)
     rotation_vector = rotation_radians * axis
     rotation = R.from_rotvec(rotation_vector)
@@ -122,6 +136,8 @@ def multiple_cylinder(
     world_rotation=np.array([0, 0, 1]),
     world_scale=np.array([1, 1, 1]),
     margin=np.array([0, 0, 0]),
+    lod=None,
+    prepared=None,
 ):
     """
     Generates several new apartments in a cylindric shape
@@ -132,6 +148,8 @@ def multiple_cylinder(
     @Param amount_per_level - how many apartments should be added to the circle
     @Param radie - radie size
     @Param degree - how many degree should the circle be, 0-360
+    @Param lod - level of detail, defaults to lod setting of each floorplan
+    @Param prepared - data generated ahead, see generate.generate_all_files
     @Return paths to image data
     """
     data_paths = list()
@@ -166,6 +184,8 @@ def multiple_cylinder(
             ),
             world_rotation=curr_rot,
             world_scale=world_scale,
+            lod=lod,
+            prepared=prepared,
         )
 
         # add path to send to blender
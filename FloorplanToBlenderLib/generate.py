@@ -1,7 +1,12 @@
 from . import IO
+from . import cache
 from . import const
+from . import detect
 from . import transform
 import numpy as np
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from FloorplanToBlenderLib.generator import Door, Floor, Room, Wall, Window
 
@@ -22,6 +27,10 @@ def generate_all_files(
     world_scale=np.array([1, 1, 1]),
     world_position=np.array([0, 0, 0]),
     world_rotation=np.array([0, 0, 0]),
+    base_path=None,
+    lod=None,
+    prepared=None,
+    timings=None,
 ):
     """
     Generate all data files
@@ -30,16 +39,21 @@ def generate_all_files(
     @Param info, boolean if should be printed
     @Param position, vector of float
     @Param rotation, vector of float
+    @Param base_path, folder to store data in, defaults to const.BASE_PATH
+    @Param lod, level of detail, defaults to lod setting of floorplan
+    @Param prepared, dict of (image path, lod) -> (path, shape) of data generated ahead
+    @Param timings, dict filled with stage timings, see generate_data
     @Return path to generated file, shape
     """
     if world_direction is None:
         world_direction = 1
 
-    scale = [
-        floorplan.scale[0] * world_scale[0],
-        floorplan.scale[1] * world_scale[1],
-        floorplan.scale[2] * world_scale[2],
-    ]
+    if base_path is None:
+        base_path = const.BASE_PATH
+
+    lod = get_lod(floorplan, lod)
+    tolerance = get_tolerance(floorplan, lod)
+    scale = get_scale(floorplan, world_scale)
 
     if info:
         print(
@@ -57,37 +71,20 @@ def generate_all_files(
         )
 
     # Get path to save data
-    path = IO.create_new_floorplan_path(const.BASE_PATH)
+    path = IO.create_new_floorplan_path(base_path)
 
-    origin_path, shape = IO.find_reuseable_data(floorplan.image_path, const.BASE_PATH)
+    origin_path, shape = IO.find_reuseable_data(floorplan.image_path, base_path, lod)
 
     if origin_path is None:
         origin_path = path
 
-        _, gray, scale_factor = IO.read_image(floorplan.image_path, floorplan)
-
-        if floorplan.floors:
-            shape = Floor(gray, path, scale, info).shape
-
-        if floorplan.walls:
-            if shape is not None:
-                new_shape = Wall(gray, path, scale, info).shape
-                shape = validate_shape(shape, new_shape)
-            else:
-                shape = Wall(gray, path, scale, info).shape
-
-        if floorplan.rooms:
-            if shape is not None:
-                new_shape = Room(gray, path, scale, info).shape
-                shape = validate_shape(shape, new_shape)
-            else:
-                shape = Room(gray, path, scale, info).shape
-
-        if floorplan.windows:
-            Window(gray, path, floorplan.image_path, scale_factor, scale, info)
-
-        if floorplan.doors:
-            Door(gray, path, floorplan.image_path, scale_factor, scale, info)
+        key = (floorplan.image_path, lod)
+        if prepared is not None and key in prepared:
+            # data was already generated ahead of placement, see stacking.run_plan
+            prepared_path, shape = prepared.pop(key)
+            IO.move_data(prepared_path, path)
+        else:
+            shape = generate_data(floorplan, path, scale, info, tolerance, timings)
 
     generate_transform_file(
         floorplan.image_path,
@@ -101,6 +98,7 @@ def generate_all_files(
         shape,
         path,
         origin_path,
+        lod,
     )
 
     if floorplan.position is not None:
@@ -116,6 +114,263 @@ def generate_all_files(
     return path, shape
 
 
+def generate_data(floorplan, path, scale, info, tolerance=0, timings=None, counts=None):
+    """
+    Generate data files of all features of floorplan
+    Generators only depending on the decoded image run concurrently, see run_stages.
+    @Param path, folder to store data in
+    @Param scale, vector of float
+    @Param info, boolean if should be printed
+    @Param tolerance, simplification tolerance of level of detail
+    @Param timings, dict filled with stage name -> (start, end) seconds
+    @Param counts, dict filled with feature name -> amount detected
+    @Return shape
+    """
+    # Older config files don't have these settings
+    indexed = getattr(floorplan, const.STR_INDEXED_MESH, const.DEFAULT_INDEXED_MESH)
+    graph = getattr(floorplan, const.STR_WALL_GRAPH, const.DEFAULT_WALL_GRAPH)
+    max_threads = getattr(floorplan, const.STR_MAX_THREADS, const.DEFAULT_MAX_THREADS)
+    reduced = getattr(floorplan, const.STR_REDUCED_DECODE, const.DEFAULT_REDUCED_DECODE)
+    stage_cache = cache.configure(floorplan)
+
+    def read_image():
+        img, gray, scale_factor = IO.read_image(floorplan.image_path, floorplan)
+        # calibration measured while reading, restored on cache hits
+        return img, gray, scale_factor, floorplan.wall_size_calibration
+
+    def read(results):
+        key = [
+            cache.file_hash(floorplan.image_path),
+            floorplan.remove_noise,
+            floorplan.rescale_image,
+            floorplan.wall_size_calibration,
+            cache.file_hash(floorplan.calibration_image_path),
+            reduced,
+        ]
+        img, gray, scale_factor, calibration = cache.call(
+            stage_cache, "read", read_image, key=key
+        )
+        floorplan.wall_size_calibration = calibration
+        return img, gray, scale_factor
+
+    def details(results):
+        _, _, scale_factor = results["read"]
+        # doors and windows are matched in the image before denoising
+        return detect.detail_image(floorplan.image_path, scale_factor, reduced)
+
+    def floor(results):
+        _, gray, _ = results["read"]
+        return Floor(gray, path, scale, info, indexed, tolerance, stage_cache)
+
+    def wall(results):
+        _, gray, _ = results["read"]
+        return Wall(gray, path, scale, info, indexed, tolerance, graph, stage_cache)
+
+    def room(results):
+        _, gray, _ = results["read"]
+        return Room(gray, path, scale, info, indexed, tolerance, stage_cache)
+
+    def window(results):
+        _, gray, scale_factor = results["read"]
+        return Window(
+            gray,
+            path,
+            floorplan.image_path,
+            scale_factor,
+            scale,
+            info,
+            indexed,
+            results["details"],
+            stage_cache,
+        )
+
+    def door(results):
+        _, gray, scale_factor = results["read"]
+        return Door(
+            gray,
+            path,
+            floorplan.image_path,
+            scale_factor,
+            scale,
+            info,
+            indexed,
+            results["details"],
+            stage_cache,
+        )
+
+    stages = {"read": (read, [])}
+    if floorplan.windows or floorplan.doors:
+        stages["details"] = (details, ["read"])
+    for name, enabled, func, dependencies in (
+        (const.STR_FLOORS, floorplan.floors, floor, ["read"]),
+        (const.STR_WALLS, floorplan.walls, wall, ["read"]),
+        (const.STR_ROOMS, floorplan.rooms, room, ["read"]),
+        (const.STR_WINDOWS, floorplan.windows, window, ["read", "details"]),
+        (const.STR_DOORS, floorplan.doors, door, ["read", "details"]),
+    ):
+        if enabled:
+            stages[name] = (func, dependencies)
+
+    results, stage_timings = run_stages(stages, max_threads)
+    if timings is not None:
+        timings.update(stage_timings)
+    if info:
+        print("Critical path : ", critical_path(stages, stage_timings))
+
+    # merge in fixed order, independent of which generator finished first
+    generators = [results[name] for name in stages if name not in ("read", "details")]
+    if counts is not None:
+        for name in stages:
+            if name not in ("read", "details"):
+                counts[name] = results[name].amount
+    shape = None
+    for name in (const.STR_FLOORS, const.STR_WALLS, const.STR_ROOMS):
+        if name in results:
+            if shape is not None:
+                shape = validate_shape(shape, results[name].shape)
+            else:
+                shape = results[name].shape
+
+    if indexed:
+        IO.save_to_obj(
+            path + const.INDEXED_MESH_OBJ,
+            {g.mesh_name: g.mesh for g in generators},
+            info,
+        )
+
+    return shape
+
+
+def run_stages(stages, max_threads=None):
+    """
+    Run stage DAG
+    Each stage starts on a thread pool as soon as its dependencies are done.
+    Heavy stages are OpenCV calls releasing the GIL, so they run in parallel.
+    @Param stages, dict of name -> (function, list of dependency names),
+    function is called with dict of results of finished stages
+    @Param max_threads, stages running at once, 0 or None is one per cpu,
+    1 runs stages in order of dict
+    @Return results - dict of name -> result, timings - dict of name -> (start, end)
+    seconds since run started
+    """
+    results = dict()
+    timings = dict()
+    start = time.perf_counter()
+
+    def run(name):
+        begin = time.perf_counter() - start
+        result = stages[name][0](results)
+        timings[name] = (begin, time.perf_counter() - start)
+        return result
+
+    if max_threads == 1:
+        for name in stages:
+            results[name] = run(name)
+        return results, timings
+
+    if not max_threads:
+        max_threads = os.cpu_count() or 1
+    pending = dict(stages)
+    with ThreadPoolExecutor(max_workers=max_threads) as executor:
+        running = dict()  # future -> stage name
+        while pending or running:
+            for name in list(pending):
+                if all(dependency in results for dependency in pending[name][1]):
+                    del pending[name]
+                    running[executor.submit(run, name)] = name
+            if not running:
+                raise ValueError(
+                    "Stages with missing dependencies " + str(list(pending))
+                )
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                results[running.pop(future)] = future.result()
+    return results, timings
+
+
+def critical_path(stages, timings):
+    """
+    Critical path
+    Chain of stages that decided total time, each one waited for the dependency finishing last.
+    @Param stages, see run_stages
+    @Param timings, see run_stages
+    @Return list of stage names, first stage first
+    """
+    if not timings:
+        return []
+    name = max(timings, key=lambda n: timings[n][1])
+    path = [name]
+    while stages[name][1]:
+        name = max(stages[name][1], key=lambda n: timings[n][1])
+        path.insert(0, name)
+    return path
+
+
+def prepare_data(
+    floorplan, path, info=False, world_scale=np.array([1, 1, 1]), lod=None
+):
+    """
+    Prepare data
+    Generate data files only, with same scale and level of detail
+    generate_all_files would use. Run in worker processes by stacking.
+    @Return path, shape
+    """
+    return path, generate_data(
+        floorplan,
+        path,
+        get_scale(floorplan, world_scale),
+        info,
+        get_tolerance(floorplan, lod),
+    )
+
+
+def get_scale(floorplan, world_scale):
+    """
+    Get scale of floorplan in world
+    @Return scale vector
+    """
+    return [
+        floorplan.scale[0] * world_scale[0],
+        floorplan.scale[1] * world_scale[1],
+        floorplan.scale[2] * world_scale[2],
+    ]
+
+
+def get_lod(floorplan, lod=None):
+    """
+    Get level of detail, defaults to lod setting of floorplan
+    """
+    # Older config files don't have these settings
+    if lod is None:
+        lod = getattr(floorplan, const.STR_LOD, const.DEFAULT_LOD)
+    return lod
+
+
+def get_tolerance(floorplan, lod=None):
+    """
+    Get simplification tolerance of floorplan level of detail
+    """
+    return transform.lod_tolerance(
+        getattr(floorplan, const.STR_LOD_TOLERANCES, const.LOD_TOLERANCES),
+        get_lod(floorplan, lod),
+    )
+
+
+def generate_lods(floorplan, info, levels=None, **kwargs):
+    """
+    Generate data files of floorplan once per level of detail
+    @Param info, boolean if should be printed
+    @Param levels, list of levels, defaults to all levels configured for floorplan
+    @Param kwargs, see generate_all_files
+    @Return list of (path to generated file, shape), one per level
+    """
+    if levels is None:
+        levels = range(
+            len(getattr(floorplan, const.STR_LOD_TOLERANCES, const.LOD_TOLERANCES))
+        )
+    return [generate_all_files(floorplan, info, lod=lod, **kwargs) for lod in levels]
+
+
 def validate_shape(old_shape, new_shape):
     """
     Validate shape, use this to calculate a objects total shape
@@ -142,6 +397,7 @@ def generate_transform_file(
     shape,
     data_path,
     origin_path,
+    lod=const.DEFAULT_LOD,
 ):
     """
     Generate transform of file
@@ -151,6 +407,7 @@ def generate_transform_file(
     @Param position, position vector
     @Param rotation, rotation vector
     @Param shape
+    @Param lod, level of detail of data
     @Return transform
     """
     # create map
@@ -181,6 +438,8 @@ def generate_transform_file(
 
     transform[const.STR_DATA_PATH] = data_path
 
+    transform[const.STR_LOD] = lod
+
     IO.save_to_file(path + "transform", transform, info)
 
     return transform
@@ -1,14 +1,18 @@
 import abc
 import cv2
+import functools
 import math
 import numpy as np
 
+from . import cache
 from . import detect
 from . import transform
 from . import IO
 from . import const
 from . import draw
 from . import calculate
+from . import metrics
+from . import geometry
 
 """
 Generator
@@ -19,12 +23,21 @@ Copyright (C) 2022 Daniel Westberg
 """
 
 
+def detail_key(image_path, scale_factor, detail_img):
+    """
+    Stage cache key of door and window detection, image content and door model
+    """
+    if detail_img is None:
+        return [
+            cache.file_hash(image_path),
+            scale_factor,
+            cache.file_hash(const.DOOR_MODEL),
+        ]
+    return [detail_img, cache.file_hash(const.DOOR_MODEL)]
+
+
 class Generator:
     __metaclass__ = abc.ABCMeta
-    # create verts (points 3d), points to use in mesh creations
-    verts = []
-    # create faces for each plane, describe order to create mesh points
-    faces = []
     # Height of waLL
     height = const.WALL_HEIGHT
     # Scale pixel value to 3d pos
@@ -33,40 +46,113 @@ class Generator:
     scale = np.array([1, 1, 1])
     # Index is many for when there are several floorplans
     path = ""
-
-    def __init__(self, gray, path, scale, info=False):
+    # Data file of welded mesh in indexed mode
+    mesh_name = None
+    # Amount of detected features, such as walls or rooms
+    amount = 0
+
+    def __init__(
+        self,
+        gray,
+        path,
+        scale,
+        info=False,
+        indexed=False,
+        tolerance=0,
+        stage_cache=None,
+    ):
         self.path = path
-        self.shape = self.generate(gray, info)
+        # cache of detection stages, see cache.configure
+        self.stage_cache = stage_cache
+        # write one welded mesh instead of separate verts and faces files
+        self.indexed = indexed
+        # simplification tolerance in pixels of detected boxes, see const.LOD_TOLERANCES
+        self.tolerance = tolerance
+        # create verts (points 3d), points to use in mesh creations
+        self.verts = []
+        # create faces for each plane, describe order to create mesh points
+        self.faces = []
+        # all generated verts, packed per feature
+        self.buffer = geometry.GeometryBuffer()
+        with metrics.timer(stage=type(self).__name__.lower()):
+            self.shape = self.generate(gray, info)
         self.scale = scale
+        if self.indexed:
+            self.save_mesh(info)
+
+    def save_to_file(self, name, data, info=False):
+        """Save verts or faces data file, only used when not in indexed mode"""
+        if not self.indexed:
+            IO.save_to_file(self.path + name, data, info)
 
-    def get_shape(self, verts):
+    def save_mesh(self, info=False):
+        """
+        Save mesh
+        Weld all generated verts into one indexed mesh and save it
+        @Return verts, faces of mesh
+        """
+        verts, faces = self.buffer.weld()
+        self.mesh = (verts, faces)
+        IO.save_to_file(
+            self.path + self.mesh_name, {"verts": verts, "faces": faces}, info
+        )
+        return verts, faces
+
+    def add_vertical(self, points, offsets, height, ground=const.WALL_GROUND):
+        """
+        Add vertical objects, a wall between each two neighbouring box points
+        @Param points, offsets, packed boxes from transform.pack_boxes
+        @Return verts, faces as lists for data files, empty in indexed mode
+        """
+        verts, faces = transform.create_nx4_verts_and_faces_packed(
+            points, offsets, height, self.pixelscale, ground, self.buffer.data.dtype
+        )
+        self.buffer.add_packed(verts, 4 * offsets, faces)
+        if self.indexed:
+            return [], []
+        return transform.packed_nx4_to_lists(verts, offsets, height, ground)
+
+    def add_horizontal(
+        self, points, offsets, height, ground=False, ground_height=const.WALL_GROUND
+    ):
+        """
+        Add horizontal objects, a polygon of each box
+        @Param points, offsets, packed boxes from transform.pack_boxes
+        @Param ground, also add each box at ground_height
+        @Return verts, faces as lists for data files, empty in indexed mode
+        """
+        verts, _, feature_offsets = transform.create_4xn_verts_and_faces_packed(
+            points,
+            offsets,
+            height,
+            self.pixelscale,
+            ground,
+            ground_height,
+            self.buffer.data.dtype,
+        )
+        self.buffer.add_packed(verts, feature_offsets)
+        if self.indexed:
+            return [], []
+        levels = [height, ground_height] if ground else [height]
+        return transform.packed_4xn_to_lists(verts, feature_offsets, levels)
+
+    def get_shape(self, verts=None):
         """
         Get shape
-        Rescale boxes to specified scale
-        @Param verts, input boxes
-        @Param scale to use
+        Rescale extent of verts to specified scale
+        @Param verts, input boxes, defaults to all verts generated
         @Return rescaled boxes
         """
-        if len(verts) == 0:
+        buffer = self.buffer
+        if verts is not None:
+            buffer = geometry.GeometryBuffer()
+            buffer.add(transform.verts_to_poslist(verts))
+
+        if len(buffer) == 0:
             return [0, 0, 0]
 
-        poslist = transform.verts_to_poslist(verts)
-        high = [0, 0, 0]
-        low = poslist[0]
-
-        for pos in poslist:
-            if pos[0] > high[0]:
-                high[0] = pos[0]
-            if pos[1] > high[1]:
-                high[1] = pos[1]
-            if pos[2] > high[2]:
-                high[2] = pos[2]
-            if pos[0] < low[0]:
-                low[0] = pos[0]
-            if pos[1] < low[1]:
-                low[1] = pos[1]
-            if pos[2] < low[2]:
-                low[2] = pos[2]
+        high = np.maximum(buffer.high, 0)
+        low = buffer.low
 
         return [
             (high[0] - low[0]) * self.scale[0],
@@ -81,121 +167,201 @@ class Generator:
 
 
 class Floor(Generator):
-    def __init__(self, gray, path, scale, info=False):
-        super().__init__(gray, path, scale, info)
+    mesh_name = const.FLOOR_MESH
+
+    def __init__(
+        self,
+        gray,
+        path,
+        scale,
+        info=False,
+        indexed=False,
+        tolerance=0,
+        stage_cache=None,
+    ):
+        super().__init__(gray, path, scale, info, indexed, tolerance, stage_cache)
 
     def generate(self, gray, info=False):
 
         # detect outer Contours (simple floor or roof solution)
-        contour, _ = detect.outer_contours(gray)
-        # Create verts
-        self.verts = transform.scale_point_to_vector(
-            boxes=contour,
-            scale=self.scale,
-            pixelscale=self.pixelscale,
-            height=self.height,
+        contour, _ = cache.call(
+            self.stage_cache, "outer_contour", detect.outer_contours, gray
         )
-
-        # create faces
-        count = 0
-        for _ in self.verts:
-            self.faces.extend([(count)])
-            count += 1
+        contour = transform.simplify_box(contour, self.tolerance)
+        # Create verts
+        points, offsets = transform.pack_boxes([contour])
+        verts, _ = self.add_horizontal(points, offsets, self.height)
+        if not self.indexed:
+            self.verts = verts[0]
+            # create faces
+            self.faces = list(range(len(self.verts)))
+        self.amount = 1
 
         if info:
             print("Approximated apartment size : ", cv2.contourArea(contour))
 
-        IO.save_to_file(self.path + const.FLOOR_VERTS, self.verts, info)
-        IO.save_to_file(self.path + const.FLOOR_FACES, self.faces, info)
+        self.save_to_file(const.FLOOR_VERTS, self.verts, info)
+        self.save_to_file(const.FLOOR_FACES, self.faces, info)
 
-        return self.get_shape(self.verts)
+        return self.get_shape()
 
 
 class Wall(Generator):
-    def __init__(self, gray, path, scale, info=False):
-        super().__init__(gray, path, scale, info)
+    mesh_name = const.WALL_MESH
+
+    def __init__(
+        self,
+        gray,
+        path,
+        scale,
+        info=False,
+        indexed=False,
+        tolerance=0,
+        graph=False,
+        stage_cache=None,
+    ):
+        # build walls from centerline graph instead of detected outlines
+        self.graph = graph
+        super().__init__(gray, path, scale, info, indexed, tolerance, stage_cache)
 
     def generate(self, gray, info=False):
 
         # create wall image (filter out small objects from image)
-        wall_img = detect.wall_filter(gray)
+        wall_img = cache.call(self.stage_cache, "wall_mask", detect.wall_filter, gray)
 
         # detect walls
-        boxes, _ = detect.precise_boxes(wall_img)
+        if self.graph:
+            nodes, edges, thickness = cache.call(
+                self.stage_cache, "wall_graph", detect.wall_graph, wall_img
+            )
+            starts, ends, thickness = transform.wall_graph_runs(nodes, edges, thickness)
+            boxes = transform.wall_run_boxes(starts, ends, thickness)
+        else:
+            boxes, _ = cache.call(
+                self.stage_cache, "wall_boxes", detect.precise_boxes, wall_img
+            )
 
         # detect contour
-        contour, _ = detect.outer_contours(gray)
+        contour, _ = cache.call(
+            self.stage_cache, "outer_contour", detect.outer_contours, gray
+        )
 
-        # remove walls outside of contour
-        boxes = calculate.remove_walls_not_in_contour(boxes, contour)
+        if self.graph:
+            # runs are rectangles already, filters can only drop whole walls
+            keep = [
+                i
+                for i, box in enumerate(boxes)
+                if calculate.remove_walls_not_in_contour([box], contour)
+                and transform.simplify_boxes([box], self.tolerance)
+            ]
+            boxes = [boxes[i] for i in keep]
+            graph = transform.wall_runs_to_graph(
+                starts[keep], ends[keep], thickness[keep], self.pixelscale
+            )
+        else:
+            # remove walls outside of contour
+            boxes = calculate.remove_walls_not_in_contour(boxes, contour)
+            # merge collinear wall segments for lower levels of detail
+            boxes = transform.simplify_boxes(boxes, self.tolerance)
         # Convert boxes to verts and faces, vertically
-        self.verts, self.faces, wall_amount = transform.create_nx4_verts_and_faces(
-            boxes=boxes,
-            height=self.height,
-            scale=self.scale,
-            pixelscale=self.pixelscale,
-        )
+        points, offsets = transform.pack_boxes(boxes)
+        self.verts, self.faces = self.add_vertical(points, offsets, self.height)
 
+        self.amount = len(points)
         if info:
-            print("Walls created : ", wall_amount)
-
-        # One solution to get data to blender is to write and read from file.
-        IO.save_to_file(self.path + const.WALL_VERTICAL_VERTS, self.verts, info)
-        IO.save_to_file(self.path + const.WALL_VERTICAL_FACES, self.faces, info)
+            print("Walls created : ", self.amount)
+
+        if self.graph:
+            # centerline graph replaces wall verts and faces, blender builds
+            # the walls from it, see create_walls_from_graph
+            graph["height"] = self.height
+            graph["ground"] = const.WALL_GROUND
+            self.save_to_file(const.WALL_GRAPH, graph, info)
+        else:
+            # One solution to get data to blender is to write and read from file.
+            self.save_to_file(const.WALL_VERTICAL_VERTS, self.verts, info)
+            self.save_to_file(const.WALL_VERTICAL_FACES, self.faces, info)
 
         # Same but horizontally
-        self.verts, self.faces, wall_amount = transform.create_4xn_verts_and_faces(
-            boxes=boxes,
-            height=self.height,
-            scale=self.scale,
-            pixelscale=self.pixelscale,
-            ground=True,
+        self.verts, self.faces = self.add_horizontal(
+            points, offsets, self.height, ground=True
         )
 
-        # One solution to get data to blender is to write and read from file.
-        IO.save_to_file(self.path + const.WALL_HORIZONTAL_VERTS, self.verts, info)
-        IO.save_to_file(self.path + const.WALL_HORIZONTAL_FACES, self.faces, info)
+        if not self.graph:
+            # One solution to get data to blender is to write and read from file.
+            self.save_to_file(const.WALL_HORIZONTAL_VERTS, self.verts, info)
+            self.save_to_file(const.WALL_HORIZONTAL_FACES, self.faces, info)
 
-        return self.get_shape(self.verts)
+        return self.get_shape()
 
 
 class Room(Generator):
-    def __init__(self, gray, path, scale, info=False):
+    mesh_name = const.ROOM_MESH
+
+    def __init__(
+        self,
+        gray,
+        path,
+        scale,
+        info=False,
+        indexed=False,
+        tolerance=0,
+        stage_cache=None,
+    ):
         self.height = (
             const.WALL_HEIGHT - const.ROOM_FLOOR_DISTANCE
         )  # place room slightly above floor
-        super().__init__(gray, path, scale, info)
+        super().__init__(gray, path, scale, info, indexed, tolerance, stage_cache)
 
     def generate(self, gray, info=False):
-        gray = detect.wall_filter(gray)
+        gray = cache.call(self.stage_cache, "wall_mask", detect.wall_filter, gray)
         gray = ~gray
-        rooms, colored_rooms = detect.find_rooms(gray.copy())
+        # rooms as one label image, not one full size mask per room
+        rooms, colored_rooms = cache.call(
+            self.stage_cache,
+            "rooms",
+            functools.partial(detect.find_rooms, labeled=True),
+            gray.copy(),
+        )
         gray_rooms = cv2.cvtColor(colored_rooms, cv2.COLOR_BGR2GRAY)
 
         # get box positions for rooms
         boxes, gray_rooms = detect.precise_boxes(gray_rooms, gray_rooms)
+        boxes = transform.simplify_boxes(boxes, self.tolerance)
 
-        self.verts, self.faces, counter = transform.create_4xn_verts_and_faces(
-            boxes=boxes,
-            height=self.height,
-            scale=self.scale,
-            pixelscale=self.pixelscale,
-        )
+        points, offsets = transform.pack_boxes(boxes)
+        self.verts, self.faces = self.add_horizontal(points, offsets, self.height)
 
+        self.amount = len(boxes)
         if info:
-            print("Number of rooms detected : ", counter)
+            print("Number of rooms detected : ", self.amount)
 
-        IO.save_to_file(self.path + const.ROOM_VERTS, self.verts, info)
-        IO.save_to_file(self.path + const.ROOM_FACES, self.faces, info)
+        self.save_to_file(const.ROOM_VERTS, self.verts, info)
+        self.save_to_file(const.ROOM_FACES, self.faces, info)
 
-        return self.get_shape(self.verts)
+        return self.get_shape()
 
 
 class Door(Generator):
-    def __init__(self, gray, path, image_path, scale_factor, scale, info=False):
+    mesh_name = const.DOOR_MESH
+
+    def __init__(
+        self,
+        gray,
+        path,
+        image_path,
+        scale_factor,
+        scale,
+        info=False,
+        indexed=False,
+        detail_img=None,
+        stage_cache=None,
+    ):
         self.image_path = image_path
         self.scale_factor = scale_factor
-        super().__init__(gray, path, scale, info)
+        # shared grayscale image to match doors in, see detect.detail_image
+        self.detail_img = detail_img
+        super().__init__(gray, path, scale, info, indexed, stage_cache=stage_cache)
 
     def get_point_the_furthest_away(self, door_features, door_box):
         """
@@ -243,7 +409,15 @@ class Door(Generator):
 
     def generate(self, gray, info=False):
 
-        doors = detect.doors(self.image_path, self.scale_factor)
+        doors = cache.call(
+            self.stage_cache,
+            "doors",
+            detect.doors,
+            self.image_path,
+            self.scale_factor,
+            self.detail_img,
+            key=detail_key(self.image_path, self.scale_factor, self.detail_img),
+        )
 
         door_contours = []
         # get best door shapes!
@@ -295,102 +469,96 @@ class Door(Generator):
             draw.image(img)
 
         # Create verts for door
+        points, offsets = transform.pack_boxes(door_contours)
+        self.verts, self.faces = self.add_vertical(points, offsets, self.height)
 
-        self.verts, self.faces, door_amount = transform.create_nx4_verts_and_faces(
-            boxes=door_contours,
-            height=self.height,
-            scale=self.scale,
-            pixelscale=self.pixelscale,
-        )
-
+        self.amount = int(len(points) / 4)
         if info:
-            print("Doors created : ", int(door_amount / 4))
+            print("Doors created : ", self.amount)
 
-        IO.save_to_file(self.path + "door_vertical_verts", self.verts, info)
-        IO.save_to_file(self.path + "door_vertical_faces", self.faces, info)
+        self.save_to_file("door_vertical_verts", self.verts, info)
+        self.save_to_file("door_vertical_faces", self.faces, info)
 
-        self.verts, self.faces, door_amount = transform.create_4xn_verts_and_faces(
-            boxes=door_contours,
-            height=self.height,
-            scale=self.scale,
-            pixelscale=self.pixelscale,
-            ground=True,
-            ground_height=const.WALL_GROUND,
+        self.verts, self.faces = self.add_horizontal(
+            points, offsets, self.height, ground=True, ground_height=const.WALL_GROUND
         )
 
         # One solution to get data to blender is to write and read from file.
-        IO.save_to_file(self.path + "door_horizontal_verts", self.verts, info)
-        IO.save_to_file(self.path + "door_horizontal_faces", self.faces, info)
+        self.save_to_file("door_horizontal_verts", self.verts, info)
+        self.save_to_file("door_horizontal_faces", self.faces, info)
 
-        return self.get_shape(self.verts)
+        return self.get_shape()
 
 
 class Window(Generator):
     # TODO: also fill small gaps between windows and walls
     # TODO: also add verts for filling gaps
-
-    def __init__(self, gray, path, image_path, scale_factor, scale, info=False):
+    mesh_name = const.WINDOW_MESH
+
+    def __init__(
+        self,
+        gray,
+        path,
+        image_path,
+        scale_factor,
+        scale,
+        info=False,
+        indexed=False,
+        detail_img=None,
+        stage_cache=None,
+    ):
         self.image_path = image_path
         self.scale_factor = scale_factor
         self.scale = scale
-        super().__init__(gray, path, scale, info)
+        # shared grayscale image to match windows in, see detect.detail_image
+        self.detail_img = detail_img
+        super().__init__(gray, path, scale, info, indexed, stage_cache=stage_cache)
 
     def generate(self, gray, info=False):
-        windows = detect.windows(self.image_path, self.scale_factor)
+        windows = cache.call(
+            self.stage_cache,
+            "windows",
+            detect.windows,
+            self.image_path,
+            self.scale_factor,
+            self.detail_img,
+            key=detail_key(self.image_path, self.scale_factor, self.detail_img),
+        )
 
         # Create verts for window, vertical
-        v, self.faces, window_amount1 = transform.create_nx4_verts_and_faces(
-            boxes=windows,
-            height=const.WINDOW_MIN_MAX_GAP[0],
-            scale=self.scale,
-            pixelscale=self.pixelscale,
-            ground=0,
+        points, offsets = transform.pack_boxes(windows)
+        v, self.faces = self.add_vertical(
+            points, offsets, const.WINDOW_MIN_MAX_GAP[0], ground=0
         )  # create low piece
-        v2, self.faces, window_amount2 = transform.create_nx4_verts_and_faces(
-            boxes=windows,
-            height=self.height,
-            scale=self.scale,
-            pixelscale=self.pixelscale,
-            ground=const.WINDOW_MIN_MAX_GAP[1],
+        v2, self.faces = self.add_vertical(
+            points, offsets, self.height, ground=const.WINDOW_MIN_MAX_GAP[1]
         )  # create higher piece
 
-        self.verts = v
-        self.verts.extend(v2)
-        parts_per_window = 2
-        window_amount = len(v) / parts_per_window
-
+        self.verts = v + v2
+        self.amount = len(windows)
         if info:
-            print("Windows created : ", int(window_amount))
+            print("Windows created : ", self.amount)
 
-        IO.save_to_file(self.path + const.WINDOW_VERTICAL_VERTS, self.verts, info)
-        IO.save_to_file(self.path + const.WINDOW_VERTICAL_FACES, self.faces, info)
+        self.save_to_file(const.WINDOW_VERTICAL_VERTS, self.verts, info)
+        self.save_to_file(const.WINDOW_VERTICAL_FACES, self.faces, info)
 
         # horizontal
-
-        v, f, _ = transform.create_4xn_verts_and_faces(
-            boxes=windows,
-            height=self.height,
-            scale=self.scale,
-            pixelscale=self.pixelscale,
-            ground=True,
-            ground_height=const.WALL_GROUND,
+        v, f = self.add_horizontal(
+            points, offsets, self.height, ground=True, ground_height=const.WALL_GROUND
         )
-        v2, f2, _ = transform.create_4xn_verts_and_faces(
-            boxes=windows,
-            height=const.WINDOW_MIN_MAX_GAP[0],
-            scale=self.scale,
-            pixelscale=self.pixelscale,
+        v2, f2 = self.add_horizontal(
+            points,
+            offsets,
+            const.WINDOW_MIN_MAX_GAP[0],
             ground=True,
             ground_height=const.WINDOW_MIN_MAX_GAP[1],
         )
 
-        self.verts = v
-        self.verts.extend(v2)
-        self.faces = f
-        self.faces.extend(f2)
+        self.verts = v + v2
+        self.faces = f + f2
 
         # One solution to get data to blender is to write and read from file.
-        IO.save_to_file(self.path + const.WINDOW_HORIZONTAL_VERTS, self.verts, info)
-        IO.save_to_file(self.path + const.WINDOW_HORIZONTAL_FACES, self.faces, info)
+        self.save_to_file(const.WINDOW_HORIZONTAL_VERTS, self.verts, info)
+        self.save_to_file(const.WINDOW_HORIZONTAL_FACES, self.faces, info)
 
-        return self.get_shape(self.verts)
+        return self.get_shape()
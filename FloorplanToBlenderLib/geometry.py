@@ -0,0 +1,183 @@
+import numpy as np
+
+from . import const
+
+"""
+Geometry
+This file contains array backed storage of generated geometry.
+Vertices of all features are packed in one preallocated array,
+feature i owns rows offsets[i] to offsets[i + 1].
+Faces are kept per feature as index arrays into the packed vertices.
+
+FloorplanToBlender3d
+Copyright (C) 2022 Daniel Westberg
+"""
+
+
+class GeometryBuffer:
+    def __init__(self, capacity=const.GEOMETRY_BUFFER_CAPACITY, dtype=np.float64):
+        self.data = np.empty((capacity, 3), dtype=dtype)
+        self.offsets = [0]
+        self.faces = []  # per feature (k,m) array of polygons with global indices
+        self.reset_extent()
+
+    def __len__(self):
+        """Amount of vertices in buffer"""
+        return self.offsets[-1]
+
+    @property
+    def verts(self):
+        """All vertices as (V,3) array view"""
+        return self.data[: len(self)]
+
+    @property
+    def features(self):
+        """Amount of features in buffer"""
+        return len(self.offsets) - 1
+
+    def reserve(self, size):
+        """
+        Make room for size more vertices, grow allocation by doubling
+        @Param size, amount of vertices to fit
+        """
+        needed = len(self) + size
+        if needed <= len(self.data):
+            return
+        capacity = max(len(self.data), 1)
+        while capacity < needed:
+            capacity *= 2
+        data = np.empty((capacity, 3), dtype=self.data.dtype)
+        data[: len(self)] = self.verts
+        self.data = data
+
+    def add(self, points, face=None):
+        """
+        Add feature
+        @Param points, vertices of feature, anything convertible to (N,3) array
+        @Param face, polygon repeated for every len(face) vertices,
+        such as (0, 1, 3, 2) for walls, default is one polygon of all vertices
+        @Return index of feature
+        """
+        points = np.asarray(points, dtype=self.data.dtype).reshape(-1, 3)
+        self.reserve(len(points))
+        start = len(self)
+        self.data[start : start + len(points)] = points
+        self.offsets.append(start + len(points))
+        if face is None:
+            local = np.arange(len(points)).reshape(1, -1)
+        else:
+            face = np.asarray(face)
+            repeats = np.arange(len(points) // len(face)).reshape(-1, 1)
+            local = face + len(face) * repeats
+        self.faces.append(local + start)
+        if len(points) > 0:
+            # accumulate extent while adding, no pass over all verts needed
+            self.low = np.minimum(self.low, points.min(axis=0))
+            self.high = np.maximum(self.high, points.max(axis=0))
+        return self.features - 1
+
+    def add_packed(self, points, offsets, faces=None):
+        """
+        Add features of one packed array, see transform.create_*_packed
+        All vertices are copied at once, not feature by feature.
+        @Param points, (V,3) array of vertices of all features
+        @Param offsets, feature i has vertices offsets[i] to offsets[i + 1]
+        @Param faces, (k,m) array of polygons indexing points, in feature order,
+        default is one polygon of all vertices of each feature
+        """
+        points = np.asarray(points, dtype=self.data.dtype).reshape(-1, 3)
+        offsets = np.asarray(offsets)
+        self.reserve(len(points))
+        start = len(self)
+        self.data[start : start + len(points)] = points
+        self.offsets.extend((offsets[1:] + start).tolist())
+        if faces is None:
+            indices = np.arange(start, start + len(points))
+            self.faces.extend(
+                indices[begin:end].reshape(1, -1)
+                for begin, end in zip(offsets[:-1], offsets[1:])
+            )
+        else:
+            faces = np.asarray(faces)
+            # polygon belongs to the feature of its first vertex
+            splits = np.searchsorted(faces[:, 0], offsets[1:-1])
+            self.faces.extend(np.split(faces + start, splits))
+        if len(points) > 0:
+            self.low = np.minimum(self.low, points.min(axis=0))
+            self.high = np.maximum(self.high, points.max(axis=0))
+
+    def extend(self, features, face=None):
+        """
+        Add several features
+        @Param features, list of vertices per feature
+        @Param face, see add
+        """
+        for points in features:
+            self.add(points, face)
+
+    def feature(self, index):
+        """
+        Get feature
+        @Return (N,3) array view of feature vertices
+        """
+        return self.data[self.offsets[index] : self.offsets[index + 1]]
+
+    def reset_extent(self):
+        self.low = np.full(3, np.inf)
+        self.high = np.full(3, -np.inf)
+
+    def clear(self):
+        """Remove all features, keep allocation for reuse"""
+        self.offsets = [0]
+        self.faces = []
+        self.reset_extent()
+
+    def weld(self, tolerance=const.WELD_TOLERANCE):
+        """
+        Create one indexed mesh of all features
+        @Param tolerance, see weld_vertices
+        @Return verts, faces
+        """
+        return weld_vertices(self.verts, self.faces, tolerance)
+
+
+def weld_vertices(verts, faces, tolerance=const.WELD_TOLERANCE):
+    """
+    Weld vertices
+    Merge vertices closer than tolerance and remap faces to the shared vertices.
+    Polygons collapsing to less than 3 vertices and duplicated polygons are dropped.
+    @Param verts, (V,3) array
+    @Param faces, list of (k,m) index arrays, polygons with m corners
+    @Param tolerance, grid size vertices are snapped to before comparing
+    @Return verts - as (W,3) array, faces - as list of polygons, each a list of indices
+    """
+    verts = np.asarray(verts)
+    if len(verts) == 0:
+        return verts.reshape(0, 3), []
+
+    keys = np.round(verts / tolerance).astype(np.int64)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    res = []
+    seen = set()
+    for polygons in faces:
+        polygons = inverse[np.asarray(polygons)]
+        if polygons.size == 0:
+            continue
+        # only polygons with welded neighbours need to be inspected one by one
+        collapsed = (polygons == np.roll(polygons, 1, axis=1)).any(axis=1)
+        for polygon, has_duplicates in zip(polygons.tolist(), collapsed):
+            if has_duplicates:
+                polygon = [
+                    index for i, index in enumerate(polygon) if index != polygon[i - 1]
+                ]
+                if len(polygon) < 3:
+                    continue
+            key = tuple(sorted(polygon))
+            if key in seen:
+                continue
+            seen.add(key)
+            res.append(polygon)
+
+    return verts[first], res
@@ -1,6 +1,5 @@
 import cv2
 import numpy as np
-from PIL import Image
 from . import calculate
 from . import const
 
@@ -15,6 +14,8 @@ Copyright (C) 2022 Daniel Westberg
 
 
 def pil_rescale_image(image, factor):
+    from PIL import Image  # only loaded when pil images are used
+
     width, height = image.size
     return image.resize((int(width * factor), int(height * factor)), resample=Image.BOX)
 
@@ -0,0 +1,191 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from . import const
+
+"""
+Metrics
+This file contains counters, gauges and latency histograms for the pipeline.
+Stages of the library record their timings here, so they are available
+to all users of the library. Export in Prometheus text format with export().
+
+FloorplanToBlender3d
+Copyright (C) 2022 Daniel Westberg
+"""
+
+lock = threading.Lock()
+counters = dict()  # (name, labels) -> value
+gauges = dict()  # (name, labels) -> value
+histograms = dict()  # (name, labels) -> Histogram
+descriptions = dict()  # name -> help text
+
+
+class Histogram:
+    """Cumulative latency histogram with fixed upper bounds"""
+
+    def __init__(self, buckets=const.METRICS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def labels_key(labels):
+    """Labels as hashable and sorted tuple"""
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def describe(name, text):
+    """Set help text of metric"""
+    descriptions[name] = text
+
+
+def increment(name, value=1, **labels):
+    """Increase counter name with labels by value"""
+    key = (name, labels_key(labels))
+    with lock:
+        counters[key] = counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Set gauge name with labels to value"""
+    with lock:
+        gauges[(name, labels_key(labels))] = value
+
+
+def observe(name, value, **labels):
+    """Add value to histogram name with labels"""
+    key = (name, labels_key(labels))
+    with lock:
+        if key not in histograms:
+            histograms[key] = Histogram()
+        histograms[key].observe(value)
+
+
+@contextmanager
+def timer(name=const.METRICS_STAGE, **labels):
+    """
+    Time code block in seconds
+    @Param name, histogram to add time to
+    @Param labels, such as stage="denoise"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(stage, name=const.METRICS_STAGE):
+    """
+    Decorator timing each call of function as stage
+    @Param stage, name of stage label
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, stage=stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_histogram(name, **labels):
+    """
+    Get histogram
+    @Return Histogram or None if nothing observed yet
+    """
+    with lock:
+        return histograms.get((name, labels_key(labels)))
+
+
+def reset():
+    """Remove all recorded metrics"""
+    with lock:
+        counters.clear()
+        gauges.clear()
+        histograms.clear()
+
+
+def format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if len(labels) == 0:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            key + '="' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+            for key, value in labels
+        )
+        + "}"
+    )
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def export():
+    """
+    Export all metrics
+    @Return string in Prometheus text exposition format
+    """
+    lines = []
+    with lock:
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({name for name, _ in values}):
+                if name in descriptions:
+                    lines.append("# HELP " + name + " " + descriptions[name])
+                lines.append("# TYPE " + name + " " + kind)
+                for (other, labels), value in sorted(values.items()):
+                    if other == name:
+                        lines.append(
+                            name + format_labels(labels) + " " + format_value(value)
+                        )
+
+        for name in sorted({name for name, _ in histograms}):
+            if name in descriptions:
+                lines.append("# HELP " + name + " " + descriptions[name])
+            lines.append("# TYPE " + name + " histogram")
+            for (other, labels), hist in sorted(histograms.items(), key=lambda i: i[0]):
+                if other != name:
+                    continue
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(
+                        name
+                        + "_bucket"
+                        + format_labels(labels, [("le", format_value(bound))])
+                        + " "
+                        + str(count)
+                    )
+                lines.append(
+                    name
+                    + "_bucket"
+                    + format_labels(labels, [("le", "+Inf")])
+                    + " "
+                    + str(hist.count)
+                )
+                lines.append(
+                    name + "_sum" + format_labels(labels) + " " + repr(hist.sum)
+                )
+                lines.append(
+                    name + "_count" + format_labels(labels) + " " + str(hist.count)
+                )
+    return "\n".join(lines) + "\n"
+
+
+describe(const.METRICS_STAGE, "Time spent in each floorplan pipeline stage.")
@@ -0,0 +1,183 @@
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from . import const
+
+"""
+Retention
+This file contains size and age bounded retention of generated files,
+such as floorplan data folders and created objects.
+A retained folder may contain another one, such as BATCH_DATA_PATH in BASE_PATH.
+Each file or folder directly below a retained folder is an entry, its
+modification time is the last time it was used, see touch.
+Entries used by running jobs are never removed, see use.
+
+FloorplanToBlender3d
+Copyright (C) 2022 Daniel Westberg
+"""
+
+lock = threading.Lock()
+in_use = dict()  # absolute path -> amount of jobs using it
+
+
+def touch(path):
+    """Mark entry as recently used"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass  # already removed
+
+
+def hold(*paths):
+    """
+    Keep entries until released, see use
+    @Param paths, entries that may not exist yet
+    """
+    with lock:
+        for path in paths:
+            key = os.path.abspath(path)
+            in_use[key] = in_use.get(key, 0) + 1
+
+
+def release(*paths):
+    """Let entries kept by hold be removed again, marked as recently used"""
+    with lock:
+        for path in paths:
+            key = os.path.abspath(path)
+            in_use[key] -= 1
+            if in_use[key] == 0:
+                del in_use[key]
+    for path in paths:
+        touch(path)
+
+
+@contextmanager
+def use(*paths):
+    """
+    Keep entries while code block runs, such as data and objects of a job
+    @Param paths, entries that may not exist yet
+    """
+    hold(*paths)
+    try:
+        yield
+    finally:
+        release(*paths)
+
+
+def is_in_use(path):
+    with lock:
+        return os.path.abspath(path) in in_use
+
+
+def entry_size(path):
+    """Size in bytes of file or all files below folder"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue  # removed while walking
+    return size
+
+
+def remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class Retention:
+    """
+    Remove least recently used entries of folders above max_bytes in total,
+    and entries not used in max_age seconds
+    """
+
+    def __init__(
+        self,
+        folders,
+        max_bytes=const.RETENTION_MAX_BYTES,
+        max_age=const.RETENTION_MAX_AGE,
+        on_evict=None,
+    ):
+        self.folders = folders
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # called with list of removed paths after each eviction removing any
+        self.on_evict = on_evict
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def entries(self):
+        """
+        @Return list of (last used, size, path), least recently used first
+        """
+        res = []
+        # retained folders inside retained folders hold entries, aren't entries
+        folders = set(os.path.abspath(folder) for folder in self.folders)
+        for folder in self.folders:
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if os.path.abspath(path) in folders:
+                    continue
+                try:
+                    res.append((os.path.getmtime(path), entry_size(path), path))
+                except OSError:
+                    continue  # removed by another process
+        return sorted(res)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, now=None):
+        """
+        Remove expired entries, then least recently used until folders fit max_bytes
+        Entries in use are kept even if folders don't fit.
+        @Return list of removed paths
+        """
+        if now is None:
+            now = time.time()
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for last_used, size, path in entries:
+            expired = self.max_age is not None and now - last_used > self.max_age
+            if not expired and total <= self.max_bytes:
+                continue
+            if is_in_use(path):
+                continue
+            remove(path)
+            removed.append(path)
+            total -= size
+        if removed and self.on_evict is not None:
+            self.on_evict(removed)
+        return removed
+
+    def start(self, interval=const.RETENTION_INTERVAL):
+        """Evict in a background thread every interval seconds"""
+
+        def run():
+            while not self.stopped.wait(interval):
+                self.evict()
+
+        self.stopped.clear()
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -1,8 +1,14 @@
+import ast
+import inspect
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
 from . import IO
 from . import execution
 from . import const
 from . import floorplan
 from . import transform
+from . import generate
 
 import numpy as np
 
@@ -14,58 +20,157 @@ FloorplanToBlender3d
 Copyright (C) 2022 Daniel Westberg
 """
 
+COMMANDS = ("CLEAR", "SEPARATE", "FILE", "ADD")
+
 
-def parse_stacking_file(path):
+def parse_stacking_file(path, workers=None):
     """
     Parse strictly formated stacking files.
     These are used to more easily place many floorplans in one scene.
+    @Param path, path to stacking file
+    @Param workers, processes generating data, defaults to one per cpu
+    @Return paths to data, lists of paths for separated worlds
     """
-    array_of_commands = IO.readlines_file(path)
+    return run_plan(compile_stacking_file(path), workers)
 
-    world = []
-    worlds = []
 
-    print("Building stack from file " + path)
+def parse_argument(token):
+    """
+    Parse one stacking file argument, such as 3, "x" or [0,0,0]
+    "_" means default value
+    @Return python value
+    """
+    if token == '"_"':
+        return None
+    return ast.literal_eval(token)
 
-    for index, line in enumerate(array_of_commands):
-        args = line.split(" ")
-        command = args[0]
 
-        if command[0] in ["#", "\n", "", " "]:  # ignore commented lines
+def compile_stacking_file(path):
+    """
+    Compile stacking file into a plan of commands, nothing is run yet.
+    Files referenced by FILE commands are compiled into the plan too.
+    @Param path, path to stacking file
+    @Return list of (command, arguments)
+    """
+    print("Building stack from file " + path)
+
+    plan = []
+    for number, line in enumerate(IO.readlines_file(path), start=1):
+        tokens = line.split()
+        if len(tokens) == 0 or tokens[0][0] == "#":  # ignore commented lines
             continue
 
+        command = tokens[0]
+        if command not in COMMANDS:
+            raise ValueError(
+                path + ":" + str(number) + " unknown command " + repr(command)
+            )
         try:
-            args.remove("\n")
-        except Exception:
-            pass
-
-        new_args = []
-        for cmd in args:
-            if cmd == '"_"':
-                new_args.append("None")
-            else:
-                new_args.append(cmd)
-        args = new_args
-
-        argstring = ""
-        for index, arg in enumerate(args[1:]):
-            if index == len(args[1:]) - 1:
-                argstring += arg
-            else:
-                argstring += arg + ","
-
-        print(">Line", index, "Command:", command + "(" + argstring + ")")
-
-        if command == "SEPARATE":
-            worlds.append(world)
+            args = [parse_argument(token) for token in tokens[1:]]
+        except (ValueError, SyntaxError):
+            raise ValueError(
+                path + ":" + str(number) + " invalid arguments " + repr(line.strip())
+            )
+
+        if command == "FILE":
+            args = [compile_stacking_file(*args)]
+        plan.append((command, args))
+    return plan
+
+
+def plan_segments(plan, segments=None):
+    """
+    Split ADD commands of plan, including inner files, at each CLEAR
+    @Return list of list of ADD arguments
+    """
+    if segments is None:
+        segments = [[]]
+    for command, args in plan:
+        if command == "CLEAR":
+            segments.append([])
+        elif command == "ADD":
+            segments[-1].append(args)
+        elif command == "FILE":
+            plan_segments(args[0], segments)
+    return segments
+
+
+def prepare_segment(adds, staging, workers=None):
+    """
+    Generate data of every distinct floorplan in ADD commands in parallel.
+    Placement only needs the shapes, so it can follow in a cheap second pass.
+    @Param adds, list of ADD arguments
+    @Param staging, folder to generate data in
+    @Param workers, amount of processes
+    @Return dict of (image path, lod) -> (path, shape), see generate.generate_all_files
+    """
+    jobs = dict()
+    for args in adds:
+        # name arguments like ADD does
+        add = inspect.signature(ADD).bind(*args)
+        add.apply_defaults()
+        arguments = add.arguments
+
+        conf = arguments["config"]
+        if conf is None:
+            conf = const.IMAGE_DEFAULT_CONFIG_FILE_NAME
+        lod = arguments["lod"]
+        if lod is None:
+            lod = const.STACKING_LOD
+
+        # first floorplan of each image and lod generates data for all others
+        f = new_floorplans(conf, arguments["image_path"], 1)[0]
+        key = (f.image_path, lod)
+        if key in jobs or IO.find_reuseable_data(f.image_path, const.BASE_PATH, lod)[0]:
+            continue
+        worldscale = transform.list_to_nparray(arguments["worldscale"])
+        path = tempfile.mkdtemp(dir=staging) + "/"
+        jobs[key] = (f, path, False, worldscale, lod)
+
+    if len(jobs) < 2:
+        return {key: generate.prepare_data(*job) for key, job in jobs.items()}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            key: pool.submit(generate.prepare_data, *job) for key, job in jobs.items()
+        }
+        return {key: future.result() for key, future in futures.items()}
+
+
+def run_plan(plan, workers=None):
+    """
+    Run compiled stacking plan
+    Data of distinct floorplans is generated in parallel first,
+    then floorplans are placed in order, same as running each command in turn.
+    @Param plan, see compile_stacking_file
+    @Param workers, processes generating data, defaults to one per cpu
+    @Return paths to data, lists of paths for separated worlds
+    """
+    segments = iter(plan_segments(plan))
+
+    with tempfile.TemporaryDirectory() as staging:
+        prepared = prepare_segment(next(segments), staging, workers)
+
+        def execute(plan):
             world = []
-        elif command == "CLEAR":
-            eval(command + "(" + argstring + ")")
-        else:
-            world.extend(eval(command + "(" + argstring + ")"))
+            worlds = []
+            for command, args in plan:
+                print(">Command:", command, args if command != "FILE" else "")
+                if command == "SEPARATE":
+                    worlds.append(world)
+                    world = []
+                elif command == "CLEAR":
+                    CLEAR()
+                    prepared.clear()
+                    prepared.update(prepare_segment(next(segments), staging, workers))
+                elif command == "FILE":
+                    world.extend(execute(args[0]))
+                else:
+                    world.extend(ADD(*args, prepared=prepared))
+            worlds.extend(world)
+            return worlds
 
-    worlds.extend(world)
-    return worlds
+        return execute(plan)
 
 
 def CLEAR():
@@ -80,6 +185,19 @@ def FILE(stacking_file_path):
     return parse_stacking_file(stacking_file_path)
 
 
+def new_floorplans(config, image_path, amount):
+    """
+    Create floorplans from config, optionally replacing image path
+    """
+    floorplans = []
+    for _ in range(amount):
+        f = floorplan.new_floorplan(config)
+        if image_path is not None:  # replace all image paths
+            f.image_path = image_path
+        floorplans.append(f)
+    return floorplans
+
+
 def ADD(
     config=None,
     image_path=None,
@@ -92,9 +210,13 @@ def ADD(
     amount_per_level=None,
     radie=None,
     degree=None,
+    lod=None,
+    prepared=None,
 ):
     """
     Add floorplan to configuration
+    Stacked floorplans use a lower level of detail, const.STACKING_LOD, by default
+    @Param prepared, data generated ahead, see prepare_segment
     """
     conf = config
     if config is None:
@@ -103,17 +225,10 @@ def ADD(
     if amount is None:
         amount = 1
 
-    floorplans = []
-    for _ in range(amount):
-        floorplans.append(floorplan.new_floorplan(conf))
+    if lod is None:
+        lod = const.STACKING_LOD
 
-    if image_path is not None:  # replace all image paths
-        new_floorplans = []
-        for f in floorplans:
-            tmp_f = f
-            tmp_f.image_path = image_path
-            new_floorplans.append(tmp_f)
-        floorplans = new_floorplans
+    floorplans = new_floorplans(conf, image_path, amount)
 
     dir = 1
     if mode is None:
@@ -137,6 +252,8 @@ def ADD(
             ),
             world_scale=transform.list_to_nparray(worldscale),
             margin=transform.list_to_nparray(margin, np.array([0, 0, 0])),
+            lod=lod,
+            prepared=prepared,
         )
     else:
         return execution.multiple_axis(
@@ -147,4 +264,6 @@ def ADD(
             transform.list_to_nparray(worldpositionoffset, np.array([0, 0, 0])),
             transform.list_to_nparray(worldrotationoffset, np.array([0, 0, 0])),
             transform.list_to_nparray(worldscale),
+            lod,
+            prepared,
         )
@@ -0,0 +1,156 @@
+import itertools
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from . import const
+from . import floorplan
+from . import generate
+
+"""
+Sweep
+This file contains a parameter sweep of detection thresholds in const.
+Every combination of a grid is generated through a shared stage cache,
+so stages whose thresholds are the same in two variants only run once,
+for example one wall_filter for many find_rooms settings.
+The first variant warms the cache, the rest run in a process pool.
+
+FloorplanToBlender3d
+Copyright (C) 2022 Daniel Westberg
+"""
+
+# Features counted per variant, in table order
+FEATURES = (
+    const.STR_FLOORS,
+    const.STR_WALLS,
+    const.STR_ROOMS,
+    const.STR_WINDOWS,
+    const.STR_DOORS,
+)
+
+
+def grid(parameters):
+    """
+    Expand parameter grid
+    @Param parameters, dict of const name -> list of values
+    @Return list of dicts of const name -> value, one per combination
+    """
+    for name in parameters:
+        if not name.isupper() or not hasattr(const, name):
+            raise ValueError("Unknown const parameter : " + str(name))
+    names = list(parameters)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(parameters[name] for name in names))
+    ]
+
+
+def run_variant(image_path, config_path, values, cache_path):
+    """
+    Generate data of one variant, run in worker process
+    Values are set in const of the worker, each variant sets all swept names.
+    @Param values, dict of const name -> value
+    @Param cache_path, stage cache shared by all variants
+    @Return row dict with values, counts, seconds and stage timings
+    """
+    start = time.perf_counter()
+    for name, value in values.items():
+        setattr(const, name, value)
+    const.STAGE_CACHE_PATH = cache_path
+
+    f = floorplan.new_floorplan(config_path)
+    f.image_path = image_path
+    setattr(f, const.STR_STAGE_CACHE, True)
+
+    # data files of variants are not kept, only their counts
+    path = tempfile.mkdtemp(prefix="sweep_") + "/"
+    counts = dict()
+    timings = dict()
+    try:
+        generate.generate_data(
+            f,
+            path,
+            f.scale,
+            False,
+            generate.get_tolerance(f),
+            timings=timings,
+            counts=counts,
+        )
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    return {
+        "values": values,
+        "counts": counts,
+        "seconds": time.perf_counter() - start,
+        "timings": {name: end - begin for name, (begin, end) in timings.items()},
+    }
+
+
+def run(
+    image_path,
+    parameters,
+    config_path=None,
+    workers=None,
+    cache_path=const.SWEEP_CACHE_PATH,
+):
+    """
+    Sweep detection thresholds on one image
+    @Param parameters, dict of const name -> list of values, see grid
+    @Param config_path, floorplan config used for all variants
+    @Param workers, processes, defaults to one per cpu
+    @Param cache_path, stage cache folder, kept so later sweeps reuse it
+    @Return list of rows in grid order, see run_variant
+    """
+    if config_path is None:
+        config_path = const.IMAGE_DEFAULT_CONFIG_FILE_NAME
+    variants = grid(parameters)
+    if len(variants) == 0:
+        return []
+
+    rows = [None] * len(variants)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # first variant fills the cache with every stage, so the others
+        # only rerun stages depending on a swept value
+        rows[0] = pool.submit(
+            run_variant, image_path, config_path, variants[0], cache_path
+        ).result()
+
+        running = {
+            pool.submit(run_variant, image_path, config_path, values, cache_path): index
+            for index, values in enumerate(variants)
+            if index > 0
+        }
+        while running:
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                rows[running.pop(future)] = future.result()
+    return rows
+
+
+def table(rows):
+    """
+    Format sweep result
+    @Param rows, see run
+    @Return string with one line per variant of values, feature counts and seconds
+    """
+    if len(rows) == 0:
+        return ""
+    names = list(rows[0]["values"])
+    features = [name for name in FEATURES if name in rows[0]["counts"]]
+    header = names + features + ["seconds"]
+    lines = [
+        [str(row["values"][name]) for name in names]
+        + [str(row["counts"][name]) for name in features]
+        + ["%.2f" % row["seconds"]]
+        for row in rows
+    ]
+    widths = [
+        max(len(line[column]) for line in [header] + lines)
+        for column in range(len(header))
+    ]
+    return "\n".join(
+        "  ".join(value.rjust(width) for value, width in zip(line, widths))
+        for line in [header] + lines
+    )
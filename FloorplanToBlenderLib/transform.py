@@ -93,15 +93,21 @@ def flatten_iterative_safe(thelist, res):
     @Param thelist, incoming list
     @Param res, resulting list, preferably []
     """
-    if not thelist or not isinstance(thelist, list):
+    if not isinstance(thelist, list):
         return res
-    else:
-        if isinstance(thelist[0], int) or isinstance(thelist[0], float):
-            res.append(thelist[0])
-            return flatten_iterative_safe(thelist[1:], res)
+
+    # explicit stack of iterators, no recursion limit on deep or long lists
+    stack = [iter(thelist)]
+    while stack:
+        for element in stack[-1]:
+            if isinstance(element, int) or isinstance(element, float):
+                res.append(element)
+            elif isinstance(element, list):
+                stack.append(iter(element))
+                break
         else:
-            res.extend(flatten_iterative_safe(thelist[0], []))
-            return flatten_iterative_safe(thelist[1:], res)
+            stack.pop()
+    return res
 
 
 def verts_to_poslist(verts):
@@ -111,18 +117,198 @@ def verts_to_poslist(verts):
     @Param verts of undecided size
     @Return res, list of position
     """
-    list_of_elements = flatten_iterative_safe(verts, [])  # TODO: this stopped working!
+    list_of_elements = flatten_iterative_safe(verts, [])
+    return [list_of_elements[i : i + 3] for i in range(0, len(list_of_elements) - 2, 3)]
+
+
+def pack_boxes(boxes):
+    """
+    Pack boxes
+    Concatenate 2d points of all boxes into one array
+    @Param boxes, list of contours, each as (N,1,2) or (N,2)
+    @Return points - as (P,2) array, offsets - box i has points offsets[i] to offsets[i+1]
+    """
+    parts = [np.asarray(box).reshape(-1, 2) for box in boxes]
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    if len(parts) == 0:
+        return np.zeros((0, 2)), offsets
+    offsets[1:] = np.cumsum([len(part) for part in parts])
+    return np.concatenate(parts), offsets
+
+
+def simplify_box(box, tolerance):
+    """
+    Simplify box
+    Merge nearly collinear points and drop edges shorter than tolerance
+    @Param box, closed contour as (N,1,2) array
+    @Param tolerance, in pixels, box is returned unchanged if not above 0
+    @Return simplified contour as (M,1,2) array
+    """
+    if tolerance <= 0:
+        return box
+
+    box = np.asarray(box)
+    if box.dtype != np.int32:
+        box = box.astype(np.float32)
+
+    # merge collinear points, Douglas-Peucker with absolute tolerance
+    points = cv2.approxPolyDP(box, tolerance, True).reshape(-1, 2)
+
+    # drop degenerate edges, compare to last kept point so short edges can't add up
+    kept = [points[0]]
+    for point in points[1:]:
+        if np.hypot(*(point - kept[-1])) >= tolerance:
+            kept.append(point)
+    if len(kept) > 1 and np.hypot(*(kept[-1] - kept[0])) < tolerance:
+        kept.pop()
+
+    # removing points can leave new collinear points behind
+    return cv2.approxPolyDP(
+        np.array(kept, dtype=box.dtype).reshape(-1, 1, 2), tolerance, True
+    )
+
+
+def simplify_boxes(boxes, tolerance, min_area=const.SIMPLIFY_MIN_AREA):
+    """
+    Simplify boxes
+    Simplification stage between detection and generation,
+    used to create levels of detail with fewer verts and faces
+    @Param boxes, list of contours
+    @Param tolerance, see simplify_box
+    @Param min_area, boxes collapsing to smaller area are dropped
+    @Return list of simplified contours
+    """
+    if tolerance <= 0:
+        return boxes
 
     res = []
-    i = 0
-    while i < len(list_of_elements) - 2:  # Might miss one vertex here!
-        res.append(
-            [list_of_elements[i], list_of_elements[i + 1], list_of_elements[i + 2]]
-        )
-        i += 3
+    for box in boxes:
+        box = simplify_box(box, tolerance)
+        if len(box) >= 3 and cv2.contourArea(box) >= min_area:
+            res.append(box)
     return res
 
 
+def lod_tolerance(tolerances, lod):
+    """
+    Get simplification tolerance of level of detail
+    Levels above the last configured level use the last tolerance
+    @Param tolerances, list of tolerance per level
+    @Param lod, level of detail
+    @Return tolerance
+    """
+    return tolerances[max(0, min(lod, len(tolerances) - 1))]
+
+
+def wall_graph_runs(nodes, edges, thickness):
+    """
+    Wall graph runs
+    Join wall graph edges continuing each other straight through a shared node
+    with the same thickness, in any order and direction.
+    @Param nodes, edges, thickness, see detect.wall_graph
+    @Return starts - (R,2) array, ends - (R,2) array of centerline ends of each
+    straight run, thickness - (R,) array
+    """
+    nodes = np.asarray(nodes, dtype=np.float64).reshape(-1, 2)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    thickness = np.asarray(thickness, dtype=np.float64)
+    delta = nodes[edges[:, 1]] - nodes[edges[:, 0]]
+    length = np.linalg.norm(delta, axis=1)
+    keep = length > 0
+    edges, thickness, delta = edges[keep], thickness[keep], delta[keep]
+    direction = delta / length[keep, None]
+
+    run = list(range(len(edges)))
+
+    def find(edge):
+        while run[edge] != edge:
+            run[edge] = run[run[edge]]
+            edge = run[edge]
+        return edge
+
+    incident = dict()  # node -> list of (edge, direction away from node)
+    for edge, (a, b) in enumerate(edges.tolist()):
+        incident.setdefault(a, []).append((edge, direction[edge]))
+        incident.setdefault(b, []).append((edge, -direction[edge]))
+    for node_edges in incident.values():
+        for i, (edge, away) in enumerate(node_edges):
+            for other, other_away in node_edges[i + 1 :]:
+                if np.isclose(thickness[edge], thickness[other]) and np.allclose(
+                    away, -other_away
+                ):
+                    run[find(other)] = find(edge)
+
+    starts = []
+    ends = []
+    widths = []
+    runs = dict()  # root edge -> edges of straight run
+    for edge in range(len(edges)):
+        runs.setdefault(find(edge), []).append(edge)
+    for root, members in runs.items():
+        # run spans the extreme nodes along its direction
+        points = nodes[edges[members].ravel()]
+        projection = points @ direction[root]
+        starts.append(points[projection.argmin()])
+        ends.append(points[projection.argmax()])
+        widths.append(thickness[root])
+    return (
+        np.array(starts, dtype=np.float64).reshape(-1, 2),
+        np.array(ends, dtype=np.float64).reshape(-1, 2),
+        np.array(widths, dtype=np.float64),
+    )
+
+
+def wall_run_boxes(starts, ends, thickness):
+    """
+    Wall run boxes
+    Create one rectangle per straight wall run, extended half the thickness
+    past both ends so walls overlap in junctions and corners
+    @Param starts, ends, thickness, see wall_graph_runs
+    @Return list of contours as (4,1,2) int32 arrays
+    """
+    boxes = []
+    for start, end, width in zip(starts, ends, thickness):
+        along = (end - start) / np.linalg.norm(end - start)
+        half = along * width / 2
+        normal = np.array([-half[1], half[0]])
+        start = start - half
+        end = end + half
+        corners = [start + normal, end + normal, end - normal, start - normal]
+        # whole pixels, like contours of detected boxes
+        boxes.append(np.round(corners).astype(np.int32).reshape(4, 1, 2))
+    return boxes
+
+
+def wall_graph_to_boxes(nodes, edges, thickness):
+    """
+    Wall graph to boxes
+    Create one rectangle per straight run of wall graph edges,
+    see wall_graph_runs and wall_run_boxes
+    @Param nodes, edges, thickness, see detect.wall_graph
+    @Return list of contours as (4,1,2) int32 arrays
+    """
+    return wall_run_boxes(*wall_graph_runs(nodes, edges, thickness))
+
+
+def wall_runs_to_graph(starts, ends, thickness, pixelscale=100):
+    """
+    Wall runs to graph
+    Compact centerline graph of wall runs, one edge per wall, stored as data
+    instead of wall verts and faces, see create_walls_from_graph in blender
+    @Param starts, ends, thickness, see wall_graph_runs
+    @Return dict of nodes - list of points, edges - list of node index pairs,
+    thickness - list of wall thickness, scaled like verts
+    """
+    # rounding drops float noise of scaling, far below a pixel
+    points = np.round(np.concatenate([starts, ends]).reshape(-1, 2) / pixelscale, 6)
+    nodes, inverse = np.unique(points, axis=0, return_inverse=True)
+    return {
+        "nodes": nodes.tolist(),
+        "edges": inverse.reshape(2, -1).T.tolist(),
+        "thickness": np.round(np.asarray(thickness) / pixelscale, 6).tolist(),
+    }
+
+
 def scale_point_to_vector(boxes, pixelscale=100, height=0, scale=np.array([1, 1, 1])):
     """
     Scale point to vector
@@ -131,11 +317,8 @@ def scale_point_to_vector(boxes, pixelscale=100, height=0, scale=np.array([1, 1,
     @Param scale
     @Param height
     """
-    res = []
-    for box in boxes:
-        for pos in box:
-            res.extend([[(pos[0]) / pixelscale, (pos[1]) / pixelscale, height]])
-    return res
+    points, _ = pack_boxes(boxes)
+    return [[x, y, height] for x, y in (points / pixelscale).tolist()]
 
 
 def list_to_nparray(list, default=np.array([1, 1, 1])):
@@ -145,6 +328,83 @@ def list_to_nparray(list, default=np.array([1, 1, 1])):
         return np.array([list[0], list[1], list[2]])
 
 
+def create_4xn_verts_and_faces_packed(
+    points,
+    offsets,
+    height=1,
+    pixelscale=100,
+    ground=False,
+    ground_height=const.WALL_GROUND,
+    dtype=np.float32,
+):
+    """
+    Create packed verts and faces of horizontal objects
+    @Param points, offsets, packed boxes from pack_boxes
+    @Param height,
+    @Param ground, also create each box at ground_height
+    @Return verts - as (V,3) array, faces - as (V,) int32 index array,
+    feature_offsets - polygon i is faces[feature_offsets[i]:feature_offsets[i+1]]
+    Each box is one polygon, followed by its ground polygon if ground is set.
+    """
+    xy = np.asarray(points) / pixelscale
+    lengths = np.diff(offsets)
+    starts = np.asarray(offsets[:-1])
+    levels = [height, ground_height] if ground else [height]
+
+    # repeat each box once per level, keeping boxes in order
+    feature_lengths = np.repeat(lengths, len(levels))
+    feature_offsets = np.zeros(len(feature_lengths) + 1, dtype=np.int64)
+    feature_offsets[1:] = np.cumsum(feature_lengths)
+    index = (
+        np.arange(feature_offsets[-1])
+        - np.repeat(feature_offsets[:-1], feature_lengths)
+        + np.repeat(np.repeat(starts, len(levels)), feature_lengths)
+    )
+    z = np.repeat(np.tile(levels, len(lengths)), feature_lengths)
+
+    verts = np.empty((len(index), 3), dtype=dtype)
+    verts[:, :2] = xy[index]
+    verts[:, 2] = z
+    faces = np.arange(len(verts), dtype=np.int32)
+    return verts, faces, feature_offsets
+
+
+def create_nx4_verts_and_faces_packed(
+    points,
+    offsets,
+    height=1,
+    pixelscale=100,
+    ground=const.WALL_GROUND,
+    dtype=np.float32,
+):
+    """
+    Create packed verts and faces of vertical objects
+    @Param points, offsets, packed boxes from pack_boxes
+    @Param height,
+    @Param ground, z value of wall bottom
+    @Return verts - as (4P,3) array, 4 verts for each wall between box neighbours,
+    faces - as (P,4) int32 array of quads
+    """
+    xy = np.asarray(points) / pixelscale
+    amount = len(xy)
+
+    # next point in same box, last point links to first
+    starts, ends = np.asarray(offsets[:-1]), np.asarray(offsets[1:])
+    following = np.arange(1, amount + 1)
+    following[ends[ends > starts] - 1] = starts[ends > starts]
+
+    verts = np.empty((amount, 4, 3), dtype=dtype)
+    verts[:, 0, :2] = verts[:, 1, :2] = xy
+    verts[:, 2, :2] = verts[:, 3, :2] = xy[following]
+    verts[:, 0::2, 2] = ground
+    verts[:, 1::2, 2] = height
+
+    faces = np.array([0, 1, 3, 2], dtype=np.int32) + 4 * np.arange(
+        amount, dtype=np.int32
+    ).reshape(-1, 1)
+    return verts.reshape(-1, 3), faces
+
+
 def create_4xn_verts_and_faces(
     boxes,
     height=1,
@@ -162,29 +422,33 @@ def create_4xn_verts_and_faces(
     Use the result by looping over boxes in verts, and create mesh for each box with same face and pos
     See create_custom_mesh in floorplan code
     This functions is used to create horizontal objects
+    List version of create_4xn_verts_and_faces_packed, used for blender data files
     """
-    counter = 0
-    verts = []
+    points, offsets = pack_boxes(boxes)
+    verts, _, feature_offsets = create_4xn_verts_and_faces_packed(
+        points, offsets, height, pixelscale, ground, ground_height, np.float64
+    )
+    levels = [height, ground_height] if ground else [height]
+    verts, faces = packed_4xn_to_lists(verts, feature_offsets, levels)
+    return verts, faces, len(boxes)
 
-    # Create verts
-    for box in boxes:
-        verts.extend([scale_point_to_vector(box, pixelscale, height, scale)])
-        if ground:
-            verts.extend([scale_point_to_vector(box, pixelscale, ground_height, scale)])
-        counter += 1
 
+def packed_4xn_to_lists(verts, feature_offsets, levels):
+    """
+    Convert packed horizontal objects to the lists of create_4xn_verts_and_faces
+    @Param verts, feature_offsets, see create_4xn_verts_and_faces_packed
+    @Param levels, z of each feature, repeated for every box
+    @Return verts, faces
+    """
+    xy = verts[:, :2].tolist()
+    res = []
     faces = []
-
-    # Create faces
-    for room in verts:
-        count = 0
-        temp = ()
-        for _ in room:
-            temp = temp + (count,)
-            count += 1
-        faces.append([(temp)])
-
-    return verts, faces, counter
+    for index in range(len(feature_offsets) - 1):
+        z = levels[index % len(levels)]
+        start, end = feature_offsets[index], feature_offsets[index + 1]
+        res.append([[x, y, z] for x, y in xy[start:end]])
+        faces.append([tuple(range(end - start))])
+    return res, faces
 
 
 def create_nx4_verts_and_faces(
@@ -199,60 +463,49 @@ def create_nx4_verts_and_faces(
     Use the result by looping over boxes in verts, and create mesh for each box with same face and pos
     See create_custom_mesh in floorplan code
     This functions is used to create vertical objects
+    List version of create_nx4_verts_and_faces_packed, used for blender data files
     """
-    counter = 0
-    verts = []
+    points, offsets = pack_boxes(boxes)
+    verts, _ = create_nx4_verts_and_faces_packed(
+        points, offsets, height, pixelscale, ground, np.float64
+    )
+    res, faces = packed_nx4_to_lists(verts, offsets, height, ground)
+    return res, faces, len(points)
 
-    for box in boxes:
+
+def packed_nx4_to_lists(verts, offsets, height=1, ground=const.WALL_GROUND):
+    """
+    Convert packed vertical objects to the lists of create_nx4_verts_and_faces
+    @Param verts, see create_nx4_verts_and_faces_packed
+    @Param offsets, packed boxes from pack_boxes
+    @Param height, ground, z values verts were created with
+    @Return verts, faces
+    """
+    xy = verts[:, :2].tolist()
+    res = []
+    for index in range(len(offsets) - 1):
         box_verts = []
-        for index in range(0, len(box)):
-            temp_verts = []
-            # Get current
-            current = box[index][0]
-
-            # is last, link to first
-            if len(box) - 1 >= index + 1:
-                next_vert = box[index + 1][0]
-            else:
-                next_vert = box[0][0]
-                # link to first pos
-
-            # Create all 3d poses for each wall
-            temp_verts.extend(
-                [((current[0]) / pixelscale, (current[1]) / pixelscale, ground)]
-            )
-            temp_verts.extend(
-                [
-                    (
-                        (current[0]) / pixelscale,
-                        (current[1]) / pixelscale,
-                        (height),
-                    )
-                ]
-            )
-            temp_verts.extend(
-                [((next_vert[0]) / pixelscale, (next_vert[1]) / pixelscale, ground)]
-            )
-            temp_verts.extend(
-                [
-                    (
-                        (next_vert[0]) / pixelscale,
-                        (next_vert[1]) / pixelscale,
-                        (height),
-                    )
-                ]
+        for wall in range(offsets[index], offsets[index + 1]):
+            (cx, cy), _, (nx, ny), _ = xy[4 * wall : 4 * wall + 4]
+            box_verts.append(
+                [(cx, cy, ground), (cx, cy, height), (nx, ny, ground), (nx, ny, height)]
             )
+        res.append(box_verts)
+    return res, [(0, 1, 3, 2)]
 
-            # add wall verts to verts
-            box_verts.extend([temp_verts])
 
-            # wall counter
-            counter += 1
-
-        verts.extend([box_verts])
-
-    faces = [(0, 1, 3, 2)]
-    return verts, faces, counter
+def create_verts_packed(points, height, pixelscale=100, dtype=np.float32):
+    """
+    Packed version of create_verts
+    @Param points, packed 2d points from pack_boxes
+    @Return verts, (2P,3) array, each point at ground and at height
+    """
+    xy = np.asarray(points) / pixelscale
+    verts = np.empty((len(xy), 2, 3), dtype=dtype)
+    verts[:, :, :2] = xy[:, np.newaxis]
+    verts[:, 0, 2] = 0.0
+    verts[:, 1, 2] = height
+    return verts.reshape(-1, 3)
 
 
 def create_verts(boxes, height, pixelscale=100, scale=np.array([1, 1, 1])):
@@ -266,23 +519,82 @@ def create_verts(boxes, height, pixelscale=100, scale=np.array([1, 1, 1])):
     Scale and create array of box_verts
     [[box1],[box2],...]
     """
+    points, _ = pack_boxes(boxes)
     verts = []
+    for x, y in (points / pixelscale).tolist():
+        verts.extend([(x, y, 0.0), (x, y, height)])
+    return verts
 
-    # for each wall group
-    for box in boxes:
-        temp_verts = []
-        # for each pos
-        for pos in box:
-
-            # add and convert all positions
-            temp_verts.extend(
-                [((pos[0][0]) / pixelscale, (pos[0][1]) / pixelscale, 0.0)]
-            )
-            temp_verts.extend(
-                [((pos[0][0]) / pixelscale, (pos[0][1]) / pixelscale, height)]
-            )
 
-        # add box to list
-        verts.extend(temp_verts)
+def euler_to_quaternion(rotation):
+    """
+    Convert euler rotation to quaternion
+    Rotation order is XYZ, as rotation_euler in blender.
+    @Param rotation, angles in radians around x, y and z
+    @Return quaternion as x, y, z, w
+    """
+    cx, cy, cz = np.cos(np.asarray(rotation, dtype=float) / 2)
+    sx, sy, sz = np.sin(np.asarray(rotation, dtype=float) / 2)
+    return np.array(
+        [
+            sx * cy * cz - cx * sy * sz,
+            cx * sy * cz + sx * cy * sz,
+            cx * cy * sz - sx * sy * cz,
+            cx * cy * cz + sx * sy * sz,
+        ]
+    )
+
+
+def triangulate(verts, face):
+    """
+    Triangulate polygon by ear clipping
+    Faces of floors, rooms and wall tops can be concave polygons.
+    @Param verts, numpy array of vectors
+    @Param face, list of indices of a planar polygon
+    @Return list of index triangles, same winding as face
+    """
+    face = list(face)
+    if len(face) < 3:
+        return []
+    points = np.asarray(verts, dtype=float)[face]
+    # project along largest axis of polygon normal
+    normal = np.cross(points, np.roll(points, -1, axis=0)).sum(axis=0)
+    points = np.delete(points, int(np.argmax(np.abs(normal))), axis=1)
+    x, y = points[:, 0], points[:, 1]
+    flipped = np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y) < 0
+
+    def cross(o, a, b):
+        return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (
+            a[..., 1] - o[..., 1]
+        ) * (b[..., 0] - o[..., 0])
+
+    # clip ears of counter clockwise polygon
+    order = list(range(len(face)))[:: -1 if flipped else 1]
+    triangles = []
+    while len(order) > 3:
+        for i in range(len(order)):
+            corner = (order[i - 1], order[i], order[(i + 1) % len(order)])
+            a, b, c = points[list(corner)]
+            if cross(a, b, c) <= 0:
+                continue  # reflex or collinear corner
+            others = points[[j for j in order if j not in corner]]
+            # other corners at the same position as the ear don't block it
+            others = others[
+                ~np.any([np.all(others == p, axis=1) for p in (a, b, c)], axis=0)
+            ]
+            if np.any(
+                (cross(a, b, others) >= 0)
+                & (cross(b, c, others) >= 0)
+                & (cross(c, a, others) >= 0)
+            ):
+                continue  # other corner inside ear
+            triangles.append(corner)
+            del order[i]
+            break
+        else:
+            break  # degenerate polygon, fan the rest
+    triangles += [(order[0], order[i], order[i + 1]) for i in range(1, len(order) - 1)]
 
-    return verts
+    if flipped:
+        return [(face[c], face[b], face[a]) for a, b, c in triangles]
+    return [(face[a], face[b], face[c]) for a, b, c in triangles]
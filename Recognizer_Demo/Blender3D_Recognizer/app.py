@@ -12,9 +12,10 @@ from FloorplanToBlenderLib import detect
 floorplan_lib_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
 try:
     sys.path.insert(0, floorplan_lib_path)
-    from FloorplanToBlenderLib import *  # floorplan to blender lib
+    # only detect, a star import loads every submodule at cold start
+    from FloorplanToBlenderLib import detect  # floorplan to blender lib
 except ImportError:
-    from FloorplanToBlenderLib import *  # floorplan to blender lib
+    from FloorplanToBlenderLib import detect  # floorplan to blender lib
 from subprocess import check_output
 
 
@@ -8,16 +8,16 @@ import json
 import math
 from shapely.geometry import MultiPoint, LineString, MultiLineString
 from shapely.ops import unary_union
-import matplotlib.pyplot as plt
 import datetime
 from urllib.parse import urlparse
 
 floorplan_lib_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
 try:
     sys.path.insert(0, floorplan_lib_path)
-    from FloorplanToBlenderLib import *  # floorplan to blender lib
+    # only detect, a star import loads every submodule at cold start
+    from FloorplanToBlenderLib import detect  # floorplan to blender lib
 except ImportError:
-    from FloorplanToBlenderLib import *  # floorplan to blender lib
+    from FloorplanToBlenderLib import detect  # floorplan to blender lib
 from subprocess import check_output
 
 
@@ -173,16 +173,13 @@ def detect_and_mask_windows_and_doors_boxes(img):
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     gray = detect.wall_filter(gray)
     gray = ~gray
-    doors, colored_doors = detect.find_details(img=gray.copy(), room_closing_max_length = 50)
+    doors, colored_doors = detect.find_details(img=gray.copy(), room_closing_max_length = 50, labeled=True)
     def adjust_and_filter_doors(doors):
         adjusted_doors = []
-        for door_mask in doors:
+        for x, y, w, h in doors.boxes:
             # Find the bounding box of the door
-            rows, cols = np.where(door_mask)
-            if rows.size == 0 or cols.size == 0:  # Skip if the mask is empty
-                continue
-            min_row, max_row = np.min(rows), np.max(rows)
-            min_col, max_col = np.min(cols), np.max(cols)
+            min_row, max_row = y, y + h - 1
+            min_col, max_col = x, x + w - 1
             
             # Calculate the height and width of the bounding box
             height = max_row - min_row
@@ -192,26 +189,24 @@ def detect_and_mask_windows_and_doors_boxes(img):
             increase_height = int(height * 0.1)
             increase_width = int(width * 0.1)
             min_row = max(0, min_row - increase_height)
-            max_row = min(door_mask.shape[0], max_row + increase_height)
+            max_row = min(doors.labels.shape[0], max_row + increase_height)
             min_col = max(0, min_col - increase_width)
-            max_col = min(door_mask.shape[1], max_col + increase_width)
+            max_col = min(doors.labels.shape[1], max_col + increase_width)
             
             # Check the aspect ratio
             aspect_ratio = max(height, width) / max(min(height, width), 1)  # Avoid division by zero
             if aspect_ratio < 4:  # If the aspect ratio is less than 4:1, it's not considered a door
                 continue
             
-            # Create an adjusted mask for the door
-            adjusted_mask = np.zeros_like(door_mask)
-            adjusted_mask[min_row:max_row, min_col:max_col] = True
-            adjusted_doors.append(adjusted_mask)
+            # Keep the adjusted box, not a full size mask per door
+            adjusted_doors.append((min_row, max_row, min_col, max_col))
         
         return adjusted_doors
     adjusted_doors = adjust_and_filter_doors(doors)
 
-    # Apply the adjusted door masks to the image
-    for door_mask in adjusted_doors:
-        img[door_mask] = (0, 0, 0)  # Black out the door areas
+    # Apply the adjusted door boxes to the image
+    for min_row, max_row, min_col, max_col in adjusted_doors:
+        img[min_row:max_row, min_col:max_col] = (0, 0, 0)  # Black out the door areas
     cv2.imwrite("./masked_door.png", img)
     return img
 
@@ -3,9 +3,7 @@ import json
 from call_blender3d import norm_blender3d
 from utils.merge_walls import merge_wall_processing
 from utils.rectangularized import rectangularized
-import matplotlib.pyplot as plt
 import numpy as np
-import boto3
 import datetime
 import os
 from urllib.parse import urlparse
@@ -18,6 +16,8 @@ def plot_rooms(data):
 
     :param data: Data format from process_room_data()
     """
+    import matplotlib.pyplot as plt  # heavy, only needed when debugging locally
+
     plt.figure(figsize=(10, 10))
     for room_list in data['data']['plans']:
         for room in room_list:
@@ -275,6 +275,8 @@ def call_visualizer(invoke_payload, lambda_client):
 
 
 def storage_image(image_url,room_number):
+    import boto3  # loaded on first use to keep lambda cold start short
+
     s3_client = boto3.client('s3')
     # Parse the URL to get the bucket name and the key
     parsed_url = urlparse(image_url)
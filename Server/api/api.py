@@ -6,6 +6,15 @@ Copyright (C) 2021 Daniel Westberg
 """
 
 
+class HttpError(Exception):
+    """Raise from api functions to answer with another status than 200 OK"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
 def client_exist(client, client_list):
     for c in client_list:
         if c["address"] == client["address"] and c["port"] == client["port"]:
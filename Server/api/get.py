@@ -1,28 +1,150 @@
 from api.api import Api
+from email.utils import parsedate_to_datetime
+import tempfile
+import zipfile
 import json
-import shutil
+import sys
 import os
 
+sys.path.insert(0, "..")
+from FloorplanToBlenderLib import metrics, retention  # floorplan to blender lib
+
 """
 FloorplanToBlender3d
 Copyright (C) 2021 Daniel Westberg
 """
 
 
-def sendFileHeaders(_api_ref, file):
-    _api_ref.send_response(200)
-    _api_ref.send_header("Content-type", "multipart/form-_data")
-    fs = os.fstat(file.fileno())
-    _api_ref.send_header("Content-Length", str(fs[6]))
+def parseRange(header, size):
+    """Parse a single byte range header value.
+    @Return (first, last) inclusive or None if whole file should be sent
+    Raises ValueError if range can't be satisfied."""
+    if header is None or not header.startswith("bytes=") or "," in header:
+        return None  # multiple ranges are not supported, send whole file
+    first, _, last = header[len("bytes=") :].strip().partition("-")
+    try:
+        if first == "":  # suffix range, last n bytes
+            first, last = max(size - int(last), 0), size - 1
+        else:
+            first = int(first)
+            last = size - 1 if last == "" else min(int(last), size - 1)
+    except ValueError:
+        return None  # malformed ranges are ignored
+    if first > last or first >= size:
+        raise ValueError("Range not satisfiable")
+    return first, last
+
+
+def notModified(_api_ref, etag, mtime):
+    """Conditional GET, If-None-Match wins over If-Modified-Since"""
+    if_none_match = _api_ref.headers["If-None-Match"]
+    if if_none_match is not None:
+        return etag in [e.strip() for e in if_none_match.split(",")] or (
+            if_none_match.strip() == "*"
+        )
+    if_modified_since = _api_ref.headers["If-Modified-Since"]
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def sendFileHeaders(_api_ref, path, fs, etag, code=200, content_range=None):
+    _api_ref.send_response(code)
+    _api_ref.send_header("Access-Control-Allow-Origin", "*")
+    _api_ref.send_header("ETag", etag)
     _api_ref.send_header("Last-Modified", _api_ref.date_time_string(fs.st_mtime))
+    _api_ref.send_header("Accept-Ranges", "bytes")
+    if code == 304:
+        _api_ref.end_headers()
+        return
+    if code == 416:
+        _api_ref.send_header("Content-Range", "bytes */" + str(fs.st_size))
+        _api_ref.send_header("Content-Length", "0")
+        _api_ref.end_headers()
+        return
+    _api_ref.send_header("Content-type", _api_ref.shared.get_content_type(path))
+    if content_range is None:
+        _api_ref.send_header("Content-Length", str(fs.st_size))
+    else:
+        first, last = content_range
+        _api_ref.send_header(
+            "Content-Range",
+            "bytes " + str(first) + "-" + str(last) + "/" + str(fs.st_size),
+        )
+        _api_ref.send_header("Content-Length", str(last - first + 1))
     _api_ref.end_headers()
 
 
 def returnFile(path, _api_ref):
+    """Send file as response, supports conditional GET and single byte ranges.
+    @Return None when response is sent, else error message"""
+    if path is None or not os.path.isfile(path):
+        return "File does not exist!"
+
     with open(path, "rb") as file:
-        sendFileHeaders(_api_ref, file)
-        shutil.copyfileobj(file, _api_ref.wfile)
-    return "File sent!"
+        fs = os.fstat(file.fileno())
+        etag = '"' + format(fs.st_mtime_ns, "x") + "-" + format(fs.st_size, "x") + '"'
+
+        if notModified(_api_ref, etag, fs.st_mtime):
+            sendFileHeaders(_api_ref, path, fs, etag, 304)
+            return None
+
+        try:
+            content_range = parseRange(_api_ref.headers["Range"], fs.st_size)
+        except ValueError:
+            sendFileHeaders(_api_ref, path, fs, etag, 416)
+            return None
+
+        if content_range is None:
+            offset, count = 0, fs.st_size
+            sendFileHeaders(_api_ref, path, fs, etag)
+        else:
+            offset, count = content_range[0], content_range[1] - content_range[0] + 1
+            sendFileHeaders(_api_ref, path, fs, etag, 206, content_range)
+
+        # socket.sendfile uses zero-copy os.sendfile where available
+        _api_ref.wfile.flush()
+        _api_ref.connection.sendfile(file, offset, count)
+    return None
+
+
+def batchStatus(shared, batch):
+    """Aggregate process records of a batch.
+    @Return dict with counts per status and records per id"""
+    res = {
+        "bid": batch["bid"],
+        "oformat": batch["oformat"],
+        "total": len(batch["pids"]),
+    }
+    res["done"] = res["failed"] = res["running"] = res["queued"] = 0
+    res["items"] = dict()
+    with shared.process_changed:  # processes are updated by worker threads
+        for id, pid in batch["pids"].items():
+            process = shared.get_process(pid) or {}
+            status = str(process.get("status", ""))
+            if status == "Done":
+                res["done"] += 1
+            elif status.startswith("ERROR") or status in (
+                "Cancelled",
+                "Refused, queue is full",
+            ):
+                res["failed"] += 1
+            elif status == "Queued":
+                res["queued"] += 1
+            else:
+                res["running"] += 1
+            res["items"][id] = {
+                "name": batch["names"][id],
+                "pid": pid,
+                "status": status,
+                "queue_position": process.get("queue_position"),
+            }
+    res["finished"] = res["done"] + res["failed"] == res["total"]
+    return res
 
 
 class Get(Api):
@@ -37,10 +159,15 @@ class Get(Api):
         self.dispatched_calls["objects"] = self.objects
         self.dispatched_calls["process"] = self.process
         self.dispatched_calls["processes"] = self.processes
+        self.dispatched_calls["subscribe"] = self.subscribe
         self.dispatched_calls["configfiles"] = self.configfiles
         self.dispatched_calls["stackingfiles"] = self.stackingfiles
         self.dispatched_calls["configfile"] = self.configfile
         self.dispatched_calls["stackingfile"] = self.stackingfile
+        self.dispatched_calls["cachestats"] = self.cachestats
+        self.dispatched_calls["metrics"] = self.metrics
+        self.dispatched_calls["batch"] = self.batch
+        self.dispatched_calls["batchresult"] = self.batchresult
 
     def info(self, _api_ref, _data, *args, **kwargs) -> str:
         """Returns information about server implementation as JSON."""
@@ -59,11 +186,31 @@ class Get(Api):
 
     def process(self, pid: str, *args, **kwargs) -> str:
         """Get a specific process as JSON."""
-        p = self.shared.get_process(pid)
-        if p is None:
-            return "Process does not exist!"
-        else:
-            return json.dumps(p)
+        with self.shared.process_changed:  # not while a worker updates it
+            p = self.shared.get_process(pid)
+            if p is None:
+                return "Process does not exist!"
+            else:
+                return json.dumps(p)
+
+    def cachestats(self, *args, **kwargs) -> str:
+        """Get result cache hits, misses, hit rate and entries as JSON."""
+        return json.dumps(self.shared.result_cache.stats())
+
+    def metrics(self, _api_ref, *args, **kwargs) -> str:
+        """Get request, queue and pipeline stage metrics in Prometheus text format."""
+        metrics.set_gauge("process_queue_depth", self.shared.scheduler.queue_depth())
+        metrics.set_gauge(
+            "process_active_workers", self.shared.scheduler.active_workers()
+        )
+        body = bytes(metrics.export(), encoding="utf-8")
+        _api_ref.send_response(200)
+        _api_ref.send_header("Access-Control-Allow-Origin", "*")
+        _api_ref.send_header("Content-Type", "text/plain; version=0.0.4")
+        _api_ref.send_header("Content-Length", str(len(body)))
+        _api_ref.end_headers()
+        _api_ref.wfile.write(body)
+        return None
 
     def all(self, *args, **kwargs) -> str:
         """Return all files currently managed by server as JSON."""
@@ -87,7 +234,65 @@ class Get(Api):
 
     def processes(self, *args, **kwargs) -> str:
         """Get all processes as JSON."""
-        return json.dumps(self.shared.all_processes)
+        with self.shared.process_changed:  # not while workers update them
+            return json.dumps(self.shared.all_processes)
+
+    def subscribe(
+        self, since: str = "0", pid: str = None, timeout: str = "30", *args, **kwargs
+    ) -> str:
+        """Long poll process changes after version since, optionally for one pid.
+        Returns JSON with current version and changed processes, use version as next since.
+        """
+        since = int(since)
+        timeout = min(float(timeout), self.shared.maxLongPollTimeout)
+        with self.shared.process_changed:
+            # cheap check of version, every process update wakes all subscribers
+            self.shared.process_changed.wait_for(
+                lambda: self.shared.process_changed_since(since, pid), timeout
+            )
+            res = dict()
+            res["version"] = self.shared.process_version
+            res["processes"] = self.shared.get_process_changes(since, pid)
+        return json.dumps(res)
+
+    def batch(self, bid: str, *args, **kwargs) -> str:
+        """Get aggregated progress of a batch as JSON."""
+        if bid not in self.shared.batches:
+            return "Batch does not exist!"
+        return json.dumps(batchStatus(self.shared, self.shared.batches[bid]))
+
+    def batchresult(self, _api_ref, bid: str, *args, **kwargs) -> str:
+        """Return zip of all created objects in batch, named after uploaded images."""
+        if bid not in self.shared.batches:
+            return "Batch does not exist!"
+        batch = self.shared.batches[bid]
+        status = batchStatus(self.shared, batch)
+        if not status["finished"]:
+            return "Batch is not finished!"
+
+        path = (
+            self.shared.parentPath + "/" + self.shared.batchesPath + "/" + bid + ".zip"
+        )
+        if not os.path.isfile(path):
+            # concurrent downloads each build their own zip, the last replace wins
+            fd, tmp = tempfile.mkstemp(
+                dir=os.path.dirname(path), prefix="." + bid, suffix=".part"
+            )
+            try:
+                with os.fdopen(fd, "wb") as f, zipfile.ZipFile(
+                    f, "w", zipfile.ZIP_DEFLATED
+                ) as zf:
+                    for id, item in status["items"].items():
+                        obj = self.shared.get_object_path(id, batch["oformat"])
+                        if item["status"] == "Done" and obj is not None:
+                            name = os.path.splitext(item["name"])[0]
+                            zf.write(obj, id + "_" + name + batch["oformat"])
+                os.chmod(tmp, 0o644)  # mkstemp creates owner only files
+                os.replace(tmp, path)
+            except BaseException:
+                os.remove(tmp)
+                raise
+        return returnFile(path, _api_ref)
 
     def image(self, _api_ref, id: str, *args, **kwargs) -> str:
         """Return imagefile of id specified in JSON."""
@@ -122,4 +327,5 @@ class Get(Api):
         if obj is None:
             return "No such object exists!"
         else:
+            retention.touch(obj)
             return returnFile(obj, _api_ref)
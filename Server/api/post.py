@@ -1,14 +1,54 @@
 from shared_variables import shared_variables
-from api.api import Api
-from process.create import Create
+from api.api import Api, HttpError
+from process.create import Create, pipeline_settings
 from file.file_handler import FileHandler
 
+from FloorplanToBlenderLib import retention  # floorplan to blender lib
+
 """
 FloorplanToBlender3d
 Copyright (C) 2021 Daniel Westberg
 """
 
 
+def start_transform(
+    shared, func, id, oformat, priority=0, config_path=None, reserved=False
+):
+    """Link object from cache or schedule a Create process for id.
+    @Param config_path, floorplan config, default config if None
+    @Param reserved, use a slot from scheduler.reserve
+    @Return process, message"""
+    cache_key = shared.result_cache.key(
+        shared.get_image_hash(id), pipeline_settings(config_path), oformat
+    )
+    process = Create(
+        func=func,
+        id=id,
+        oformat=oformat,
+        shared_variables=shared,
+        cache_key=cache_key,
+        config_path=config_path,
+    )
+    target = shared.parentPath + "/" + shared.objectsPath + "/" + process.process["out"]
+    if shared.result_cache.get(cache_key, target, id):
+        # Same image already transformed with same settings
+        # a hardlink keeps the time of the cached file, mark it as new
+        retention.touch(target)
+        process.process["state"] = process.process["cstate"] + 1
+        process.update("status", "Done")
+        shared.reindex_files()
+        if reserved:
+            shared.scheduler.unreserve(1)
+        return process, "TransformProcess done! Object linked from cache."
+    if not shared.scheduler.submit(process, priority, reserved):
+        process.update("status", "Refused, queue is full")
+        raise HttpError(503, "Server busy, queue is full! Retry later.")
+    return (
+        process,
+        "TransformProcess started! Query Process Status for more Information.",
+    )
+
+
 class Post(Api):
     def __init__(self, client, shared_variables):
         super().__init__(client, shared_variables)
@@ -16,6 +56,7 @@ class Post(Api):
         self.dispatched_calls["create"] = self.create
         self.dispatched_calls["remove"] = self.remove
         self.dispatched_calls["transform"] = self.transform
+        self.dispatched_calls["cancel"] = self.cancel
 
     def create(self, *args, **kwargs) -> str:
         """
@@ -39,22 +80,31 @@ class Post(Api):
             if id in file:
                 for f in self.shared.get_id_files(id):
                     fs.remove(f)
+        self.shared.image_hashes.pop(id, None)
+        self.shared.result_cache.release(id)
 
         self.shared.reindex_files()
         return "Removed id!"
 
-    def transform(self, func: str, id: str, oformat: str, *args, **kwargs) -> str:
-        """Transform Image to 3dObject."""
+    def transform(
+        self, func: str, id: str, oformat: str, priority: str = "0", *args, **kwargs
+    ) -> str:
+        """Transform Image to 3dObject. Higher priority starts sooner when queued."""
         _id = self.shared.get_id(id)
         if _id is not None and _id[2]:
             if oformat in self.shared.supported_blender_formats:
-                Create(
-                    func=func, id=id, oformat=oformat, shared_variables=self.shared
-                ).start()
-                message = "TransformProcess started! Query Process Status for more Information."
+                _, message = start_transform(
+                    self.shared, func, id, oformat, int(priority)
+                )
             else:
                 message = "Format not supported!"
         else:
             message = "File doesn't exist!"
             self.shared.bad_client_event(self.client)
         return message
+
+    def cancel(self, pid: str, *args, **kwargs) -> str:
+        """Cancel a queued or running process."""
+        if self.shared.scheduler.cancel(pid):
+            return "Process cancelled!"
+        return "Process does not exist or is not queued or running!"
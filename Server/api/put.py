@@ -1,6 +1,12 @@
 from typing import Tuple
-from api.api import Api
-from api.post import Post  # needed to call transform function
+from api.api import Api, HttpError
+from api.post import Post, start_transform  # needed to call transform function
+import hashlib
+import tempfile
+import zipfile
+import json
+import io
+import os
 
 """
 FloorplanToBlender3d
@@ -8,10 +14,135 @@ Copyright (C) 2021 Daniel Westberg
 """
 
 
+class UploadStream:
+    """Read at most length bytes from a socket stream, never past the request body"""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size):
+        if self.remaining <= 0:
+            return b""
+        data = self.stream.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+
+def link_duplicate(existing, tmp_path):
+    """Replace tmp_path with a hardlink to existing, keep tmp_path if linking fails"""
+    link_path = tmp_path + ".link"
+    try:
+        os.link(existing, link_path)
+    except OSError:
+        return
+    os.replace(link_path, tmp_path)
+
+
+def stream_to_file(ref, file, folder, max_size, prefix=""):
+    """Stream file-like data in chunks to a .part temp file in folder.
+    @Return path to temp file, sha256 of the content"""
+    if isinstance(file, (bytes, bytearray)):
+        file = io.BytesIO(file)
+
+    # .part suffix keeps unfinished uploads out of the file index
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix="." + prefix, suffix=".part")
+    content_hash = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = file.read(ref.shared.uploadChunkSize)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise ValueError("File is larger than max upload size!")
+                content_hash.update(chunk)
+                tmp.write(chunk)
+
+        if getattr(file, "remaining", 0) > 0:
+            raise ValueError("Upload ended before all data was received!")
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    os.chmod(tmp_path, 0o644)  # mkstemp creates owner only files
+    return tmp_path, content_hash.hexdigest()
+
+
 def create_file(ref, id, iformat, file):
-    """Write incoming data to file"""
-    file_path = ref.shared.parentPath + "/" + ref.shared.imagesPath + "/" + id + iformat
-    open(file_path, "wb").write(file)
+    """Stream incoming data to a temporary file, then atomically move it in place.
+    Returns sha256 of the content."""
+    folder = ref.shared.parentPath + "/" + ref.shared.imagesPath
+    file_path = folder + "/" + id + iformat
+
+    tmp_path, content_hash = stream_to_file(
+        ref, file, folder, ref.shared.maxUploadSize, id
+    )
+    try:
+        existing = ref.shared.get_file_by_hash(content_hash)
+        if existing is not None:
+            link_duplicate(existing, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    ref.shared.image_hashes[id] = content_hash
+    return content_hash
+
+
+def new_id(shared, taken=()):
+    """Unused id, not in taken either, for a file written before it is registered"""
+    tmp_id = None
+    while shared.id_exist(tmp_id) or tmp_id is None or tmp_id in taken:
+        tmp_id = shared.id_generator()
+    return tmp_id
+
+
+def unpack_batch(ref, zf, images, configs, bid):
+    """Write images and config of batch archive, then register the image ids.
+    Nothing is registered and no file is left if writing fails.
+    @Return config path or None, dict of id -> image name"""
+    shared = ref.shared
+    config_path = None
+    names = dict()
+    written = []
+    try:
+        if configs:
+            folder = shared.parentPath + "/" + shared.batchesPath
+            with zf.open(configs[0]) as conf:
+                tmp_path, _ = stream_to_file(
+                    ref, conf, folder, shared.maxUploadSize, bid
+                )
+            config_path = folder + "/" + bid + ".ini"
+            os.replace(tmp_path, config_path)
+            written.append(config_path)
+
+        for member in images:
+            id = new_id(shared, names)
+            iformat = os.path.splitext(member.filename)[1].lower()
+            with zf.open(member) as image:
+                create_file(ref, id, iformat, image)
+            written.append(
+                shared.parentPath + "/" + shared.imagesPath + "/" + id + iformat
+            )
+            names[id] = os.path.basename(member.filename)
+
+        # ids are only visible once all files exist
+        if any(shared.id_exist(id) for id in names):
+            raise ValueError("Id taken while batch was written!")
+        shared.all_ids.extend((id, shared.hash_generator(id), True) for id in names)
+    except BaseException:
+        for id in names:
+            shared.image_hashes.pop(id, None)
+        for path in written:
+            if os.path.isfile(path):
+                os.remove(path)
+        raise
+    return config_path, names
 
 
 class Put(Api):
@@ -20,6 +151,7 @@ class Put(Api):
         # All all viable functions here!
         self.dispatched_calls["create"] = self.create
         self.dispatched_calls["createandtransform"] = self.createandtransform
+        self.dispatched_calls["batch"] = self.batch
 
     def create(
         self, id: str, hash: str, iformat: str, file: bytes, *args, **kwargs
@@ -33,11 +165,7 @@ class Put(Api):
         if (id, hash, False) in self.shared.all_ids:
 
             # format supported?
-            if (
-                iformat in self.shared.supported_image_formats
-                or iformat in self.shared.supported_config_formats
-                or iformat in self.shared.supported_stacking_formats
-            ):
+            if self.shared.supported_upload_format(iformat):
 
                 create_file(self, id, iformat, file)
 
@@ -76,7 +204,87 @@ class Put(Api):
         (message, status) = self.create(id=id, hash=hash, iformat=iformat, file=file)
         message += " "
         if status:
-            message += Post(client=self.client, shared_variables=self.shared).transform(
-                func="transform", id=id, oformat=oformat
-            )
+            try:
+                message += Post(
+                    client=self.client, shared_variables=self.shared
+                ).transform(func="transform", id=id, oformat=oformat)
+            except HttpError as e:
+                raise HttpError(e.code, message + e.message)
         return message, status
+
+    def batch(
+        self, oformat: str, file: bytes, priority: str = "0", *args, **kwargs
+    ) -> Tuple[str, bool]:
+        """
+        Upload zip archive of images and transform all of them.
+        One config file in the archive is used for all images.
+        Track with get batch, download all objects with get batchresult.
+        @Return List[ response, status]
+        """
+        if oformat not in self.shared.supported_blender_formats:
+            return "Format not supported!", False
+
+        bid = "B" + self.shared.id_generator()
+        while bid in self.shared.batches:
+            bid = "B" + self.shared.id_generator()
+
+        folder = self.shared.parentPath + "/" + self.shared.batchesPath
+        archive, _ = stream_to_file(self, file, folder, self.shared.maxBatchUploadSize)
+        try:
+            with zipfile.ZipFile(archive) as zf:
+                members = [
+                    m
+                    for m in zf.infolist()
+                    if not m.is_dir() and not m.filename.startswith("__MACOSX")
+                ]
+                images = [
+                    m
+                    for m in members
+                    if os.path.splitext(m.filename)[1].lower()
+                    in self.shared.supported_image_formats
+                ]
+                configs = [
+                    m
+                    for m in members
+                    if m.filename.lower().endswith(self.shared.supported_config_formats)
+                ]
+                if len(images) == 0:
+                    return "No supported images in archive!", False
+                if len(configs) > 1:
+                    return "Only one config file per batch!", False
+
+                # All or nothing, a batch never takes only part of the queue
+                if not self.shared.scheduler.reserve(len(images)):
+                    raise HttpError(
+                        503, "Server busy, batch does not fit in queue! Retry later."
+                    )
+                try:
+                    config_path, names = unpack_batch(self, zf, images, configs, bid)
+                except BaseException:
+                    self.shared.scheduler.unreserve(len(images))
+                    raise
+        except zipfile.BadZipFile:
+            return "File is not a zip archive!", False
+        finally:
+            os.remove(archive)
+        self.shared.reindex_files()
+
+        batch = {"bid": bid, "oformat": oformat, "names": names, "pids": dict()}
+        self.shared.batches[bid] = batch
+        for index, id in enumerate(names):
+            try:
+                process, _ = start_transform(
+                    self.shared,
+                    "transform",
+                    id,
+                    oformat,
+                    int(priority),
+                    config_path,
+                    reserved=True,
+                )
+            except BaseException:
+                self.shared.scheduler.unreserve(len(names) - index)
+                raise
+            batch["pids"][id] = str(process.pid)
+
+        return json.dumps({"bid": bid, "ids": names}), True
@@ -2,14 +2,20 @@ from threading import Thread
 from functools import partial
 from urllib.parse import urlparse
 from urllib.parse import parse_qs
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import json
+import sys
+import time
 
+from api.api import HttpError
 from api.post import Post
-from api.put import Put
+from api.put import Put, UploadStream
 from api.get import Get
 
+sys.path.insert(0, "..")
+from FloorplanToBlenderLib import metrics  # floorplan to blender lib
+
 """
 FloorplanToBlender3d
 Copyright (C) 2021 Daniel Westberg
@@ -21,6 +27,20 @@ class S(BaseHTTPRequestHandler):
         self.shared = shared
         super().__init__(*args, **kwargs)
 
+    def handle_one_request(self):
+        """Handle request and record count and latency per method and func"""
+        self.func = None
+        start = time.perf_counter()
+        super().handle_one_request()
+        if self.func is not None:
+            metrics.increment("api_requests_total", method=self.command, func=self.func)
+            metrics.observe(
+                "api_request_seconds",
+                time.perf_counter() - start,
+                method=self.command,
+                func=self.func,
+            )
+
     def make_client(self):
         client = dict()
         client["address"] = self.address_string()
@@ -38,6 +58,8 @@ class S(BaseHTTPRequestHandler):
         """Takes query dict, creates kwargs for methods"""
         function = params["func"]
         out_rmi = rmi(client=self.make_client(), shared_variables=self.shared)
+        # metrics label from known functions only, queries are client chosen
+        self.func = function if function in out_rmi.dispatched_calls else "unknown"
         try:
             argc = getattr(out_rmi, function).__code__.co_argcount
             args = getattr(out_rmi, function).__code__.co_varnames[:argc]
@@ -67,8 +89,8 @@ class S(BaseHTTPRequestHandler):
                 kwargs[parameter] = params[parameter]
         return out_rmi, kwargs
 
-    def _set_response(self):
-        self.send_response(200, "OK")
+    def _set_response(self, code=200):
+        self.send_response(code)
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header(
             "Access-Control-Allow-Methods", "POST, PUT, OPTIONS, HEAD, GET"
@@ -98,36 +120,60 @@ class S(BaseHTTPRequestHandler):
                 message = "Function unavailable!"
             else:
                 message = getattr(rmi, kwargs["func"])(**kwargs)
+        if message is None:
+            return  # response was already sent, as when returning files
         try:
             self._set_response()
             self.wfile.write(bytes(message, encoding="utf-8"))
         except ConnectionAbortedError as e:
             return  # This occurs when server is sending file and client isn't waiting for extra message.
 
+    def check_upload_headers(self, params):
+        """Refuse uploads from headers and query only, before any data is read."""
+        content_length = self.headers["Content-Length"]
+        if content_length is None:
+            raise HttpError(411, "Content-Length required!")
+        content_length = int(content_length)
+        max_size = self.shared.maxUploadSize
+        if params.get("func") == "batch":
+            max_size = self.shared.maxBatchUploadSize
+        if content_length > max_size:
+            raise HttpError(
+                413,
+                "File too large! Max upload size is " + str(max_size) + " bytes.",
+            )
+        if "iformat" in params and not self.shared.supported_upload_format(
+            params["iformat"]
+        ):
+            raise HttpError(415, "Image format not supported!")
+        return content_length
+
     def do_PUT(self):
         parsed_path = urlparse(self.path)
         parsed_data = self.transform_dict(parse_qs(parsed_path.query))
         kwargs = None
+        code = 200
         ctype = self.headers["Content-Type"]
         if ctype == "multipart/form-data":
-            content_length = int(self.headers["Content-Length"])
-            file = self.rfile.read(content_length)
-            if file != None:
-                try:
-                    rmi, kwargs = self.query_parser(parsed_data, Put)
-                    if kwargs is None or rmi is None:
-                        message = "Function unavailable!"
-                    else:
-                        kwargs["file"] = file
-                        (message, _) = getattr(rmi, kwargs["func"])(**kwargs)
-                except ValueError as e:
-                    message = "RECIEVED Put REQUEST WITH BAD DATA: " + str(e)
-                except KeyError as e:
-                    message = "KeyError : " + str(e)
-                except Exception as e:
-                    message = "Unknown error : " + str(e)
-            else:
-                message = "NO FILE PROVIDED!"
+            try:
+                content_length = self.check_upload_headers(parsed_data)
+                rmi, kwargs = self.query_parser(parsed_data, Put)
+                if kwargs is None or rmi is None:
+                    message = "Function unavailable!"
+                else:
+                    # Stream body from socket, don't hold entire file in memory
+                    kwargs["file"] = UploadStream(self.rfile, content_length)
+                    (message, _) = getattr(rmi, kwargs["func"])(**kwargs)
+            except HttpError as e:
+                code = e.code
+                message = e.message
+                self.close_connection = True  # body was never read
+            except ValueError as e:
+                message = "RECIEVED Put REQUEST WITH BAD DATA: " + str(e)
+            except KeyError as e:
+                message = "KeyError : " + str(e)
+            except Exception as e:
+                message = "Unknown error : " + str(e)
         elif ctype == "html/text" or ctype == "json/application" or ctype is None:
             rmi, kwargs = self.query_parser(parsed_data, Put)
             if kwargs is None or rmi is None:
@@ -136,11 +182,12 @@ class S(BaseHTTPRequestHandler):
                 message = getattr(rmi, kwargs["func"])(**kwargs)
         else:
             message = "RECIEVED PUT REQUEST WITH BAD CTYPE: " + str(ctype)
-        self._set_response()
+        self._set_response(code)
         self.wfile.write(bytes(message, encoding="utf-8"))
 
     def do_POST(self):
 
+        code = 200
         if self.headers["Content-Length"]:
             content_length = int(self.headers["Content-Length"])
             post_data = self.rfile.read(content_length)
@@ -158,14 +205,21 @@ class S(BaseHTTPRequestHandler):
                     response = "Function unavailable!"
                 else:
                     response = getattr(rmi, kwargs["func"])(**kwargs)
+            except HttpError as e:
+                code = e.code
+                response = e.message
             except ValueError as e:
                 response = "RECIEVED POST REQUEST WITH BAD JSON: " + str(e)
                 print(response)
 
-        self._set_response()
+        self._set_response(code)
         self.wfile.write(bytes(response, encoding="utf-8"))
 
 
+metrics.describe("api_requests_total", "Handled REST API requests per method and func.")
+metrics.describe("api_request_seconds", "REST API request latency per method and func.")
+
+
 class Server(Thread):
     def __init__(self, shared):
         super().__init__()
@@ -173,7 +227,8 @@ class Server(Thread):
 
     def run(self):
         server_address = (self.shared.restapiHost, int(self.shared.restapiPort))
-        httpd = HTTPServer(server_address, partial(S, self.shared))
+        # Each request in own thread, long polling clients must not block others
+        httpd = ThreadingHTTPServer(server_address, partial(S, self.shared))
         try:
             print(
                 "REST API SERVER up and serving at ",
@@ -1,4 +1,5 @@
 import configparser
+import re
 
 """
 FloorplanToBlender3d
@@ -37,3 +38,23 @@ class ConfigHandler:
 
     def getboolean(self, section, value):
         return self.config.getboolean(section, value)
+
+    def getsize(self, section, value):
+        """Read a size such as 512, 64kb or 20gb and return it in bytes."""
+        units = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+        match = re.fullmatch(
+            r"\s*(\d+)\s*([kmg]?b?)\s*", self.config.get(section, value).lower()
+        )
+        if match is None:
+            raise ValueError("Bad size value for {} in {}".format(value, section))
+        return int(match.group(1)) * units[match.group(2).rstrip("b") or "b"]
+
+    def getduration(self, section, value):
+        """Read a duration such as 30, 30s, 5m, 2h or 7d and return it in seconds."""
+        units = {"": 1, "s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+        match = re.fullmatch(
+            r"\s*(\d+)\s*([smhd]?)\s*", self.config.get(section, value).lower()
+        )
+        if match is None:
+            raise ValueError("Bad duration value for {} in {}".format(value, section))
+        return int(match.group(1)) * units[match.group(2)]
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+
+"""
+FloorplanToBlender3d
+Copyright (C) 2022 Daniel Westberg
+"""
+
+"""
+Content addressed cache of created objects.
+Entries are keyed by image content hash, pipeline settings and output format,
+and shared with objects of each id through hardlinks.
+Shared files must never be written in place, unlink them before creating them again.
+An .obj refers to its .mtl by name, so it is copied with the reference rewritten.
+An entry is removed when no id references it anymore.
+"""
+
+# Files written next to an object of format, sharing its name
+COMPANIONS = {".obj": [".mtl"]}
+
+
+def link_or_copy(source, target):
+    """Atomically place a hardlink of source at target, copy if linking isn't possible"""
+    tmp = target + ".link"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(source, tmp)
+    except OSError:
+        with open(source, "rb") as src, open(tmp, "wb") as dst:
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                dst.write(chunk)
+    os.replace(tmp, target)
+
+
+def copy_obj(source, target, mtl_name):
+    """Atomically copy .obj source to target, referencing material library mtl_name"""
+    tmp = target + ".link"
+    with open(source, "rb") as src, open(tmp, "wb") as dst:
+        for line in src:
+            if line.startswith(b"mtllib "):
+                line = b"mtllib " + bytes(mtl_name, encoding="utf-8") + b"\n"
+            dst.write(line)
+    os.replace(tmp, target)
+
+
+def companion_paths(path, oformat):
+    """Paths of files written next to object path of format"""
+    base = os.path.splitext(path)[0]
+    return [base + suffix for suffix in COMPANIONS.get(oformat, [])]
+
+
+class ResultCache:
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + "/index.json"
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.entries = dict()  # key -> {"file": filename, "format": oformat, "ids": [id]}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, "r") as f:
+                self.entries = json.load(f)
+
+    def key(self, content_hash, settings, oformat):
+        """Create cache key from image content hash, settings dict and output format"""
+        data = json.dumps([content_hash, settings, oformat], sort_keys=True, default=str)
+        return hashlib.sha256(bytes(data, encoding="utf-8")).hexdigest()
+
+    def save_index(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.index_path)
+
+    def entry_path(self, key):
+        return self.path + "/" + self.entries[key]["file"]
+
+    def get(self, key, target, id):
+        """Link cached object to target for id.
+        @Return True on cache hit"""
+        with self.lock:
+            if key not in self.entries or not os.path.isfile(self.entry_path(key)):
+                self.entries.pop(key, None)
+                self.misses += 1
+                return False
+            self.hits += 1
+            oformat = self.entries[key]["format"]
+            sources = companion_paths(self.entry_path(key), oformat)
+            targets = companion_paths(target, oformat)
+            for source, companion in zip(sources, targets):
+                if os.path.isfile(source):
+                    link_or_copy(source, companion)
+            if oformat == ".obj":
+                copy_obj(self.entry_path(key), target, os.path.basename(targets[0]))
+            else:
+                link_or_copy(self.entry_path(key), target)
+            self.add_reference(key, id)
+            self.save_index()
+            return True
+
+    def put(self, key, source, id, oformat):
+        """Store created object of id in cache"""
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = {"file": key + oformat, "format": oformat, "ids": []}
+            link_or_copy(source, self.entry_path(key))
+            for companion, cached in zip(
+                companion_paths(source, oformat),
+                companion_paths(self.entry_path(key), oformat),
+            ):
+                if os.path.isfile(companion):
+                    link_or_copy(companion, cached)
+            self.add_reference(key, id)
+            self.save_index()
+
+    def add_reference(self, key, id):
+        """Let id reference key, an id only has one object per format"""
+        oformat = self.entries[key]["format"]
+        for other_key in list(self.entries):
+            if other_key != key and self.entries[other_key]["format"] == oformat:
+                self.remove_reference(other_key, id)
+        if id not in self.entries[key]["ids"]:
+            self.entries[key]["ids"].append(id)
+
+    def remove_reference(self, key, id):
+        entry = self.entries[key]
+        if id in entry["ids"]:
+            entry["ids"].remove(id)
+        if not entry["ids"]:
+            path = self.entry_path(key)
+            for file in [path] + companion_paths(path, entry["format"]):
+                if os.path.isfile(file):
+                    os.remove(file)
+            del self.entries[key]
+
+    def release(self, id, oformat=None):
+        """Remove references of id, of all formats if oformat is None,
+        drop entries no longer used"""
+        with self.lock:
+            for key in list(self.entries):
+                if oformat is None or self.entries[key]["format"] == oformat:
+                    self.remove_reference(key, id)
+            self.save_index()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "entries": len(self.entries),
+            }
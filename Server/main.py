@@ -9,11 +9,13 @@ Copyright (C) 2021 Daniel Westberg
 
 from shared_variables import shared_variables
 from swagger.swagger_flask import Swagger
+from process.create import set_server_paths
 
 # import webbrowser
 from api.server import Server
 
 if __name__ == "__main__":
+    set_server_paths()
     shared = shared_variables()
 
     server = Server(shared).start()
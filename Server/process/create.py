@@ -6,27 +6,69 @@ Copyright (C) 2022 Daniel Westberg
 The process class represents a thread handling stuff in new threads
 """
 from file.file_handler import FileHandler
+from file.result_cache import companion_paths
 from process.process import Process
-from subprocess import check_output
+from subprocess import Popen, CalledProcessError, TimeoutExpired
 import os
 import sys
 
 sys.path.insert(0, "..")
 from FloorplanToBlenderLib import (
+    cache,
     config,
     floorplan,
     generate,
     execution,
     IO,
     const,
+    metrics,
+    retention,
 )  # floorplan to blender lib
 
 """This process should create a 3d object file using the FTBLibrary"""
 
 
+# Library paths are relative to the repository, the server runs in Server/
+SERVER_PATHS = {
+    "DOOR_MODEL": "../Images/Models/Doors/door.png",
+    "DEFAULT_CALIBRATION_IMAGE_PATH": "../Images/Calibrations/wallcalibration.png",
+}
+
+
+def set_server_paths():
+    """Point library paths at the repository, call once at server startup"""
+    for name, path in SERVER_PATHS.items():
+        setattr(const, name, path)
+
+
+def pipeline_settings(config_path=None):
+    """All settings that affect a created object, used for result cache keys.
+    Files are keyed by content, their paths depend on where the server runs"""
+    f = floorplan.new_floorplan(config_path)
+    settings = {
+        key: value
+        for key, value in vars(f).items()
+        if not key.endswith("path") and key != "conf"
+    }
+    settings["const"] = {
+        key: value
+        for key, value in vars(const).items()
+        if key.isupper() and not key.endswith("PATH") and key not in SERVER_PATHS
+    }
+    settings["files"] = [
+        cache.file_hash(const.DOOR_MODEL),
+        cache.file_hash(f.calibration_image_path),
+    ]
+    return settings
+
+
 class Create(Process):
-    def __init__(self, func, id, oformat, shared_variables):
+    def __init__(
+        self, func, id, oformat, shared_variables, cache_key=None, config_path=None
+    ):
         super().__init__(shared_variables=shared_variables)
+        self.cache_key = cache_key
+        self.config_path = config_path
         # We expect following fields in data
         # {'func': 'transform', 'id':id, 'format':'.obj'}
         self.process["task"] = func
@@ -38,6 +80,30 @@ class Create(Process):
         self.update("out", id + oformat)
 
     def run(self):
+        # data and objects of a running process are never removed by retention
+        with retention.use(
+            "./storage/data/" + self.process["in"],
+            "./storage/objects/" + self.process["in"] + ".blend",
+            "./storage/objects/" + self.process["out"],
+        ):
+            super().run()
+
+    def call(self, args):
+        """Run command like check_output, kill it if process is cancelled"""
+        command = Popen(args)
+        while True:
+            try:
+                returncode = command.wait(timeout=0.5)
+                break
+            except TimeoutExpired:
+                if self.cancelled.is_set():
+                    command.kill()
+                    command.wait()
+                    self.check_cancelled()
+        if returncode != 0:
+            raise CalledProcessError(returncode, args)
+
+    def execute(self):
         # This is where the new thread will start
         image_path = self.shared.get_file_path(
             self.process["in"], self.shared.imagesPath, self.shared.images
@@ -53,44 +119,81 @@ class Create(Process):
         # TODO resize if wanted
 
         # hax fix for now
-        const.BASE_PATH = "./storage/data/" + self.process["in"] + "/"
-        const.DOOR_MODEL = "../Images/Models/Doors/door.png"
-        const.DEFAULT_CALIBRATION_IMAGE_PATH = (
-            "../Images/Calibrations/wallcalibration.png"
-        )
-        blender_install_path = IO.blender_installed()
-        config.get_default_blender_installation_path()
-
-        # Set other paths (don't need to change these)
-        program_path = os.getcwd()
+        base_path = "./storage/data/" + self.process["in"] + "/"
 
-        blender_script_path = "../Blender/floorplan_to_3dObject_in_blender.py"
-
-        # print(program_path, blender_script_path)
-
-        IO.clean_data_folder("./storage/data/" + self.process["in"])
+        IO.clean_data_folder(base_path)
 
         # Remove target file if it already exists!
         # Else we will get a bad rename!
+        # Objects may be hardlinks shared with the result cache and other ids,
+        # never let blender write into them
         fh = FileHandler()
-        tmp = "./storage/objects/" + self.process["in"] + ".blend"
-        if os.path.isfile(tmp):
-            fh.remove(tmp)
-
+        target = "./storage/objects/" + self.process["out"]
+        for tmp in [
+            "./storage/objects/" + self.process["in"] + ".blend",
+            target,
+        ] + companion_paths(target, self.process["format"]):
+            if os.path.isfile(tmp):
+                fh.remove(tmp)
+
+        self.check_cancelled()
         self.process["state"] = self.process["state"] + 1
         self.update("status", "Image processing calculations")
 
         # Generate data files
-        # TODO: fix this to work for several instances at once!
-        generate.base_path = "./storage/data/" + self.process["in"]
-        generate.path = "./storage/data/" + self.process["in"]
-        target_path = "./storage/objects/" + self.process["in"] + ".blend"
-        config_path = None
-        f = floorplan.new_floorplan(config_path)
+        f = floorplan.new_floorplan(self.config_path)
         f.image_path = image_path
 
         data_paths = list()
-        data_paths = [execution.simple_single(f, False)]
+        data_paths = [execution.simple_single(f, False, base_path)]
+        self.check_cancelled()
+
+        if IO.exports_directly(data_paths, self.process["format"]):
+            # indexed data is exported without blender, shared data is instanced
+            self.process["state"] = self.process["state"] + 2
+            self.update("status", "Create Object file")
+            with metrics.timer(stage="gltf_export"):
+                IO.export_gltf(target, data_paths, False)
+        else:
+            self.create_with_blender(data_paths)
+
+        self.process["state"] = self.process["state"] + 1
+        self.update("status", "Cleanup")
+
+        # Don't remove target!
+        # Remove data
+        # TODO: handle multiple floorplan removeal
+        if os.path.exists(base_path + "0/"):
+            fh.remove(base_path + "0/")
+
+        if self.cache_key is not None:
+            self.shared.result_cache.put(
+                self.cache_key,
+                "./storage/objects/" + self.process["out"],
+                self.process["in"],
+                self.process["format"],
+            )
+
+        self.process["state"] = self.process["state"] + 1
+        self.update("status", "Done")
+
+        # Reindex here
+        self.shared.reindex_files()
+
+    def create_with_blender(self, data_paths):
+        """Create blender project of data and export it to object format"""
+        blender_install_path = (
+            IO.blender_installed() or config.get_default_blender_installation_path()
+        )
+
+        # Set other paths (don't need to change these)
+        program_path = os.getcwd()
+
+        blender_script_path = "../Blender/floorplan_to_3dObject_in_blender.py"
+
+        # print(program_path, blender_script_path)
+
+        target_path = "./storage/objects/" + self.process["in"] + ".blend"
         # Debug print
         """
         print(str([blender_install_path,
@@ -106,45 +209,34 @@ class Create(Process):
 
         # Create blender project
         # TODO: change script to decide format!
-        check_output(
-            [
-                blender_install_path,
-                "-noaudio",  # this is a dockerfile ubuntu hax fix
-                "--background",
-                "--python",
-                blender_script_path,  # Send this as parameter to script
-                program_path + "/",
-                target_path,
-            ]
-            + data_paths
-        )
-
+        with metrics.timer(stage="blender_build"):
+            self.call(
+                [
+                    blender_install_path,
+                    "-noaudio",  # this is a dockerfile ubuntu hax fix
+                    "--background",
+                    "--python",
+                    blender_script_path,  # Send this as parameter to script
+                    program_path + "/",
+                    target_path,
+                ]
+                + data_paths
+            )
+
+        self.check_cancelled()
         self.process["state"] = self.process["state"] + 1
         self.update("status", "Create Object file")
 
-        check_output(
-            [
-                blender_install_path,
-                "-noaudio",  # this is a dockerfile ubuntu hax fix
-                "--background",
-                "--python",
-                "../Blender/blender_export_any.py",
-                "./storage/objects/" + self.process["in"] + ".blend",
-                self.process["format"],
-                "./storage/objects/" + self.process["out"],
-            ]
-        )
-
-        self.process["state"] = self.process["state"] + 1
-        self.update("status", "Cleanup")
-
-        # Don't remove target!
-        # Remove data
-        # TODO: handle multiple floorplan removeal
-        fh.remove("./storage/data/" + self.process["in"] + "0/")
-
-        self.process["state"] = self.process["state"] + 1
-        self.update("status", "Done")
-
-        # Reindex here
-        self.shared.reindex_files()
+        with metrics.timer(stage="blender_export"):
+            self.call(
+                [
+                    blender_install_path,
+                    "-noaudio",  # this is a dockerfile ubuntu hax fix
+                    "--background",
+                    "--python",
+                    "../Blender/blender_export_any.py",
+                    "./storage/objects/" + self.process["in"] + ".blend",
+                    self.process["format"],
+                    "./storage/objects/" + self.process["out"],
+                ]
+            )
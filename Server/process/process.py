@@ -9,6 +9,12 @@ The process class represents a thread handling stuff in new threads
 import threading
 
 
+class Cancelled(Exception):
+    """Raised inside a process when it has been cancelled"""
+
+    pass
+
+
 class Process(threading.Thread):
     def __init__(self, shared_variables=None):
         threading.Thread.__init__(self)
@@ -31,18 +37,50 @@ class Process(threading.Thread):
         self.process["comments"] = []
         self.process["state"] = 0
         self.process["cstate"] = 0
-        self.shared.all_processes.append(self.process)
+        self.process["priority"] = 0
+        self.process["queue_position"] = None
+        self.cancelled = threading.Event()
+        with self.shared.process_changed:
+            self.shared.all_processes.append(self.process)
+            self.shared.processes[str(self.pid)] = self.process
+        self.update("status", "Initiated")  # let subscribers know about new process
+
+    def run(self):
+        try:
+            self.execute()
+        except Cancelled:
+            self.update("status", "Cancelled")
+        except Exception as e:
+            self.process["state"] = -1
+            self.update("status", "ERROR: " + str(e))
+        finally:
+            self.onFinished()
+
+    def execute(self):
+        """Override this with the work of the process"""
+        pass
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check_cancelled(self):
+        """Call between stages, stops the process if it has been cancelled"""
+        if self.cancelled.is_set():
+            raise Cancelled()
 
     def update(self, field, value):
         """Update process status with less repetative code
         Always use this only once last if several fields are to be updated
         This will basicly sync with gui and other parts of the system"""
-        self.process[field] = value
-        index = self.shared.all_processes.index(self.process)
-        self.shared.all_processes[index] = self.process
+        with self.shared.process_changed:
+            self.process[field] = value
+            # version lets subscribers ask for changes since last seen version
+            self.shared.process_version += 1
+            self.process["version"] = self.shared.process_version
+            self.shared.process_changed.notify_all()
 
     def onFinished(self):
         """Called when a process finishes, here we want to place
         the process into the finished processes storage and start another
         thread if any are pending"""
-        pass
+        self.shared.scheduler.finished(self)
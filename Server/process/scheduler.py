@@ -0,0 +1,131 @@
+"""
+FloorplanToBlender3d
+Copyright (C) 2022 Daniel Westberg
+"""
+
+"""
+The scheduler limits how many processes run at once.
+Processes that can't start directly wait in a bounded priority queue,
+and are started from Process.onFinished when a running process is done.
+"""
+import heapq
+import itertools
+import threading
+
+
+class Scheduler:
+    def __init__(self, pool_size, queue_size):
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.running = []
+        self.pending = []  # heap of (-priority, order, process)
+        self.reserved = 0  # slots promised to processes not submitted yet
+        self.order = itertools.count()  # keeps FIFO order within same priority
+
+    def queue_depth(self):
+        return len(self.pending)
+
+    def active_workers(self):
+        return len(self.running)
+
+    def _free_slots(self):
+        return (
+            self.pool_size
+            + self.queue_size
+            - len(self.running)
+            - len(self.pending)
+            - self.reserved
+        )
+
+    def free_slots(self):
+        """How many processes can be submitted before the queue is full"""
+        with self.lock:
+            return self._free_slots()
+
+    def reserve(self, amount):
+        """Reserve slots for amount processes, all or none.
+        Use them with submit(reserved=True), give unused back with unreserve.
+        @Return False if not all fit"""
+        with self.lock:
+            if amount > self._free_slots():
+                return False
+            self.reserved += amount
+            return True
+
+    def unreserve(self, amount):
+        """Give back reserved slots that won't be submitted"""
+        with self.lock:
+            self.reserved -= amount
+
+    def submit(self, process, priority=0, reserved=False):
+        """Start process directly if a worker is free, else queue it.
+        @Param reserved, process uses a slot from reserve and is never refused
+        @Return False if queue is full and process was refused"""
+        with self.lock:
+            process.update("priority", priority)
+            if reserved:
+                self.reserved -= 1
+            elif self._free_slots() <= 0:
+                return False
+            if len(self.running) < self.pool_size:
+                self.running.append(process)
+                start = True
+            else:
+                heapq.heappush(self.pending, (-priority, next(self.order), process))
+                process.update("status", "Queued")
+                start = False
+            self.update_queue_positions()
+
+        if start:
+            self.set_queue_position(process, 0)
+            process.start()
+        return True
+
+    def cancel(self, pid):
+        """Cancel a queued or running process.
+        @Return True if process was found"""
+        with self.lock:
+            for index, (_, _, process) in enumerate(self.pending):
+                if str(process.pid) == str(pid):
+                    self.pending.pop(index)
+                    heapq.heapify(self.pending)
+                    self.set_queue_position(process, None)
+                    process.update("status", "Cancelled")
+                    self.update_queue_positions()
+                    return True
+
+            for process in self.running:
+                if str(process.pid) == str(pid):
+                    # process stops at next stage and reports itself as cancelled
+                    process.cancel()
+                    return True
+        return False
+
+    def finished(self, process):
+        """Remove finished process from workers and start next pending process"""
+        next_process = None
+        with self.lock:
+            if process in self.running:
+                self.running.remove(process)
+            if self.pending and len(self.running) < self.pool_size:
+                _, _, next_process = heapq.heappop(self.pending)
+                self.running.append(next_process)
+            self.update_queue_positions()
+
+        self.set_queue_position(process, None)
+        if next_process is not None:
+            self.set_queue_position(next_process, 0)
+            next_process.start()
+
+    def update_queue_positions(self):
+        """Store position in queue on each pending process record, 1 is next to start"""
+        for position, (_, _, process) in enumerate(sorted(self.pending), start=1):
+            self.set_queue_position(process, position)
+
+    def set_queue_position(self, process, position):
+        """Update queue position of process record if it changed.
+        Every update wakes all subscribers, so records in the queue
+        ahead of a change are left as they are."""
+        if process.process["queue_position"] != position:
+            process.update("queue_position", position)
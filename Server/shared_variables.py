@@ -1,4 +1,6 @@
 from config.config_handler import ConfigHandler
+from process.scheduler import Scheduler
+from file.result_cache import ResultCache
 
 from random import randint
 
@@ -6,7 +8,12 @@ import string
 import random
 import os
 import hashlib
+import mimetypes
 import sys
+import threading
+
+sys.path.insert(0, "..")
+from FloorplanToBlenderLib import retention  # floorplan to blender lib
 
 """
 FloorplanToBlender3d
@@ -21,6 +28,11 @@ class shared_variables:
     all_files = []
     all_ids = []
     all_processes = []
+    processes = dict()  # str(pid) -> process, same dicts as in all_processes
+    image_hashes = dict()  # id -> sha256 of uploaded content
+    batches = dict()  # bid -> {"oformat", "names": {id: filename}, "pids": {id: pid}}
+    process_version = 0  # increased on every process update
+    process_changed = threading.Condition()
     supported_config_formats = ".ini"
     supported_stacking_formats = ".txt"
     supported_image_formats = (".png", ".jpg", ".jpeg", ".tiff", ".bmp", ".gif")
@@ -40,12 +52,48 @@ class shared_variables:
         ".fbx",
         ".3ds",
     )
+    blender_content_types = {
+        ".obj": "model/obj",
+        ".x3d": "model/x3d+xml",
+        ".gltf": "model/gltf+json",
+        ".mtl": "model/mtl",
+        ".webm": "video/webm",
+        ".blend": "application/x-blender",
+        ".vrml": "model/vrml",
+        ".usd": "model/vnd.usd",
+        ".udim": "application/octet-stream",
+        ".stl": "model/stl",
+        ".svg": "image/svg+xml",
+        ".dxf": "image/vnd.dxf",
+        ".fbx": "application/octet-stream",
+        ".3ds": "application/x-3ds",
+    }
 
     def __init__(self):
         self.init_config()
+        self.scheduler = Scheduler(self.processPoolSize, self.processQueueSize)
         self.init_server_file_structure()
+        self.result_cache = ResultCache(self.parentPath + "/" + self.cachePath)
         self.reindex_files()
         self.init_ids()
+        self.retention = retention.Retention(
+            [
+                self.parentPath + "/" + self.dataPath,
+                self.parentPath + "/" + self.objectsPath,
+            ],
+            self.retentionMaxSize,
+            self.retentionMaxAge,
+            on_evict=self.on_evict,
+        ).start(self.retentionFrequency)
+
+    def on_evict(self, removed):
+        """Release cached objects of evicted objects, their hardlinks keep them on disk"""
+        objects = os.path.abspath(self.parentPath + "/" + self.objectsPath)
+        for path in removed:
+            if os.path.dirname(os.path.abspath(path)) == objects:
+                id, oformat = os.path.splitext(os.path.basename(path))
+                self.result_cache.release(id, oformat)
+        self.reindex_files()
 
     def get_object_path(self, id, format=".blend"):
         for file in self.objects:
@@ -53,12 +101,65 @@ class shared_variables:
                 return self.parentPath + "/" + self.objectsPath + "/" + id + format
         return None
 
-    def get_process(self, pid):
-        for process in self.all_processes:
-            if str(process["pid"]) == pid:
-                return process
+    def supported_upload_format(self, iformat):
+        return (
+            iformat in self.supported_image_formats
+            or iformat in self.supported_config_formats
+            or iformat in self.supported_stacking_formats
+        )
+
+    def get_content_type(self, path):
+        suffix = os.path.splitext(path)[1].lower()
+        if suffix in self.blender_content_types:
+            return self.blender_content_types[suffix]
+        content_type, _ = mimetypes.guess_type(path)
+        if content_type is None:
+            return "application/octet-stream"
+        return content_type
+
+    def get_image_hash(self, id):
+        """sha256 of image content, hashed from file if not known since upload"""
+        if id not in self.image_hashes:
+            path = self.get_file_path(id, self.imagesPath, self.images)
+            if path is None:
+                return None
+            content_hash = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    content_hash.update(chunk)
+            self.image_hashes[id] = content_hash.hexdigest()
+        return self.image_hashes[id]
+
+    def get_file_by_hash(self, content_hash):
+        """return path to an uploaded file with same content, None if there is none"""
+        for id, _hash in self.image_hashes.items():
+            if _hash == content_hash:
+                path = self.get_file_path(id, self.imagesPath, self.images)
+                if path is not None and os.path.isfile(path):
+                    return path
         return None
 
+    def process_changed_since(self, since, pid=None):
+        """True if any process, or process pid, was updated after version since,
+        call with process_changed held"""
+        if pid is None:
+            return self.process_version > since
+        process = self.processes.get(pid)
+        return process is not None and process.get("version", 0) > since
+
+    def get_process_changes(self, since, pid=None):
+        """Copies of processes updated after version since, call with process_changed held"""
+        if pid is None:
+            processes = self.all_processes
+        else:
+            processes = [self.processes[pid]] if pid in self.processes else []
+        return [
+            dict(process) for process in processes if process.get("version", 0) > since
+        ]
+
+    def get_process(self, pid):
+        return self.processes.get(pid)
+
     def get_file_path(self, id, type_path, list):
         """return full path to file with id, return None if can't be found"""
         for file in list:
@@ -114,11 +215,8 @@ class shared_variables:
         return randint(range_start, range_end)
 
     def pid_exist(self, pid):
-        """Go through all processes:s and see if exist"""
-        for process in self.all_processes:
-            if pid == process["pid"]:
-                return True
-        return False
+        """See if process with pid exist"""
+        return str(pid) in self.processes
 
     def id_exist(self, id):
         """Go through all id:s and see if exist"""
@@ -144,7 +242,12 @@ class shared_variables:
         stackingfiles = []
         objects = []
 
-        for _, _, files in os.walk(startpath):
+        for _, dirs, files in os.walk(startpath):
+            # cached results are only reachable through ids linking them
+            if self.cachePath in dirs:
+                dirs.remove(self.cachePath)
+            if self.batchesPath in dirs:
+                dirs.remove(self.batchesPath)
 
             for f in files:
                 if f.lower().endswith(self.supported_config_formats):
@@ -164,8 +267,8 @@ class shared_variables:
         if not os.path.exists(self.parentPath):
             os.makedirs(self.parentPath)
 
-        if not os.path.exists(self.parentPath + "/data"):
-            os.makedirs(self.parentPath + "/data")
+        if not os.path.exists(self.parentPath + "/" + self.dataPath):
+            os.makedirs(self.parentPath + "/" + self.dataPath)
 
         if not os.path.exists(self.parentPath + "/" + self.imagesPath):
             os.makedirs(self.parentPath + "/" + self.imagesPath)
@@ -179,6 +282,12 @@ class shared_variables:
         if not os.path.exists(self.parentPath + "/" + self.configPath):
             os.makedirs(self.parentPath + "/" + self.configPath)
 
+        if not os.path.exists(self.parentPath + "/" + self.cachePath):
+            os.makedirs(self.parentPath + "/" + self.cachePath)
+
+        if not os.path.exists(self.parentPath + "/" + self.batchesPath):
+            os.makedirs(self.parentPath + "/" + self.batchesPath)
+
     def init_config(self):
         """Load configs from config file"""
         conf = ConfigHandler()
@@ -193,5 +302,18 @@ class shared_variables:
         self.parentPath = conf.get("Storage", "PARENT")
         self.imagesPath = conf.get("Storage", "IMAGES")
         self.objectsPath = conf.get("Storage", "OBJECTS")
+        self.dataPath = conf.get("Storage", "OBJECT_DATA")
         self.stackingPath = conf.get("Storage", "STACKING")
         self.configPath = conf.get("Storage", "CONFIG")
+        self.cachePath = conf.get("Storage", "CACHE")
+        self.batchesPath = conf.get("Storage", "BATCHES")
+        self.retentionMaxSize = conf.getsize("Storage", "RETENTION_MAX_SIZE")
+        self.retentionMaxAge = conf.getduration("Storage", "RETENTION_MAX_AGE")
+        self.retentionFrequency = conf.getduration("Storage", "RETENTION_FREQUENCY")
+
+        self.maxUploadSize = conf.getsize("RestApi", "MAX_UPLOAD_SIZE")
+        self.maxBatchUploadSize = conf.getsize("RestApi", "MAX_BATCH_UPLOAD_SIZE")
+        self.uploadChunkSize = conf.getsize("RestApi", "UPLOAD_CHUNK_SIZE")
+        self.processPoolSize = int(conf.get("RestApi", "PROCESS_POOL_SIZE"))
+        self.processQueueSize = int(conf.get("RestApi", "PROCESS_QUEUE_SIZE"))
+        self.maxLongPollTimeout = float(conf.get("RestApi", "MAX_LONG_POLL_TIMEOUT"))
@@ -0,0 +1,120 @@
+import base64
+import cv2
+import json
+import os
+import sys
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    from FloorplanToBlenderLib import *  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+
+def test_find_files_max_depth(tmp_path):
+    folder = tmp_path / "a" / "b" / "c"
+    folder.mkdir(parents=True)
+    (folder / "blender").write_text("")
+    assert IO.find_files("blender", str(tmp_path), 2) is None
+    assert IO.find_files("blender", str(tmp_path), 3) == str(folder / "blender")
+    assert IO.find_files("blender", str(tmp_path)) == str(folder / "blender")
+
+
+def test_blender_installed_env(tmp_path, monkeypatch):
+    path = tmp_path / "blender"
+    path.write_text("")
+    os.chmod(str(path), 0o755)
+    monkeypatch.setenv(const.BLENDER_PATH_ENV, str(path))
+    assert IO.blender_installed(search=False) == str(path)
+
+
+def test_blender_installed_miss_searched_once(monkeypatch):
+    searched = []
+    monkeypatch.delenv(const.BLENDER_PATH_ENV, raising=False)
+    monkeypatch.setattr(IO, "blender_path", None)
+    monkeypatch.setattr(IO, "blender_search_missed", False)
+    monkeypatch.setattr(config, "get_default_blender_installation_path", lambda: None)
+    monkeypatch.setattr(IO, "which", lambda name: None)
+    monkeypatch.setattr(IO, "find_known_blender", lambda platform_name: None)
+    monkeypatch.setattr(
+        IO, "find_files", lambda *args: searched.append(args[1]) or None
+    )
+    assert IO.blender_installed() is None
+    folders = len(searched)
+    assert IO.blender_installed() is None
+    # folders are walked by the first call only
+    assert len(searched) == folders
+
+
+def test_decode_reduction():
+    assert IO.decode_reduction(1.5) == 1
+    assert IO.decode_reduction(0.6) == 1
+    assert IO.decode_reduction(0.4) == 2
+    assert IO.decode_reduction(0.1) == 2
+
+
+def test_read_image_reduced(tmp_path):
+    # twice as large as example, so it is rescaled to less than half
+    path = str(tmp_path / "large.png")
+    img = cv2.imread(os.path.dirname(__file__) + "/../Images/Examples/example.png")
+    cv2.imwrite(path, cv2.resize(img, None, fx=2, fy=2))
+    f = floorplan.floorplan()
+    f.remove_noise = True
+    f.rescale_image = True
+    f.wall_size_calibration = 6
+
+    setattr(f, const.STR_REDUCED_DECODE, False)
+    full_img, full_gray, full_scale = IO.read_image(path, f)
+    setattr(f, const.STR_REDUCED_DECODE, True)
+    img, gray, scale_factor = IO.read_image(path, f)
+    assert scale_factor == full_scale and IO.decode_reduction(scale_factor) == 2
+    assert (img == full_img).all() and (gray == full_gray).all()
+
+    full_detail = detect.detail_image(path, scale_factor)
+    detail = detect.detail_image(path, scale_factor, reduced=True)
+    assert detail.shape == full_detail.shape
+    assert abs(detail.astype(int) - full_detail).mean() < 3
+
+
+def test_export_gltf_instances(tmp_path):
+    origin = str(tmp_path / "0") + "/"
+    os.makedirs(origin)
+    verts = [[0, 0, 0], [2, 0, 0], [2, 1, 0], [1, 1, 0], [1, 2, 0], [0, 2, 0]]
+    IO.save_to_file(
+        origin + const.FLOOR_MESH, {"verts": verts, "faces": [list(range(6))]}, False
+    )
+    data_paths = []
+    for index in range(2):
+        path = str(tmp_path / str(index)) + "/"
+        os.makedirs(path, exist_ok=True)
+        transform_data = {
+            const.STR_POSITION: [index * 10, 0, 0],
+            const.STR_ROTATION: [0, 0, 90],
+            "scale": [1, 1, 1],
+            const.STR_SHAPE: [2, 2, 0],
+            const.STR_ORIGIN_PATH: origin,
+        }
+        IO.save_to_file(path + "transform", transform_data, False)
+        data_paths.append(path)
+
+    IO.export_gltf(str(tmp_path / "out.gltf"), data_paths, False)
+    with open(str(tmp_path / "out.gltf")) as f:
+        gltf = json.load(f)
+
+    # shared data is one mesh, used by one node per floorplan
+    assert len(gltf["meshes"]) == 1
+    nodes = gltf["nodes"][1:]
+    assert [node["mesh"] for node in nodes] == [0, 0]
+    assert [node["translation"] for node in nodes] == [[0, 0, 0], [10, 0, 0]]
+    position, indices = [
+        gltf["accessors"][index]
+        for index in (
+            gltf["meshes"][0]["primitives"][0]["attributes"]["POSITION"],
+            gltf["meshes"][0]["primitives"][0]["indices"],
+        )
+    ]
+    assert position["count"] == 6 and indices["count"] == 12
+    # centered on shape, as in blender
+    assert position["min"] == [-1, -1, 0] and position["max"] == [1, 1, 0]
+    data = base64.b64decode(gltf["buffers"][0]["uri"].split(",")[1])
+    assert len(data) == gltf["buffers"][0]["byteLength"] == 6 * 12 + 12 * 4
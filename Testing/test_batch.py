@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import sys
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    from FloorplanToBlenderLib import *  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+
+def test_find_images(tmp_path):
+    for name in ["a.png", "b.JPG", "notes.txt"]:
+        (tmp_path / name).write_text("")
+    images = batch.find_images([str(tmp_path), str(tmp_path / "*.png")])
+    assert [image.split("/")[-1] for image in images] == ["a.png", "b.JPG"]
+
+
+def test_image_name():
+    assert batch.image_name("a/plan.png") != batch.image_name("b/plan.png")
+    assert batch.image_name("a/plan.png").startswith("plan_")
+
+
+def test_manifest_resume(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = batch.Manifest(path)
+    manifest.entry("b.png")
+    manifest.update("a.png", status=batch.DONE, timings={"detect": 1.0})
+
+    resumed = batch.Manifest(path)
+    assert resumed.status("a.png") == batch.DONE
+    assert resumed.entry("a.png")["timings"]["detect"] == 1.0
+    assert resumed.summary() == {batch.DONE: 1, batch.PENDING: 1}
+
+
+def test_run_gltf_without_blender(tmp_path, monkeypatch):
+    repository = os.path.join(os.path.dirname(__file__), "..")
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("Images/Calibrations")
+    shutil.copy(
+        repository + "/Images/Calibrations/wallcalibration.png", "Images/Calibrations"
+    )
+    shutil.copy(repository + "/Images/Examples/example.png", "plan.png")
+    config.generate_file()
+    features = {
+        name: "false"
+        for name in (
+            const.STR_ROOMS,
+            const.STR_WALLS,
+            const.STR_DOORS,
+            const.STR_WINDOWS,
+        )
+    }
+    features[const.STR_FLOORS] = "true"
+    config.update(const.IMAGE_DEFAULT_CONFIG_FILE_NAME, const.FEATURES, features)
+    settings = dict(config.get(const.IMAGE_DEFAULT_CONFIG_FILE_NAME, const.SETTINGS))
+    settings[const.STR_INDEXED_MESH] = "true"
+    config.update(const.IMAGE_DEFAULT_CONFIG_FILE_NAME, const.SETTINGS, settings)
+
+    manifest = batch.run(["plan.png"], workers=1, outformat=const.DIRECT_FORMAT)
+
+    # glTF of indexed data is exported without blender
+    entry = manifest.entry("plan.png")
+    assert entry["status"] == batch.DONE
+    assert entry["object"].endswith(const.DIRECT_FORMAT)
+    with open("." + entry["object"]) as f:
+        gltf = json.load(f)
+    assert len(gltf["meshes"]) == 1
+    assert gltf["nodes"][1]["mesh"] == 0
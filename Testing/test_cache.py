@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    from FloorplanToBlenderLib import *  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+
+def test_hash_values():
+    a = np.zeros((2, 2), np.uint8)
+    assert cache.hash_values(a) == cache.hash_values(a.copy())
+    assert cache.hash_values(a) != cache.hash_values(a.astype(np.int32))
+    assert cache.hash_values([1, 2]) != cache.hash_values([[1, 2]])
+
+
+def test_evict_least_recently_used(tmp_path):
+    stage_cache = cache.StageCache(str(tmp_path), max_bytes=10000)
+    stage_cache.put("a", np.zeros(3000, np.uint8))
+    stage_cache.put("b", np.zeros(3000, np.uint8))
+    # make b older than a
+    past = time.time() - 100
+    os.utime(stage_cache.entry_path("b"), (past, past))
+    stage_cache.put("c", np.zeros(5000, np.uint8))
+    assert stage_cache.get("a")[0]
+    assert not stage_cache.get("b")[0]
+    assert stage_cache.get("c")[0]
+    assert stage_cache.size() <= 10000
+
+
+def test_call(tmp_path, monkeypatch):
+    calls = []
+
+    def stage(img):
+        calls.append(1)
+        return img * 2
+
+    stage_cache = cache.StageCache(str(tmp_path))
+    img = np.ones((4, 4), np.uint8)
+    assert (cache.call(stage_cache, "wall_mask", stage, img) == 2).all()
+    assert (cache.call(stage_cache, "wall_mask", stage, img) == 2).all()
+    assert len(calls) == 1
+
+    # stage reruns when a parameter it depends on changes
+    monkeypatch.setattr(const, "WALL_FILTER_DISTANCE", const.WALL_FILTER_DISTANCE + 1)
+    cache.call(stage_cache, "wall_mask", stage, img)
+    assert len(calls) == 2
+    # but not when a parameter of another stage changes
+    monkeypatch.setattr(const, "OUTER_CONTOURS_TRESHOLD", [1, 2])
+    cache.call(stage_cache, "wall_mask", stage, img)
+    assert len(calls) == 2
+
+
+def test_call_disabled():
+    calls = []
+
+    def stage(img):
+        calls.append(1)
+        return img
+
+    img = np.ones((4, 4), np.uint8)
+    cache.call(None, "wall_mask", stage, img)
+    cache.call(None, "wall_mask", stage, img)
+    assert len(calls) == 2
@@ -0,0 +1,63 @@
+import os
+import socket
+import subprocess
+import sys
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    from FloorplanToBlenderLib import *  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+
+def test_claim_once(tmp_path):
+    (tmp_path / "plan.png").write_text("")
+    first = daemon.claim(str(tmp_path), "plan.png", "a")
+    second = daemon.claim(str(tmp_path), "plan.png", "b")
+    assert first is not None and first.endswith("a_plan.png")
+    assert second is None
+    assert daemon.queued_images(str(tmp_path)) == []
+
+
+def test_claim_next(tmp_path):
+    for name in ["a.png", "notes.txt"]:
+        (tmp_path / name).write_text("")
+    name, path = daemon.claim_next(str(tmp_path), "worker")
+    assert name == "a.png"
+    assert daemon.claim_next(str(tmp_path), "worker") is None
+
+
+def test_publish_free_name(tmp_path):
+    for work in ["work1", "work2"]:
+        (tmp_path / work).mkdir()
+        (tmp_path / work / "result.txt").write_text("")
+    first = daemon.publish(str(tmp_path / "work1"), str(tmp_path / "plan"))
+    second = daemon.publish(str(tmp_path / "work2"), str(tmp_path / "plan"))
+    assert first.endswith("plan")
+    assert second.endswith("plan_1")
+
+
+def test_requeue_stale(tmp_path):
+    claimed = tmp_path / const.DAEMON_CLAIMED
+    claimed.mkdir()
+    host = socket.gethostname()
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    names = {
+        "crashed.png": host + "-" + str(finished.pid) + "_crashed.png",
+        "running.png": host + "-" + str(os.getpid()) + "_running.png",
+        "old-plan.png": "otherhost-1_old-plan.png",
+        "recent.png": "otherhost-1_recent.png",
+    }
+    for claim_name in names.values():
+        (claimed / claim_name).write_text("")
+    old = os.path.getmtime(str(claimed / names["old-plan.png"])) - 100
+    os.utime(str(claimed / names["old-plan.png"]), (old, old))
+
+    requeued = daemon.requeue_stale(str(tmp_path), timeout=50)
+    # gone worker on this host, or too old claim of another host
+    assert sorted(requeued) == ["crashed.png", "old-plan.png"]
+    assert daemon.queued_images(str(tmp_path)) == ["old-plan.png", "crashed.png"]
+    assert sorted(os.listdir(str(claimed))) == sorted(
+        [names["running.png"], names["recent.png"]]
+    )
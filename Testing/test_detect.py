@@ -1,3 +1,4 @@
+import os
 import sys
 import numpy as np
 import cv2
@@ -29,6 +30,25 @@ def test_find_room():
     assert True
 
 
+def test_find_rooms_labeled():
+    path = os.path.dirname(__file__) + "/../Images/Examples/example.png"
+    walls = ~detect.wall_filter(cv2.imread(path, cv2.IMREAD_GRAYSCALE))
+    np.random.seed(0)
+    masks, colored = detect.find_rooms(walls.copy())
+    np.random.seed(0)
+    rooms, labeled_colored = detect.find_rooms(walls.copy(), labeled=True)
+
+    assert len(rooms) == len(masks) > 0
+    assert rooms.labels.dtype == np.int32
+    assert np.array_equal(colored, labeled_colored)
+    for i, mask in enumerate(masks):
+        assert np.array_equal(rooms.mask(i), mask)
+        assert rooms.areas[i] == np.count_nonzero(mask)
+        crop, (x, y) = rooms.crop(i)
+        assert np.count_nonzero(crop) == rooms.areas[i]
+        assert mask[y : y + crop.shape[0], x : x + crop.shape[1]][crop].all()
+
+
 def test_and_remove_precise_boxes():
     _ = detect.and_remove_precise_boxes(gray)
     assert True
@@ -42,3 +62,29 @@ def test_outer_contours():
 def test_find_details():
     _ = detect.find_details(gray)
     assert True
+
+
+def test_wall_graph():
+    # T shaped walls, 10 pixels thick
+    walls = np.zeros((height, width), dtype=np.uint8)
+    walls[100:110, 50:450] = 255
+    walls[100:400, 245:255] = 255
+    nodes, edges, thickness = detect.wall_graph(walls)
+    # horizontal wall is split at the junction
+    assert len(nodes) == 4
+    assert len(edges) == 3
+    assert np.allclose(thickness, 10)
+    assert any(np.allclose(node, (249.5, 104.5)) for node in nodes)
+
+
+def test_wall_graph_min_length(monkeypatch):
+    walls = np.zeros((height, width), dtype=np.uint8)
+    walls[100:110, 50:100] = 255
+    assert len(detect.wall_graph(walls)[1]) == 1
+    monkeypatch.setattr(const, "WALL_GRAPH_MIN_LENGTH", 60)
+    assert len(detect.wall_graph(walls)[1]) == 0
+
+
+def test_wall_graph_empty():
+    nodes, edges, thickness = detect.wall_graph(np.zeros((10, 10), dtype=np.uint8))
+    assert len(nodes) == len(edges) == len(thickness) == 0
@@ -1,3 +1,4 @@
+import os
 import sys
 
 try:
@@ -9,3 +10,59 @@ except ImportError:
 
 def test_validate_shape():
     assert generate.validate_shape([1, 1, 1], [2, 3, 4])
+
+
+def test_run_stages():
+    stages = {
+        "read": (lambda results: 2, []),
+        "double": (lambda results: results["read"] * 2, ["read"]),
+        "square": (lambda results: results["read"] ** 2, ["read"]),
+        "sum": (
+            lambda results: results["double"] + results["square"],
+            ["double", "square"],
+        ),
+    }
+    for threads in [1, 4]:
+        results, timings = generate.run_stages(stages, threads)
+        assert results["sum"] == 8
+        assert timings["sum"][0] >= timings["double"][1]
+    path = generate.critical_path(stages, timings)
+    assert path[0] == "read" and path[-1] == "sum"
+
+
+def test_read_cache_restores_calibration(tmp_path, monkeypatch):
+    # calibration image path is relative to repository
+    monkeypatch.chdir(os.path.dirname(__file__) + "/..")
+    monkeypatch.setattr(const, "STAGE_CACHE_PATH", str(tmp_path / "cache") + "/")
+    calibrations = []
+    for run in range(2):
+        f = floorplan.new_floorplan(const.IMAGE_DEFAULT_CONFIG_FILE_NAME)
+        f.image_path = "Images/Examples/example.png"
+        f.walls = f.rooms = f.windows = f.doors = False
+        setattr(f, const.STR_STAGE_CACHE, True)
+        path = str(tmp_path / str(run)) + "/"
+        os.makedirs(path)
+        generate.generate_data(f, path, [1, 1, 1], False)
+        calibrations.append(f.wall_size_calibration)
+    assert calibrations[0] != 0 and calibrations[0] == calibrations[1]
+
+
+def test_read_cache_keyed_by_reduced_decode(tmp_path, monkeypatch):
+    monkeypatch.chdir(os.path.dirname(__file__) + "/..")
+    monkeypatch.setattr(const, "STAGE_CACHE_PATH", str(tmp_path / "cache") + "/")
+    reads = []
+    read_image = IO.read_image
+    monkeypatch.setattr(
+        IO, "read_image", lambda *args: reads.append(args) or read_image(*args)
+    )
+    for run, reduced in enumerate([False, True, False, True]):
+        f = floorplan.new_floorplan(const.IMAGE_DEFAULT_CONFIG_FILE_NAME)
+        f.image_path = "Images/Examples/example.png"
+        f.walls = f.rooms = f.windows = f.doors = False
+        setattr(f, const.STR_STAGE_CACHE, True)
+        setattr(f, const.STR_REDUCED_DECODE, reduced)
+        path = str(tmp_path / str(run)) + "/"
+        os.makedirs(path)
+        generate.generate_data(f, path, [1, 1, 1], False)
+    # each setting reads once, later runs hit the cache of their own setting
+    assert len(reads) == 2
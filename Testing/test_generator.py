@@ -0,0 +1,122 @@
+import cv2
+import sys
+import tracemalloc
+import numpy as np
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    from FloorplanToBlenderLib import *  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+gray = np.full((200, 200), 255, dtype=np.uint8)
+cv2.circle(gray, (100, 100), 80, 0, -1)
+
+
+def test_geometry_buffer():
+    buffer = geometry.GeometryBuffer(capacity=2)
+    buffer.add([[0, 0, 0], [1, 1, 1]])
+    buffer.add([[2, 2, 2], [3, 3, 3], [4, 4, 4]])
+    assert len(buffer) == 5
+    assert buffer.features == 2
+    assert buffer.feature(1)[0][0] == 2
+    buffer.clear()
+    assert len(buffer) == 0
+
+
+def test_geometry_buffer_add_packed():
+    boxes = [[[0, 0], [100, 0], [100, 100]], [[0, 0], [50, 0], [50, 50], [0, 50]]]
+    points, offsets = transform.pack_boxes(boxes)
+    verts, faces = transform.create_nx4_verts_and_faces_packed(
+        points, offsets, dtype=np.float64
+    )
+    packed = geometry.GeometryBuffer()
+    packed.add_packed(verts, 4 * offsets, faces)
+    lists = geometry.GeometryBuffer()
+    verts, faces, _ = transform.create_nx4_verts_and_faces(boxes)
+    lists.extend(verts, faces[0])
+    assert packed.offsets == lists.offsets
+    assert np.array_equal(packed.verts, lists.verts)
+    assert all(np.array_equal(a, b) for a, b in zip(packed.faces, lists.faces))
+
+    verts, _, feature_offsets = transform.create_4xn_verts_and_faces_packed(
+        points, offsets, ground=True, dtype=np.float64
+    )
+    packed.add_packed(verts, feature_offsets)
+    verts, _, _ = transform.create_4xn_verts_and_faces(boxes, ground=True)
+    lists.extend(verts)
+    assert packed.features == lists.features == 6
+    assert all(np.array_equal(a, b) for a, b in zip(packed.faces, lists.faces))
+    assert list(packed.low) == list(lists.low)
+    assert list(packed.high) == list(lists.high)
+
+
+def test_floor_faces_are_instance_local(tmp_path):
+    path = str(tmp_path) + "/"
+    first = generator.Floor(gray, path, [1, 1, 1])
+    second = generator.Floor(gray, path, [1, 1, 1])
+    assert first.faces == second.faces
+    assert len(second.faces) == len(second.verts)
+
+
+def test_floor_memory_is_flat(tmp_path):
+    path = str(tmp_path) + "/"
+    tracemalloc.start()
+    for _ in range(100):
+        generator.Floor(gray, path, [1, 1, 1])
+    before, _ = tracemalloc.get_traced_memory()
+    for _ in range(900):
+        generator.Floor(gray, path, [1, 1, 1])
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert after - before < 64 * 1024
+
+
+def test_geometry_buffer_extent():
+    buffer = geometry.GeometryBuffer()
+    buffer.add([[1, 5, 0], [3, 2, 1]])
+    buffer.add([[-1, 4, 2]])
+    assert list(buffer.low) == [-1, 2, 0]
+    assert list(buffer.high) == [3, 5, 2]
+
+
+def test_floor_shape(tmp_path):
+    floor = generator.Floor(gray, str(tmp_path) + "/", [1, 1, 1])
+    poslist = np.array(transform.verts_to_poslist(floor.verts))
+    assert floor.shape[0] == poslist[:, 0].max() - poslist[:, 0].min()
+    assert floor.shape == floor.get_shape(floor.verts)
+
+
+def test_weld_vertices():
+    # three walls of a triangle, each with its own 4 verts
+    points, offsets = transform.pack_boxes([[[[0, 0]], [[100, 0]], [[100, 100]]]])
+    verts, faces = transform.create_nx4_verts_and_faces_packed(points, offsets)
+    welded, welded_faces = geometry.weld_vertices(verts, [faces])
+    assert len(verts) == 12
+    assert len(welded) == 6
+    assert len(welded_faces) == 3
+
+
+def test_weld_vertices_drops_degenerate_faces():
+    verts = [[0, 0, 0], [1, 0, 0], [1, 0, 0.00001], [0, 0, 1]]
+    welded, faces = geometry.weld_vertices(verts, [np.array([[0, 1, 2]]), [[0, 1, 3]]])
+    assert len(welded) == 3
+    assert len(faces) == 1 and sorted(faces[0]) == [0, 1, 2]
+
+
+def test_floor_indexed(tmp_path):
+    path = str(tmp_path) + "/"
+    floor = generator.Floor(gray, path, [1, 1, 1], indexed=True)
+    verts, faces = floor.mesh
+    assert len(faces) == 1
+    assert (tmp_path / (const.FLOOR_MESH + const.SAVE_DATA_FORMAT)).exists()
+    assert not (tmp_path / (const.FLOOR_VERTS + const.SAVE_DATA_FORMAT)).exists()
+
+
+def test_detail_key_door_model(tmp_path, monkeypatch):
+    model = tmp_path / "door.png"
+    model.write_bytes(b"first")
+    monkeypatch.setattr(const, "DOOR_MODEL", str(model))
+    first = cache.hash_values(generator.detail_key("image.png", 1, None))
+    model.write_bytes(b"second door")
+    assert cache.hash_values(generator.detail_key("image.png", 1, None)) != first
@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    import FloorplanToBlenderLib  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+# Seconds a detection only import may take, measured in a fresh interpreter.
+# Loading cv2 and numpy is most of it, about 0.2 s on a laptop.
+IMPORT_BUDGET = 1.5
+
+HEAVY_MODULES = ["matplotlib", "scipy", "PIL", "pyfiglet"]
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from FloorplanToBlenderLib import detect, generate, generator
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, [m for m in %r if m in sys.modules]]))
+""" % (
+    HEAVY_MODULES,
+)
+
+
+def import_detection():
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    out = subprocess.check_output([sys.executable, "-c", SCRIPT], cwd=root)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def test_detection_import_is_minimal():
+    _, loaded = import_detection()
+    assert loaded == []
+
+
+def test_detection_import_budget():
+    # best of a few runs, the first one may pay for a cold disk cache
+    seconds = min(import_detection()[0] for _ in range(3))
+    assert seconds < IMPORT_BUDGET
+
+
+def test_lazy_submodule():
+    assert FloorplanToBlenderLib.transform.simplify_box is not None
+    assert "metrics" in dir(FloorplanToBlenderLib)
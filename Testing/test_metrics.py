@@ -0,0 +1,49 @@
+import sys
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    from FloorplanToBlenderLib import *  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+
+def test_timer():
+    metrics.reset()
+    with metrics.timer(stage="test"):
+        pass
+    hist = metrics.get_histogram(const.METRICS_STAGE, stage="test")
+    assert hist.count == 1
+    assert hist.counts[-1] == 1
+
+
+def test_timed():
+    metrics.reset()
+
+    @metrics.timed("test")
+    def func():
+        return 5
+
+    assert func() == 5
+    assert metrics.get_histogram(const.METRICS_STAGE, stage="test").count == 1
+
+
+def test_histogram_buckets():
+    hist = metrics.Histogram(buckets=(1, 2))
+    hist.observe(0.5)
+    hist.observe(1.5)
+    hist.observe(3)
+    assert hist.counts == [1, 2]
+    assert hist.count == 3
+
+
+def test_export():
+    metrics.reset()
+    metrics.increment("requests_total", func="info")
+    metrics.set_gauge("queue_depth", 3)
+    metrics.observe("latency_seconds", 0.1, func="info")
+    text = metrics.export()
+    assert 'requests_total{func="info"} 1' in text
+    assert "queue_depth 3" in text
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{func="info",le="+Inf"} 1' in text
+    assert 'latency_seconds_count{func="info"} 1' in text
@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    from FloorplanToBlenderLib import *  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+
+def create_entry(folder, name, size, age):
+    """Data folder of size bytes last used age seconds ago"""
+    path = os.path.join(str(folder), name)
+    os.makedirs(path)
+    with open(os.path.join(path, "verts.txt"), "wb") as f:
+        f.write(b"0" * size)
+    past = time.time() - age
+    os.utime(path, (past, past))
+    return path
+
+
+def test_evict_least_recently_used(tmp_path):
+    old = create_entry(tmp_path, "0", 3000, 300)
+    used = create_entry(tmp_path, "1", 3000, 200)
+    new = create_entry(tmp_path, "2", 3000, 100)
+    retention.touch(used)
+
+    removed = retention.Retention([str(tmp_path)], max_bytes=7000).evict()
+    assert removed == [old]
+    assert os.path.isdir(used)
+    assert os.path.isdir(new)
+
+
+def test_evict_expired(tmp_path):
+    old = create_entry(tmp_path, "0", 10, 1000)
+    new = create_entry(tmp_path, "1", 10, 0)
+
+    removed = retention.Retention([str(tmp_path)], max_bytes=10000, max_age=500).evict()
+    assert removed == [old]
+    assert os.path.isdir(new)
+
+
+def test_keep_entries_in_use(tmp_path):
+    running = create_entry(tmp_path, "0", 3000, 300)
+    old = create_entry(tmp_path, "1", 3000, 200)
+
+    manager = retention.Retention([str(tmp_path)], max_bytes=1000, max_age=100)
+    with retention.use(running):
+        assert manager.evict() == [old]
+        assert os.path.isdir(running)
+    assert not retention.is_in_use(running)
+    assert manager.evict() == [running]
+
+
+def test_nested_folders(tmp_path):
+    batch = create_entry(tmp_path, "batch", 0, 0)
+    old = create_entry(tmp_path, "0", 3000, 300)
+    image = create_entry(batch, "image", 3000, 200)
+
+    manager = retention.Retention([str(tmp_path), batch], max_bytes=1000)
+    assert manager.evict() == [old, image]
+    assert os.path.isdir(batch)
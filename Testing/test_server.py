@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    from FloorplanToBlenderLib import *  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Server"))
+from api import post  # server
+from api import server  # server
+from api.get import Get  # server
+from file.result_cache import ResultCache  # server
+from process.scheduler import Scheduler  # server
+from shared_variables import shared_variables  # server
+
+repository = os.path.join(os.path.dirname(__file__), "..")
+
+
+class Shared:
+    """Server state used by start_transform, processes are never started"""
+
+    def __init__(self, path):
+        self.all_processes = []
+        self.processes = dict()
+        self.client_list = []
+        self.process_version = 0
+        self.process_changed = threading.Condition()
+        self.parentPath = str(path)
+        self.objectsPath = "objects"
+        self.scheduler = Scheduler(0, 10)
+        self.result_cache = ResultCache(str(path / "cache"))
+        os.makedirs(str(path / "objects"))
+        os.makedirs(str(path / "cache"))
+        self.pids = iter(range(1, 1000))
+
+    process_changed_since = shared_variables.process_changed_since
+    get_process_changes = shared_variables.get_process_changes
+    get_process = shared_variables.get_process
+    maxLongPollTimeout = 5
+
+    def pid_exist(self, pid):
+        return any(pid == process["pid"] for process in self.all_processes)
+
+    def pid_generator(self):
+        return next(self.pids)
+
+    def get_image_hash(self, id):
+        return hashlib.sha256(b"same image").hexdigest()
+
+    def reindex_files(self):
+        pass
+
+
+def test_start_transform_cache_hit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    door = repository + "/Images/Models/Doors/door.png"
+    monkeypatch.setattr(const, "DOOR_MODEL", door)
+    shared = Shared(tmp_path)
+
+    first, _ = post.start_transform(shared, "transform", "first", ".obj")
+    assert first.process["status"] == "Queued"
+    # first process created its object, see Create.execute
+    created = tmp_path / "objects" / "first.obj"
+    created.write_text("o Floorplan\n")
+    shared.result_cache.put(first.cache_key, str(created), "first", ".obj")
+
+    # same door model at another path, such as set_server_paths sets
+    os.makedirs(str(tmp_path / "Doors"))
+    shutil.copy(door, str(tmp_path / "Doors" / "door.png"))
+    monkeypatch.setattr(const, "DOOR_MODEL", str(tmp_path / "Doors" / "door.png"))
+
+    second, _ = post.start_transform(shared, "transform", "second", ".obj")
+    assert second.process["status"] == "Done"
+    assert second.cache_key == first.cache_key
+    assert shared.result_cache.hits == 1
+    assert (tmp_path / "objects" / "second.obj").read_text() == "o Floorplan\n"
+
+
+def test_query_parser_func_label(tmp_path):
+    handler = server.S.__new__(server.S)  # no request, only query parsing
+    handler.shared = Shared(tmp_path)
+    handler.client_address = ("127.0.0.1", 8000)
+
+    handler.query_parser({"func": "processes"}, Get)
+    assert handler.func == "processes"
+    # client chosen names don't become metrics labels
+    handler.query_parser({"func": "random-name-1"}, Get)
+    assert handler.func == "unknown"
+
+
+def test_subscribe_pid(tmp_path):
+    shared = Shared(tmp_path)
+    for pid in range(1, 4):
+        process = {"pid": pid, "status": "Queued", "version": pid}
+        shared.all_processes.append(process)
+        shared.processes[str(pid)] = process
+    shared.process_version = 3
+    get = Get(client={"address": "a", "port": "1"}, shared_variables=shared)
+
+    res = json.loads(get.subscribe(since="1", pid="2", timeout="0"))
+    assert [process["pid"] for process in res["processes"]] == [2]
+
+    def update():
+        with shared.process_changed:
+            shared.process_version += 1
+            shared.processes["3"]["version"] = shared.process_version
+            shared.process_changed.notify_all()
+
+    # changes of other processes don't end the wait
+    threading.Timer(0.05, update).start()
+    res = json.loads(get.subscribe(since="2", pid="2", timeout="0.3"))
+    assert res["processes"] == []
+    assert res["version"] == 4
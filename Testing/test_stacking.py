@@ -0,0 +1,36 @@
+import sys
+import pytest
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    from FloorplanToBlenderLib import *  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+
+def test_parse_argument():
+    assert stacking.parse_argument('"_"') is None
+    assert stacking.parse_argument('"x"') == "x"
+    assert stacking.parse_argument("[0,1,0]") == [0, 1, 0]
+    with pytest.raises(ValueError):
+        stacking.parse_argument("__import__('os')")
+
+
+def test_compile_stacking_file(tmp_path):
+    inner = tmp_path / "inner.txt"
+    inner.write_text('ADD "_" "image.png" 3 "x" [0,0,0] \n')
+    outer = tmp_path / "outer.txt"
+    outer.write_text(
+        "# comment\n\nCLEAR \nFILE " + '"' + str(inner) + '"' + " \nSEPARATE"
+    )
+    plan = stacking.compile_stacking_file(str(outer))
+    assert [command for command, _ in plan] == ["CLEAR", "FILE", "SEPARATE"]
+    assert plan[1][1][0] == [("ADD", [None, "image.png", 3, "x", [0, 0, 0]])]
+    assert len(stacking.plan_segments(plan)) == 2
+
+
+def test_compile_unknown_command(tmp_path):
+    path = tmp_path / "bad.txt"
+    path.write_text("REMOVE 1\n")
+    with pytest.raises(ValueError):
+        stacking.compile_stacking_file(str(path))
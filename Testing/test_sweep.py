@@ -0,0 +1,49 @@
+import sys
+
+import pytest
+
+try:
+    sys.path.insert(0, sys.path[0] + "/..")
+    from FloorplanToBlenderLib import *  # floorplan to blender lib
+except ImportError:
+    raise ImportError  # floorplan to blender lib
+
+
+def test_grid():
+    variants = sweep.grid(
+        {
+            "FIND_ROOMS_CORNERS_THRESHOLD": [0.005, 0.01],
+            "DETAILS_GAP_IN_WALL_THRESHOLD": [[10, 5000], [20, 5000], [40, 5000]],
+        }
+    )
+    assert len(variants) == 6
+    assert variants[0] == {
+        "FIND_ROOMS_CORNERS_THRESHOLD": 0.005,
+        "DETAILS_GAP_IN_WALL_THRESHOLD": [10, 5000],
+    }
+
+
+def test_grid_unknown_parameter():
+    with pytest.raises(ValueError):
+        sweep.grid({"NOT_A_THRESHOLD": [1, 2]})
+
+
+def test_table():
+    rows = [
+        {
+            "values": {"FIND_ROOMS_CORNERS_THRESHOLD": value},
+            "counts": {const.STR_WALLS: 10, const.STR_ROOMS: rooms},
+            "seconds": 1.5,
+            "timings": {},
+        }
+        for value, rooms in ((0.005, 4), (0.01, 12))
+    ]
+    lines = sweep.table(rows).splitlines()
+    assert len(lines) == 3
+    assert lines[0].split() == [
+        "FIND_ROOMS_CORNERS_THRESHOLD",
+        const.STR_WALLS,
+        const.STR_ROOMS,
+        "seconds",
+    ]
+    assert lines[2].split() == ["0.01", "10", "12", "1.50"]
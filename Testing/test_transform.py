@@ -46,3 +46,165 @@ def test_create_nx4_verts_and_faces():
 
 def test_create_verts():
     assert transform.create_verts([[[(2, 3)]], [[(1, 0)]]], 1, 2)
+
+
+def test_pack_boxes():
+    points, offsets = transform.pack_boxes([box, box[:2]])
+    assert points.shape == (6, 2)
+    assert list(offsets) == [0, 4, 6]
+
+
+def test_create_4xn_verts_and_faces_packed():
+    points, offsets = transform.pack_boxes([box, box[:2]])
+    verts, faces, feature_offsets = transform.create_4xn_verts_and_faces_packed(
+        points, offsets, ground=True
+    )
+    assert verts.dtype == np.float32 and faces.dtype == np.int32
+    assert verts.shape == (12, 3)
+    assert list(feature_offsets) == [0, 4, 8, 10, 12]
+    assert verts[4][2] == const.WALL_GROUND
+
+
+def test_create_nx4_verts_and_faces_packed():
+    points, offsets = transform.pack_boxes([box])
+    verts, faces = transform.create_nx4_verts_and_faces_packed(points, offsets)
+    assert verts.shape == (16, 3)
+    assert faces.shape == (4, 4)
+    # last wall links back to first point
+    assert np.isclose(verts[-1][0], box[0][0][0] / 100)
+
+
+def test_packed_matches_list_version():
+    verts, _, _ = transform.create_4xn_verts_and_faces([box], ground=True)
+    points, offsets = transform.pack_boxes([box])
+    packed, _, _ = transform.create_4xn_verts_and_faces_packed(
+        points, offsets, ground=True, dtype=np.float64
+    )
+    assert np.array_equal(np.array(verts).reshape(-1, 3), packed)
+
+
+def test_verts_to_poslist_large():
+    verts = [[[float(i), float(i), 1.0] for i in range(4)] for _ in range(5000)]
+    assert len(transform.verts_to_poslist(verts)) == 20000
+
+
+def test_simplify_box_merges_collinear():
+    # wall with nearly collinear points along its long sides
+    wall = np.array(
+        [[[0, 0]], [[50, 1]], [[100, 0]], [[100, 10]], [[50, 11]], [[0, 10]]],
+        dtype=np.int32,
+    )
+    assert len(transform.simplify_box(wall, 2)) == 4
+    assert transform.simplify_box(wall, 0) is wall
+
+
+def test_simplify_box_drops_degenerate_edges():
+    wall = np.array(
+        [[[0, 0]], [[0, 0]], [[100, 0]], [[100, 1]], [[100, 10]], [[0, 10]]],
+        dtype=np.int32,
+    )
+    simplified = transform.simplify_box(wall, 2).reshape(-1, 2)
+    edges = np.linalg.norm(simplified - np.roll(simplified, 1, axis=0), axis=1)
+    assert len(simplified) == 4
+    assert (edges >= 2).all()
+
+
+def test_simplify_boxes():
+    sliver = np.array([[[0, 0]], [[100, 0]], [[0, 1]]], dtype=np.int32)
+    boxes = transform.simplify_boxes([box, sliver], 2)
+    assert len(boxes) == 1
+    assert transform.simplify_boxes([box, sliver], 0) == [box, sliver]
+
+
+def test_lod_tolerance():
+    assert transform.lod_tolerance([0, 2, 6], 1) == 2
+    assert transform.lod_tolerance([0, 2, 6], 10) == 6
+
+
+def test_wall_graph_to_boxes():
+    nodes = [(0, 0), (50, 0), (100, 0), (50, 40)]
+    edges = [(0, 1), (1, 2), (1, 3)]
+    boxes = transform.wall_graph_to_boxes(nodes, edges, [10, 10, 6])
+    # straight chain of edges becomes one wall
+    assert len(boxes) == 2
+    assert np.allclose(boxes[0].reshape(-1, 2).min(axis=0), (-5, -5))
+    assert np.allclose(boxes[0].reshape(-1, 2).max(axis=0), (105, 5))
+
+
+def test_wall_graph_to_boxes_unordered():
+    nodes = [(0, 0), (50, 0), (100, 0), (50, 40), (150, 0)]
+    # straight run split in three, edges neither adjacent nor same direction
+    edges = [(2, 1), (1, 3), (0, 1), (2, 4)]
+    boxes = transform.wall_graph_to_boxes(nodes, edges, [10, 6, 10, 10])
+    assert len(boxes) == 2
+    points = np.concatenate([box.reshape(-1, 2) for box in boxes])
+    assert np.allclose(points.min(axis=0), (-5, -5))
+    assert np.allclose(points.max(axis=0), (155, 43))
+
+
+def test_wall_runs_to_graph():
+    nodes = [(0, 0), (50, 0), (100, 0), (50, 40)]
+    edges = [(0, 1), (1, 2), (1, 3)]
+    starts, ends, thickness = transform.wall_graph_runs(nodes, edges, [10, 10, 6])
+    graph = transform.wall_runs_to_graph(starts, ends, thickness, pixelscale=100)
+    # one edge per wall, T junction node shared by both walls
+    assert len(graph["edges"]) == 2
+    assert len(graph["nodes"]) == 4
+    assert np.allclose(graph["thickness"], [0.1, 0.06])
+    graph_nodes = np.array(graph["nodes"])
+    assert np.allclose(graph_nodes[np.array(graph["edges"])[:, 0]] * 100, starts)
+    assert np.allclose(graph_nodes[np.array(graph["edges"])[:, 1]] * 100, ends)
+
+
+def test_euler_to_quaternion():
+    x, y, z = np.radians([30, 45, 60])
+    cx, cy, cz = np.cos([x, y, z])
+    sx, sy, sz = np.sin([x, y, z])
+    rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    qx, qy, qz, qw = transform.euler_to_quaternion([x, y, z])
+    # rotation matrix of quaternion
+    matrix = np.array(
+        [
+            [
+                1 - 2 * (qy * qy + qz * qz),
+                2 * (qx * qy - qz * qw),
+                2 * (qx * qz + qy * qw),
+            ],
+            [
+                2 * (qx * qy + qz * qw),
+                1 - 2 * (qx * qx + qz * qz),
+                2 * (qy * qz - qx * qw),
+            ],
+            [
+                2 * (qx * qz - qy * qw),
+                2 * (qy * qz + qx * qw),
+                1 - 2 * (qx * qx + qy * qy),
+            ],
+        ]
+    )
+    assert np.allclose(matrix, rz @ ry @ rx)
+
+
+def test_triangulate_concave():
+    verts = np.array(
+        [[0, 0, 0], [2, 0, 0], [2, 1, 0], [1, 1, 0], [1, 2, 0], [0, 2, 0]], dtype=float
+    )
+    for face in (list(range(6)), list(range(5, -1, -1))):
+        triangles = transform.triangulate(verts, face)
+        assert len(triangles) == 4
+        normals = [
+            np.cross(verts[b] - verts[a], verts[c] - verts[a]) for a, b, c in triangles
+        ]
+        # triangles cover the L shape, no triangle over the missing corner
+        area = np.cross(verts[face], np.roll(verts[face], -1, axis=0)).sum(axis=0)
+        assert np.allclose(sum(normals), area)
+        assert all(np.dot(normal, area) > 0 for normal in normals)
+
+
+def test_triangulate_vertical():
+    # wall side faces stand in the xz or yz plane
+    verts = np.array([[0, 0, 0], [0, 3, 0], [0, 3, 1], [0, 0, 1]], dtype=float)
+    assert len(transform.triangulate(verts, [0, 1, 2, 3])) == 2
+    assert transform.triangulate(verts, [0, 1]) == []
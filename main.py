@@ -1,13 +1,18 @@
-from subprocess import check_output
 from FloorplanToBlenderLib import (
     IO,
+    batch,
     config,
+    daemon,
     const,
     execution,
     dialog,
     floorplan,
+    retention,
     stacking,
+    sweep,
 )  # floorplan to blender lib
+import argparse
+import ast
 import os
 
 """
@@ -26,51 +31,177 @@ def create_blender_project(data_paths):
 
     target_base = target_folder + const.TARGET_NAME
     target_path = target_base + const.BASE_FORMAT
-    target_path = (
-        IO.get_next_target_base_name(target_base, target_path) + const.BASE_FORMAT
+    target_base = IO.get_next_target_base_name(target_base, target_path)
+
+    outformat = config.get(
+        const.SYSTEM_CONFIG_FILE_NAME, "SYSTEM", const.STR_OUT_FORMAT
+    ).replace('"', "")
+
+    # Create blender project, and transform .blend project to another format!
+    created = batch.create_blender_project(
+        blender_install_path,
+        program_path,
+        data_paths,
+        target_base,
+        outformat,
+        blender_script_path,
     )
+    if outformat != ".blend":
+        print("Object created at:" + program_path + created)
+
+    if not IO.exports_directly(data_paths, outformat):
+        print("Project created at: " + program_path + target_base + const.BASE_FORMAT)
 
-    # Create blender project
-    check_output(
-        [
-            blender_install_path,
-            "-noaudio",  # this is a dockerfile ubuntu hax fix
-            "--background",
-            "--python",
-            blender_script_path,
-            program_path,  # Send this as parameter to script
-            target_path,
-        ]
-        + data_paths
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Create 3d models from floorplans. "
+        + "Without images the program runs interactively."
+    )
+    parser.add_argument(
+        "images", nargs="*", help="image files, folders or glob patterns to convert"
+    )
+    parser.add_argument(
+        "--config",
+        default=const.IMAGE_DEFAULT_CONFIG_FILE_NAME,
+        help="floorplan config used for all images",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="detection processes, defaults to one per cpu",
+    )
+    parser.add_argument(
+        "--blender-workers",
+        type=int,
+        default=1,
+        help="blender processes running at once",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=const.BATCH_MANIFEST,
+        help="status of each image, an existing manifest is resumed",
     )
+    parser.add_argument("--blender", default=None, help="blender installation path")
+    parser.add_argument(
+        "--no-blender", action="store_true", help="only generate data files"
+    )
+    parser.add_argument(
+        "--inbox",
+        default=None,
+        help="run as daemon converting images dropped in this folder",
+    )
+    parser.add_argument(
+        "--outbox",
+        default=const.DAEMON_OUTBOX,
+        help="folder daemon writes one result folder per image to",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="daemon stops when inbox is empty"
+    )
+    parser.add_argument(
+        "--sweep",
+        action="append",
+        default=None,
+        metavar="NAME=VALUES",
+        help="sweep const threshold over a list of values instead of converting, "
+        + "such as FIND_ROOMS_CORNERS_THRESHOLD=[0.005,0.01], repeat for a grid",
+    )
+    return parser.parse_args()
 
-    outformat = config.get(
+
+def blender_path(args):
+    """
+    Blender used by batch and daemon, None if only data should be generated
+    """
+    if args.no_blender:
+        return None
+    if args.blender is not None:
+        return args.blender
+    return IO.blender_installed() or blender_install_path
+
+
+def out_format():
+    return config.get(
         const.SYSTEM_CONFIG_FILE_NAME, "SYSTEM", const.STR_OUT_FORMAT
     ).replace('"', "")
-    # Transform .blend project to another format!
-    if outformat != ".blend":
-        check_output(
-            [
-                blender_install_path,
-                "-noaudio",  # this is a dockerfile ubuntu hax fix
-                "--background",
-                "--python",
-                "./Blender/blender_export_any.py",
-                "." + target_path,
-                outformat,
-                target_base + outformat,
-            ]
+
+
+def run_daemon(args):
+    """
+    Convert images dropped in inbox until interrupted, see FloorplanToBlenderLib/daemon.py
+    """
+    worker = daemon.Daemon(
+        args.inbox,
+        args.outbox,
+        config_path=args.config,
+        blender_install_path=blender_path(args),
+        program_path=program_path,
+        outformat=out_format(),
+    )
+    print("Watching", args.inbox, "writing results to", args.outbox)
+    try:
+        worker.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+    print("Daemon stopped, processed", worker.processed, "images")
+
+
+def parse_sweep(entries):
+    """
+    Parse --sweep arguments
+    @Return dict of const name -> list of values
+    """
+    parameters = dict()
+    for entry in entries:
+        name, _, values = entry.partition("=")
+        values = ast.literal_eval(values)
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        parameters[name.strip()] = list(values)
+    return parameters
+
+
+def run_sweep(args):
+    """
+    Print detected features of each threshold combination, see FloorplanToBlenderLib/sweep.py
+    """
+    parameters = parse_sweep(args.sweep)
+    for image in batch.find_images(args.images):
+        print("Sweeping", image)
+        rows = sweep.run(
+            image, parameters, config_path=args.config, workers=args.workers
         )
-        print("Object created at:" + program_path + target_base + outformat)
+        print(sweep.table(rows))
 
-    print("Project created at: " + program_path + target_path)
+
+def run_batch(args):
+    """
+    Convert images without interaction, see FloorplanToBlenderLib/batch.py
+    """
+    images = batch.find_images(args.images)
+    print("Converting", len(images), "images, manifest", args.manifest)
+
+    manifest = batch.run(
+        images,
+        config_path=args.config,
+        manifest_path=args.manifest,
+        workers=args.workers,
+        blender_workers=args.blender_workers,
+        blender_install_path=blender_path(args),
+        program_path=program_path,
+        outformat=out_format(),
+    )
+    print("Batch finished :", manifest.summary())
+    return manifest
 
 
 if __name__ == "__main__":
     """
     Do not change variables in this file but rather in ./config.ini or ./FloorplanToBlenderLib/const.py
     """
-    dialog.figlet()
+    args = parse_args()
     image_path = ""
     blender_install_path = ""
     data_folder = const.BASE_PATH
@@ -80,6 +211,20 @@ if __name__ == "__main__":
     image_paths = []
     program_path = os.path.dirname(os.path.realpath(__file__))
     blender_script_path = const.BLENDER_SCRIPT_PATH
+
+    if args.inbox is not None:
+        run_daemon(args)
+        exit(0)
+
+    if args.sweep:
+        run_sweep(args)
+        exit(0)
+
+    if args.images:
+        run_batch(args)
+        exit(0)
+
+    dialog.figlet()
     dialog.init()
     data_paths = list()
 
@@ -128,7 +273,7 @@ if __name__ == "__main__":
 
         if var:
             config_path = var
-            floorplans.append(
+            floorplans.extend(
                 floorplan.new_floorplan(c) for c in config_path.split(" ")
             )
 
@@ -166,9 +311,12 @@ if __name__ == "__main__":
 
         if not var or var.lower() == "yes" or var.lower() == "y":
             IO.clean_data_folder(data_folder)
+        else:
+            # Keep size of data of earlier runs bounded
+            retention.Retention([data_folder, const.BATCH_DATA_PATH]).evict()
 
         if len(floorplans) > 1:
-            data_paths.append(execution.simple_single(f) for f in floorplans)
+            data_paths = [execution.simple_single(f) for f in floorplans]
         else:
             data_paths = [execution.simple_single(floorplans[0])]
 